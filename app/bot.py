@@ -1,9 +1,35 @@
 """Фабрики Bot та Dispatcher + реєстрація роутерів."""
-from aiogram import Bot, Dispatcher
+import time
 
-from . import settings
+from aiogram import BaseMiddleware, Bot, Dispatcher
+
+from . import metrics, settings
 from .handlers import commands, media, text
 
+_HANDLER_SECONDS = metrics.histogram(
+    "bot_handler_seconds", "Час обробки повідомлення хендлером", ("router",)
+)
+_HANDLER_ERRORS = metrics.counter(
+    "bot_handler_errors_total", "Винятки з хендлерів", ("router",)
+)
+
+
+class _HandlerMetrics(BaseMiddleware):
+    """Латентність і помилки хендлерів роутера (лише коли фільтр спрацював)."""
+
+    def __init__(self, router: str) -> None:
+        self.router = router
+
+    async def __call__(self, handler, event, data):
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            _HANDLER_ERRORS.inc(router=self.router)
+            raise
+        finally:
+            _HANDLER_SECONDS.observe(time.perf_counter() - started, router=self.router)
+
 
 def create_bot() -> Bot:
     return Bot(token=settings.TOKEN)
@@ -12,7 +38,7 @@ def create_bot() -> Bot:
 def create_dispatcher() -> Dispatcher:
     dp = Dispatcher()
     # порядок важливий: команди -> текстові ТТН -> фото
-    dp.include_router(commands.router)
-    dp.include_router(text.router)
-    dp.include_router(media.router)
+    for name, module in (("commands", commands), ("text", text), ("media", media)):
+        module.router.message.middleware(_HandlerMetrics(name))
+        dp.include_router(module.router)
     return dp
@@ -0,0 +1,183 @@
+"""Окремі пули за класом навантаження замість одного дефолтного to_thread-пулу.
+
+Раніше все блокуюче йшло через asyncio.to_thread — один пул на всіх, і
+повільний диск чи зависла мережа забирали потоки в пошуку ТТН. Тепер:
+  - disk — локальний кеш (SQLite/CSV, файл різниці);
+  - net  — блокуюча мережа; він же дефолтний executor циклу (getaddrinfo
+           в aiohttp, сторонні to_thread), тож із диском потоків не ділить;
+  - cpu  — пул процесів декодування штрих-кодів (BarcodeDecoder).
+Розміри незалежні: EXECUTOR_DISK_WORKERS, EXECUTOR_NET_WORKERS, DECODE_WORKERS.
+
+Кожен пул віддає в /metrics зайняті воркери, глибину черги та час
+очікування/виконання задач. configure() викликається на старті (main);
+без нього пул створюється ліниво з розміром із settings.
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+
+from . import metrics, settings
+
+log = logging.getLogger(__name__)
+
+DISK = "disk"
+NET = "net"
+CPU = "cpu"
+
+_WAIT_SECONDS = metrics.histogram("executor_wait_seconds", "Очікування задачі в черзі пулу", ("pool",))
+_RUN_SECONDS = metrics.histogram("executor_run_seconds", "Виконання задачі в пулі", ("pool",))
+
+
+class _ThreadPool(ThreadPoolExecutor):
+    """ThreadPoolExecutor, що міряє кожну задачу — і наші, і loop.run_in_executor."""
+
+    def __init__(self, pool: "Pool") -> None:
+        super().__init__(max_workers=pool.workers, thread_name_prefix=f"{pool.name}-pool")
+        self._pool = pool
+
+    def submit(self, fn, /, *args, **kwargs) -> Future:
+        name = self._pool.name
+        submitted = time.perf_counter()
+
+        def call():
+            started = time.perf_counter()
+            _WAIT_SECONDS.observe(started - submitted, pool=name)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                _RUN_SECONDS.observe(time.perf_counter() - started, pool=name)
+
+        return self._pool.track(lambda: super(_ThreadPool, self).submit(call))
+
+
+class Pool:
+    def __init__(self, name: str, workers: int, processes: bool = False) -> None:
+        self.name = name
+        self.workers = max(1, workers)
+        self.processes = processes
+        self._executor: ThreadPoolExecutor | ProcessPoolExecutor | None = None
+        self._inflight = 0
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self) -> ThreadPoolExecutor | ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                if self.processes:
+                    # spawn: дочірні процеси не успадковують event loop і потоки бота
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                    )
+                else:
+                    self._executor = _ThreadPool(self)
+                log.info("Executor %r started: %d %s.", self.name, self.workers,
+                         "processes" if self.processes else "threads")
+            return self._executor
+
+    @property
+    def inflight(self) -> int:
+        return self._inflight
+
+    def track(self, submit) -> Future:
+        """submit() -> Future; рахує задачу в роботі/в черзі до її завершення."""
+        with self._lock:
+            self._inflight += 1
+        try:
+            cf = submit()
+        except BaseException:
+            self._leave()
+            raise
+        cf.add_done_callback(lambda _: self._leave())
+        return cf
+
+    def _leave(self) -> None:
+        with self._lock:
+            self._inflight -= 1
+
+    def submit(self, fn, *args) -> Future:
+        executor = self.executor
+        if isinstance(executor, _ThreadPool):
+            return executor.submit(fn, *args)
+        return self.track(lambda: executor.submit(fn, *args))
+
+    def observe(self, wait: float, run: float) -> None:
+        """Час задачі пулу процесів (виміряний самим воркером — обгортку туди не передати)."""
+        _WAIT_SECONDS.observe(max(0.0, wait), pool=self.name)
+        _RUN_SECONDS.observe(max(0.0, run), pool=self.name)
+
+    def reset(self) -> None:
+        """Відкинути зламаний пул (BrokenProcessPool); наступний submit створить новий."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self, wait: bool = False) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=not wait)
+
+
+_POOLS: dict[str, Pool] = {}
+_POOLS_LOCK = threading.Lock()
+
+
+def _default_workers(name: str) -> int:
+    if name == DISK:
+        return settings.EXECUTOR_DISK_WORKERS
+    if name == NET:
+        return settings.EXECUTOR_NET_WORKERS
+    return settings.DECODE_WORKERS or os.cpu_count() or 1
+
+
+def configure(disk: int | None = None, net: int | None = None, cpu: int | None = None) -> None:
+    """Створити пули (розмір None -> із settings); у циклі — net стає дефолтним executor-ом."""
+    sizes = {DISK: disk, NET: net, CPU: cpu}
+    with _POOLS_LOCK:
+        old = list(_POOLS.values())
+        for name, workers in sizes.items():
+            _POOLS[name] = Pool(name, workers or _default_workers(name), processes=name == CPU)
+    for pool in old:
+        pool.shutdown()
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return
+    loop.set_default_executor(_POOLS[NET].executor)
+
+
+def get(name: str) -> Pool:
+    with _POOLS_LOCK:
+        pool = _POOLS.get(name)
+        if pool is None:
+            pool = _POOLS[name] = Pool(name, _default_workers(name), processes=name == CPU)
+        return pool
+
+
+async def run(name: str, fn, *args):
+    """Блокуючий виклик у пулі name (аналог asyncio.to_thread)."""
+    return await asyncio.wrap_future(get(name).submit(fn, *args))
+
+
+def shutdown() -> None:
+    """Зупинка: disk дописує розпочате, решта скасовує чергу."""
+    with _POOLS_LOCK:
+        pools = list(_POOLS.values())
+    for pool in pools:
+        pool.shutdown(wait=pool.name == DISK)
+
+
+def _pool_stat(fn):
+    return lambda: {name: fn(pool) for name, pool in list(_POOLS.items())}
+
+
+metrics.callback("executor_workers", "Розмір пулу", _pool_stat(lambda p: p.workers), ("pool",))
+metrics.callback("executor_busy", "Зайняті воркери пулу",
+                 _pool_stat(lambda p: min(p.inflight, p.workers)), ("pool",))
+metrics.callback("executor_queue_depth", "Задачі, що чекають вільного воркера",
+                 _pool_stat(lambda p: max(0, p.inflight - p.workers)), ("pool",))
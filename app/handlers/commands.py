@@ -1,6 +1,7 @@
-"""Команди бота: /start /Office /Cklad /subscribe /unsubscribe /help.
+"""Команди бота: /start /Office /Cklad /subscribe /unsubscribe /help (+ /status для адмінів).
 
-Тексти й поведінка збережені 1-в-1 із попередньою версією.
+Тексти й поведінка збережені 1-в-1 із попередньою версією; відповіді йдуть
+через OutboundDispatcher (ліміти Telegram і пріоритет інтерактивних).
 """
 import re
 
@@ -8,10 +9,15 @@ from aiogram import Router
 from aiogram.filters import Command, CommandStart
 from aiogram.types import Message
 
+from .. import executors
+from ..services.outbound import OutboundDispatcher
+from ..storage.sheets import Sheets
 from ..storage.users import UserRepository
 
 router = Router()
 
+_BREAKER_STATES = {"closed": "✅ доступна", "half_open": "🟡 перевіряється", "open": "❌ недоступна"}
+
 _SUBSCRIBE_INFO = (
     "\n\nВи можете підписатися на щоденний звіт, ввівши команду /subscribe <час> "
     "(наприклад, /subscribe 22:00). Якщо час не вказано – за замовчуванням 22:00. "
@@ -20,11 +26,12 @@ _SUBSCRIBE_INFO = (
 
 
 @router.message(CommandStart())
-async def cmd_start(message: Message, users: UserRepository) -> None:
+async def cmd_start(message: Message, users: UserRepository, outbound: OutboundDispatcher) -> None:
     chat_id = str(message.chat.id)
     user = users.get(chat_id)
     if user.role:
-        await message.answer(
+        await outbound.send_message(
+            chat_id,
             f"👋 Вітаю! Ваша роль: *{user.role}*.\n\n"
             "Ви можете змінити роль за допомогою:\n"
             "/Office - Офіс 📑\n"
@@ -32,7 +39,8 @@ async def cmd_start(message: Message, users: UserRepository) -> None:
             parse_mode="Markdown",
         )
     else:
-        await message.answer(
+        await outbound.send_message(
+            chat_id,
             "Цей бот спрощує роботу з ТТН.\n\n"
             "Оберіть роль:\n"
             "/Office - Офіс 📑\n"
@@ -42,31 +50,33 @@ async def cmd_start(message: Message, users: UserRepository) -> None:
 
 
 @router.message(Command("Office"))
-async def cmd_office(message: Message, users: UserRepository) -> None:
+async def cmd_office(message: Message, users: UserRepository, outbound: OutboundDispatcher) -> None:
     chat_id = str(message.chat.id)
     user = users.get(chat_id)
     username = user.username or (message.from_user.username or "")
     await users.update(chat_id, "Офіс", username, user.time, user.last_sent)
-    await message.answer(
+    await outbound.send_message(
+        chat_id,
         "✅ Ви обрали роль: *Офіс*.\n\nНадсилайте TTН (код або фото) для перевірки.",
         parse_mode="Markdown",
     )
 
 
 @router.message(Command("Cklad"))
-async def cmd_cklad(message: Message, users: UserRepository) -> None:
+async def cmd_cklad(message: Message, users: UserRepository, outbound: OutboundDispatcher) -> None:
     chat_id = str(message.chat.id)
     user = users.get(chat_id)
     username = user.username or (message.from_user.username or "")
     await users.update(chat_id, "Склад", username, user.time, user.last_sent)
-    await message.answer(
+    await outbound.send_message(
+        chat_id,
         "✅ Ви обрали роль: *Склад*.\n\nНадсилайте TTН (код або фото), вони збережуться в буфер.",
         parse_mode="Markdown",
     )
 
 
 @router.message(Command("subscribe"))
-async def cmd_subscribe(message: Message, users: UserRepository) -> None:
+async def cmd_subscribe(message: Message, users: UserRepository, outbound: OutboundDispatcher) -> None:
     chat_id = str(message.chat.id)
     args = (message.text or "").split()
     sub_time = "22:00"
@@ -76,7 +86,8 @@ async def cmd_subscribe(message: Message, users: UserRepository) -> None:
             hour, minute = candidate.split(":")
             sub_time = f"{hour.zfill(2)}:{minute}"
         else:
-            await message.answer(
+            await outbound.send_message(
+                chat_id,
                 "Невірний формат часу. Використовуйте формат HH:MM, наприклад, 22:00."
             )
             return
@@ -84,23 +95,25 @@ async def cmd_subscribe(message: Message, users: UserRepository) -> None:
     role = user.role or "Офіс"
     username = user.username or (message.from_user.username or "")
     await users.update(chat_id, role, username, sub_time, user.last_sent)
-    await message.answer(f"Ви успішно підписалися на звіт о {sub_time}.")
+    await outbound.send_message(chat_id, f"Ви успішно підписалися на звіт о {sub_time}.")
 
 
 @router.message(Command("unsubscribe"))
-async def cmd_unsubscribe(message: Message, users: UserRepository) -> None:
+async def cmd_unsubscribe(message: Message, users: UserRepository, outbound: OutboundDispatcher) -> None:
     chat_id = str(message.chat.id)
     user = users.get(chat_id)
     if not user.role:
-        await message.answer("Спочатку встановіть роль за допомогою /start")
+        await outbound.send_message(chat_id, "Спочатку встановіть роль за допомогою /start")
         return
     await users.update(chat_id, user.role, user.username, "", user.last_sent)
-    await message.answer("Ви успішно відписалися від звітів.")
+    await outbound.send_message(chat_id, "Ви успішно відписалися від звітів.")
 
 
 @router.message(Command("help"))
-async def cmd_help(message: Message) -> None:
-    await message.answer(
+async def cmd_help(message: Message, outbound: OutboundDispatcher) -> None:
+    chat_id = str(message.chat.id)
+    await outbound.send_message(
+        chat_id,
         "Доступні команди:\n\n"
         "/start - Початкове налаштування бота та вибір ролі.\n"
         "/Office - Встановити роль 'Офіс'.\n"
@@ -115,3 +128,26 @@ async def cmd_help(message: Message) -> None:
         "додаткові записи пушаться до Google таблиці.\n"
         "• Щоденний звіт надсилається користувачам, які підписані, з підрахунком TTН за день."
     )
+
+
+@router.message(Command("status"))
+async def cmd_status(
+    message: Message, users: UserRepository, sheets: Sheets, outbound: OutboundDispatcher
+) -> None:
+    """Стан інтеграцій для адмінів: Google Sheets і черги відкладених записів."""
+    chat_id = str(message.chat.id)
+    if not users.get(chat_id).admin:
+        return
+    breaker = sheets.breaker.snapshot()
+    pending_rows = await executors.run(executors.DISK, sheets.pending_push_rows)
+    lines = [f"Google Sheets: {_BREAKER_STATES[breaker['state']]}"]
+    if breaker["state"] != "closed":
+        lines.append(f"Наступна спроба через: {breaker['retry_in']} с")
+    if breaker["last_error"]:
+        lines.append(f"Остання помилка: {breaker['last_error']}")
+    lines += [
+        f"ТТН, що чекають пушу: {'невідомо' if pending_rows is None else pending_rows}",
+        f"Користувачів, що чекають запису: {users.pending_count}",
+        f"Повідомлень у черзі відправки: {outbound.stats()['queue_depth']}",
+    ]
+    await outbound.send_message(chat_id, "\n".join(lines))
@@ -1,20 +1,53 @@
-"""Обробник фото зі штрих-кодами ТТН."""
+"""Обробник фото зі штрих-кодами ТТН.
+
+Прогресивне завантаження: Telegram віддає кілька PhotoSize одного фото.
+Спершу качаємо й декодуємо середній (PHOTO_PROGRESSIVE_MIN_SIDE), і лише
+якщо ТТН не знайдено — повнорозмірний. progressive_stats рахує, як часто
+доводиться ескалювати.
+
+Альбоми (media_group_id): aiogram шле кожне фото окремим апдейтом. Збираємо
+їх, поки йдуть (MEDIA_GROUP_WAIT_SECONDS тиші), далі декодуємо паралельно,
+дедуплікуємо ТТН на весь альбом, віддаємо їх у TTNService одним пакетом і
+відповідаємо одним підсумком.
+"""
 import asyncio
 import logging
 import os
+import time
 from datetime import datetime
 
 from aiogram import F, Router
-from aiogram.types import Message
+from aiogram.types import Message, PhotoSize
 
-from .. import settings
-from ..services.barcode import decode_barcodes
+from .. import metrics, settings
+from ..cache import TTLCache
+from ..services.barcode import BarcodeDecoder, DecoderBusy, DecodeTimeout
+from ..services.outbound import OutboundDispatcher
 from ..services.ttn import TTNService, extract_ttn
 from ..storage.users import AdminNotifier, UserRepository
 
 router = Router()
 log = logging.getLogger(__name__)
 
+# лічильники шляху фото: кеш / вистачило середнього / ескалація / одразу повний
+progressive_stats = {"cache_hit": 0, "preview_ok": 0, "escalated": 0, "full_only": 0, "bytes": 0}
+
+# media_group_id -> (повідомлення альбому, час останнього)
+_albums: dict[str, tuple[list[Message], float]] = {}
+_warned_albums = TTLCache(256, 60)
+# задачі збору альбомів: посилання, щоб GC не прибрав їх посеред очікування
+_album_tasks: set[asyncio.Task] = set()
+
+_DOWNLOAD_SECONDS = metrics.histogram(
+    "photo_download_seconds", "Час завантаження фото з Telegram", ("size",)
+)
+_DOWNLOAD_BYTES = metrics.histogram(
+    "photo_download_bytes", "Розмір завантаженого фото", ("size",), metrics.BYTES_BUCKETS
+)
+metrics.callback("photo_path_total", "Шлях фото: кеш / середній / ескалація / одразу повний",
+                 lambda: {k: v for k, v in progressive_stats.items() if k != "bytes"}, ("path",),
+                 kind="counter")
+
 
 def _maybe_save_debug(image_bytes: bytes) -> None:
     if not settings.DEBUG_SAVE_IMAGES:
@@ -32,32 +65,97 @@ def _maybe_save_debug(image_bytes: bytes) -> None:
         log.warning("DEBUG save failed: %s", e)
 
 
+def _pick_preview(sizes: list[PhotoSize]) -> PhotoSize | None:
+    """Найменший розмір, достатній для декодування; None — якщо це і є найбільший."""
+    for size in sizes[:-1]:  # Telegram віддає розміри за зростанням
+        if max(size.width, size.height) >= settings.PHOTO_PROGRESSIVE_MIN_SIDE:
+            return size
+    return None
+
+
+async def _download_and_decode(message: Message, size: PhotoSize, decoder: BarcodeDecoder,
+                               kind: str) -> list[str]:
+    started = time.perf_counter()
+    buffer = await message.bot.download(size)
+    image_bytes = buffer.read()
+    _DOWNLOAD_SECONDS.observe(time.perf_counter() - started, size=kind)
+    _DOWNLOAD_BYTES.observe(len(image_bytes), size=kind)
+    progressive_stats["bytes"] += len(image_bytes)
+    _maybe_save_debug(image_bytes)
+    return await decoder.decode(image_bytes)
+
+
+async def _decode_photo(message: Message, decoder: BarcodeDecoder) -> list[str]:
+    """Коди з фото: кеш за file_unique_id -> середній розмір -> повний."""
+    full = message.photo[-1]
+    barcodes = decoder.cached(full.file_unique_id)
+    if barcodes is not None:
+        progressive_stats["cache_hit"] += 1
+        log.info("Decode cache hit for photo %s", full.file_unique_id)
+        return barcodes
+
+    preview = _pick_preview(message.photo) if settings.PHOTO_PROGRESSIVE else None
+    if preview is not None:
+        barcodes = await _download_and_decode(message, preview, decoder, "preview")
+        if any(extract_ttn(raw) for raw in barcodes):
+            progressive_stats["preview_ok"] += 1
+            decoder.remember(full.file_unique_id, barcodes)
+            return barcodes
+        progressive_stats["escalated"] += 1
+        log.info("No TTN at %dx%d, escalating to full size.", preview.width, preview.height)
+    else:
+        progressive_stats["full_only"] += 1
+
+    barcodes = await _download_and_decode(message, full, decoder, "full")
+    decoder.remember(full.file_unique_id, barcodes)
+    return barcodes
+
+
 @router.message(F.photo)
 async def handle_barcode_image(
     message: Message,
     users: UserRepository,
     ttn: TTNService,
     notifier: AdminNotifier,
+    decoder: BarcodeDecoder,
+    outbound: OutboundDispatcher,
 ) -> None:
     chat_id = str(message.chat.id)
     user = users.get(chat_id)
     if not user.role:
-        await message.answer("Спочатку встановіть роль за допомогою /start")
+        # на альбом без ролі — одна відповідь, а не по одній на кожне фото
+        if message.media_group_id is None or _warned_albums.get(message.media_group_id) is None:
+            if message.media_group_id is not None:
+                _warned_albums.set(message.media_group_id, True)
+            await outbound.send_message(chat_id, "Спочатку встановіть роль за допомогою /start")
+        return
+
+    if message.media_group_id is not None:
+        _collect_album(message, users, ttn, notifier, decoder, outbound)
         return
 
     try:
-        buffer = await message.bot.download(message.photo[-1])
-        image_bytes = buffer.read()
-        _maybe_save_debug(image_bytes)
-        barcodes = await asyncio.to_thread(decode_barcodes, image_bytes)
+        barcodes = await _decode_photo(message, decoder)
+    except DecoderBusy:
+        await outbound.send_message(
+            chat_id,
+            "⏳ Зараз розпізнається багато фото. Надішліть це фото ще раз за хвилину."
+        )
+        return
+    except DecodeTimeout:
+        await outbound.send_message(
+            chat_id, "❌ Не вдалося розпізнати штрих-коди за відведений час, спробуйте ще раз!"
+        )
+        log.warning("Barcode decode timed out for chat %s", chat_id)
+        return
     except Exception as e:
-        await message.answer("❌ Помилка обробки зображення, спробуйте ще раз!")
+        await outbound.send_message(chat_id, "❌ Помилка обробки зображення, спробуйте ще раз!")
         log.exception("Error in handle_barcode_image for chat %s: %s", chat_id, e)
         await notifier.notify(f"Error in handle_barcode_image for chat {chat_id}: {e}")
         return
 
     if not barcodes:
-        await message.answer("❌ Не вдалося розпізнати штрих-коди!")
+        await outbound.send_message(chat_id, "❌ Не вдалося розпізнати штрих-коди!")
         return
 
     success_count = 0
@@ -74,6 +172,86 @@ async def handle_barcode_image(
             error_count += 1
             log.warning("Помилка обробки штрих-коду %r: %s", raw, e)
 
-    await message.answer(
+    await outbound.send_message(
+        chat_id,
         f"Оброблено штрих-кодів: успішно: {success_count}, з помилками: {error_count}"
     )
+
+
+# ── альбоми ──
+def _collect_album(message: Message, *deps) -> None:
+    group_id = message.media_group_id
+    messages, _ = _albums.get(group_id, ([], 0.0))
+    if not messages:
+        task = asyncio.create_task(_process_album(group_id, *deps))
+        _album_tasks.add(task)
+        task.add_done_callback(_album_done)
+    messages.append(message)
+    _albums[group_id] = (messages, time.monotonic())
+
+
+def _album_done(task: asyncio.Task) -> None:
+    _album_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        log.error("Album processing failed", exc_info=task.exception())
+
+
+async def _process_album(
+    group_id: str,
+    users: UserRepository,
+    ttn: TTNService,
+    notifier: AdminNotifier,
+    decoder: BarcodeDecoder,
+    outbound: OutboundDispatcher,
+) -> None:
+    # чекаємо, доки Telegram дошле всі частини (тиша MEDIA_GROUP_WAIT_SECONDS)
+    while True:
+        _, last_seen = _albums[group_id]
+        delay = last_seen + settings.MEDIA_GROUP_WAIT_SECONDS - time.monotonic()
+        if delay <= 0:
+            break
+        await asyncio.sleep(delay)
+    messages, _ = _albums.pop(group_id)
+    first = messages[0]
+    chat_id = str(first.chat.id)
+    user = users.get(chat_id)
+
+    results = await asyncio.gather(
+        *(_decode_photo(m, decoder) for m in messages), return_exceptions=True
+    )
+    ttns: dict[str, None] = {}  # порядок + дедуплікація на весь альбом
+    failed = busy = 0
+    for result in results:
+        if isinstance(result, DecoderBusy):
+            busy += 1
+        elif isinstance(result, BaseException):
+            failed += 1
+            log.warning("Album %s: photo processing failed: %s", group_id, result)
+        else:
+            for raw in result:
+                ttn_num = extract_ttn(raw)
+                if ttn_num is None:
+                    log.info("Відсіяно штрих-код (не схожий на ТТН): %r", raw)
+                    continue
+                ttns.setdefault(ttn_num, None)
+
+    error_count = 0
+    if ttns:
+        try:
+            await ttn.handle_ttns(chat_id, list(ttns), user.username, user.role)
+        except Exception as e:
+            error_count = len(ttns)
+            log.exception("Album %s: batch TTN handling failed: %s", group_id, e)
+            await notifier.notify(f"Album batch handling failed for chat {chat_id}: {e}")
+
+    summary = (
+        f"Альбом: {len(messages)} фото. Оброблено штрих-кодів: "
+        f"успішно: {len(ttns) - error_count}, з помилками: {error_count}"
+    )
+    if failed:
+        summary += f"\nНе вдалося обробити фото: {failed}"
+    if busy:
+        summary += f"\n⏳ Не встигли розпізнати (сервер зайнятий), надішліть ще раз: {busy}"
+    if not ttns and not failed and not busy:
+        summary = "❌ Не вдалося розпізнати штрих-коди!"
+    await outbound.send_message(chat_id, summary)
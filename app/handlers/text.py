@@ -2,6 +2,7 @@
 from aiogram import F, Router
 from aiogram.types import Message
 
+from ..services.outbound import OutboundDispatcher
 from ..services.ttn import TTNService, extract_ttn
 from ..storage.users import UserRepository
 
@@ -9,7 +10,9 @@ router = Router()
 
 
 @router.message(F.text)
-async def handle_text_message(message: Message, users: UserRepository, ttn: TTNService) -> None:
+async def handle_text_message(
+    message: Message, users: UserRepository, ttn: TTNService, outbound: OutboundDispatcher
+) -> None:
     text = message.text or ""
     if text.startswith("/"):
         return
@@ -19,6 +22,6 @@ async def handle_text_message(message: Message, users: UserRepository, ttn: TTNS
     chat_id = str(message.chat.id)
     user = users.get(chat_id)
     if not user.role:
-        await message.answer("Спочатку встановіть роль за допомогою /start")
+        await outbound.send_message(chat_id, "Спочатку встановіть роль за допомогою /start")
         return
     await ttn.handle_ttn(chat_id, ttn_num, user.username, user.role)
@@ -1,16 +1,31 @@
-"""Entrypoint: ініціалізація залежностей, старт web + scheduler + polling."""
+"""Entrypoint: ініціалізація залежностей, старт web + scheduler + polling.
+
+Старт не чекає на Google, якщо є з чим працювати: office/warehouse і так
+лежать у локальному кеші, users — у локальному знімку. Тоді бот одразу
+обслуговує з них, а оновлення з Google (connect, users і таблиця ТТН
+паралельно, ТТН — одним читанням) іде фоном. Без знімка (перший запуск,
+WARM_START=0) оновлення чекається до старту. Тривалість фаз — у лог і в
+/metrics (startup_phase_seconds).
+"""
 import asyncio
 import logging
+import secrets
+import signal
+import time
+from contextlib import contextmanager
 
-from . import settings
+from . import executors, metrics, settings
 from .bot import create_bot, create_dispatcher
 from .scheduler import setup_scheduler
+from .services.barcode import BarcodeDecoder
+from .services.outbound import OutboundDispatcher
 from .services.reports import ReportService
 from .services.ttn import TTNService
 from .storage import local_cache as lc
 from .storage.sheets import Sheets
 from .storage.users import AdminNotifier, UserRepository
 from .web import start_web
+from .webhook import WebhookHandler
 
 logging.basicConfig(
     level=logging.INFO,
@@ -25,53 +40,191 @@ async def main() -> None:
             "TOKEN не задано. Задайте змінну оточення TOKEN (Render) "
             "або створіть config.py із config.example.py."
         )
-    lc.ensure_local_files()
-    bot = create_bot()
-
-    # ── Google Sheets ──
-    sheets = Sheets()
-    try:
-        await asyncio.to_thread(sheets.connect)
-    except Exception as e:
-        log.exception("Initial Google Sheets connect failed: %s", e)
-
-    users = UserRepository(sheets)
-    await users.load()  # _read_all сам гасить помилки -> порожній кеш при збої
+    timer = _StartupTimer()
+    with timer.phase("local"):
+        executors.configure()  # пули disk/net/cpu; net — дефолтний executor циклу
+        await executors.run(executors.DISK, lc.ensure_local_files)
+        bot = create_bot()
 
-    notifier = AdminNotifier(bot, users)
-    ttn = TTNService(bot, sheets, notifier)
-    reports = ReportService(bot, sheets, users, notifier)
+        sheets = Sheets()
+        users = UserRepository(sheets)
+        outbound = OutboundDispatcher(bot)
+        outbound.start()
+        notifier = AdminNotifier(outbound, users)
+        notifier.start()    # періодичний дайджест повторних алертів
+        ttn = TTNService(outbound, sheets, notifier)
+        reports = ReportService(outbound, sheets, users, notifier)
+        decoder = BarcodeDecoder()  # cv2/zxing підвантажить воркер на першому фото
+        warm = settings.WARM_START and await users.load_snapshot()
 
-    # початкове наповнення локальних файлів із Google
-    try:
-        await asyncio.to_thread(sheets.pull_office_to_local)
-        await asyncio.to_thread(sheets.pull_warehouse_to_local)
-    except Exception as e:
-        log.exception("Init data load failed: %s", e)
-        await notifier.notify(f"Init data load failed: {e}")
+    # стан Google Sheets -> адмінам; після відновлення — одразу допушити відкладене
+    sheets.breaker.on_state(
+        lambda state: _spawn(_on_sheets_state(state, sheets, ttn, users, notifier))
+    )
 
-    admins = users.admin_ids()
-    log.info("Loaded admin IDs: %s", admins or "none")
+    refresh = asyncio.create_task(_refresh_from_google(sheets, users, ttn, reports, notifier, timer))
+    if not warm:
+        await refresh  # без знімка обслуговувати нема з чим
+    users.start()       # write-behind флеш черги оновлень користувачів
+    await ttn.resume()  # ТТН, що лишились у буфері з минулого запуску
 
     # ── діспетчер + ін'єкція залежностей у хендлери ──
     dp = create_dispatcher()
     dp["users"] = users
     dp["ttn"] = ttn
     dp["notifier"] = notifier
+    dp["decoder"] = decoder
+    dp["sheets"] = sheets
+    dp["outbound"] = outbound
+
+    webhook = _create_webhook(dp, bot)
 
     # ── фонові сервіси ──
-    scheduler = setup_scheduler(reports)
+    scheduler = setup_scheduler(reports, ttn)
     scheduler.start()
-    runner = await start_web(settings.PORT)
+    runner = await start_web(settings.PORT, webhook, settings.WEBHOOK_PATH)
     log.info("Keep-alive web server started on port %s", settings.PORT)
+    timer.done("Ready to serve" + (" (warm start, Google refresh in background)" if warm else ""))
 
     try:
-        log.info("Starting Telegram polling...")
-        await dp.start_polling(bot)
+        if webhook is None:
+            await bot.delete_webhook()  # getUpdates не працює, поки webhook встановлено
+            log.info("Starting Telegram polling...")
+            await dp.start_polling(bot)
+        else:
+            if settings.BOT_MODE == "webhook":
+                await bot.set_webhook(
+                    settings.WEBHOOK_BASE_URL.rstrip("/") + settings.WEBHOOK_PATH,
+                    secret_token=webhook.secret,
+                    allowed_updates=dp.resolve_used_update_types(),
+                )
+            log.info("Serving Telegram updates via %s on %s", settings.BOT_MODE, settings.WEBHOOK_PATH)
+            await _wait_for_stop_signal()
     finally:
+        refresh.cancel()
+        if webhook is not None:
+            await webhook.close()
         scheduler.shutdown(wait=False)
+        await notifier.close()
+        await users.close()
+        await sheets.close()
+        await outbound.close()
         await runner.cleanup()
         await bot.session.close()
+        executors.shutdown()
+
+
+async def _wait_for_stop_signal() -> None:
+    """Webhook-режим: працюємо до SIGTERM (Render при деплої/зупинці) або SIGINT.
+
+    Без власного обробника SIGTERM просто вбиває процес, і finally з
+    дочекуванням апдейтів і флешем черг не виконується.
+    """
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+    try:
+        await stop.wait()
+        log.info("Stop signal received, shutting down.")
+    finally:
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.remove_signal_handler(sig)
+
+
+class _StartupTimer:
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self.phases: dict[str, float] = {}
+        metrics.callback("startup_phase_seconds", "Тривалість фаз старту", lambda: dict(self.phases), ("phase",))
+
+    @contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = round(time.perf_counter() - started, 3)
+            log.info("Startup phase %s: %.2fs", name, self.phases[name])
+
+    def done(self, what: str) -> None:
+        log.info("%s in %.2fs.", what, time.perf_counter() - self.started)
+
+
+async def _refresh_from_google(sheets, users, ttn, reports, notifier, timer: _StartupTimer) -> None:
+    """connect, далі паралельно users і таблиця ТТН (одне читання на office + warehouse).
+
+    Pull-и йдуть через reports.pull_sheet: ревізії, з яких вони зроблені,
+    одразу стають базою для періодичного refresh (перший не перечитує
+    таблиці, які відтоді не змінились).
+    """
+    with timer.phase("sheets_connect"):
+        try:
+            await sheets.connect()
+        except Exception as e:
+            log.exception("Initial Google Sheets connect failed: %s", e)
+
+    async def load_users() -> None:
+        with timer.phase("users_load"):
+            # users.load сам гасить помилки -> лишається знімок або порожній кеш
+            await reports.pull_sheet("users", users.load)
+        log.info("Loaded admin IDs: %s", users.admin_ids() or "none")
+
+    async def load_ttn() -> None:
+        with timer.phase("ttn_load"):
+            try:
+                await ttn.replay_pending()  # спершу допушити відкладене, щоб pull уже бачив його
+                await reports.pull_sheet("ttn", sheets.pull_ttn_to_local)
+            except Exception as e:
+                log.exception("Init data load failed: %s", e)
+                await notifier.notify(f"Init data load failed: {e}")
+
+    with timer.phase("google_refresh"):
+        await asyncio.gather(load_users(), load_ttn())
+
+
+async def _on_sheets_state(state: str, sheets, ttn, users, notifier) -> None:
+    if state == "open":
+        await notifier.notify(
+            f"Google Sheets unavailable, circuit open: {sheets.breaker.last_error}. "
+            "Writes are kept locally and will be replayed."
+        )
+        return
+    await ttn.replay_pending()
+    await users.flush()
+    await notifier.notify("Google Sheets available again; pending writes replayed.")
+
+
+# фонові задачі слухачів (посилання — щоб GC не прибрав їх до завершення)
+_background: set[asyncio.Task] = set()
+
+
+def _spawn(coro) -> None:
+    task = asyncio.get_running_loop().create_task(coro)
+    _background.add(task)
+    task.add_done_callback(_background.discard)
+    task.add_done_callback(_log_failure)
+
+
+def _log_failure(task: asyncio.Task) -> None:
+    if not task.cancelled() and task.exception() is not None:
+        log.error("Background task failed", exc_info=task.exception())
+
+
+def _create_webhook(dp, bot) -> WebhookHandler | None:
+    if settings.BOT_MODE == "polling":
+        return None
+    if settings.BOT_MODE == "webhook":
+        if not settings.WEBHOOK_BASE_URL:
+            raise SystemExit("BOT_MODE=webhook потребує WEBHOOK_BASE_URL (публічна адреса сервісу).")
+        secret = settings.WEBHOOK_SECRET or secrets.token_urlsafe(32)
+    elif settings.BOT_MODE == "webhook-local":
+        secret = settings.WEBHOOK_SECRET or None
+        if secret is None:
+            log.warning("webhook-local without WEBHOOK_SECRET: requests are not authenticated.")
+    else:
+        raise SystemExit(f"Невідомий BOT_MODE: {settings.BOT_MODE!r} (polling | webhook | webhook-local)")
+    return WebhookHandler(dp, bot, secret, settings.WEBHOOK_MAX_UPDATES)
 
 
 if __name__ == "__main__":
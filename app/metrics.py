@@ -0,0 +1,196 @@
+"""Метрики у текстовому форматі Prometheus (без зовнішніх залежностей).
+
+Лічильники й гістограми оновлюються з будь-якого потоку (пули executors.py),
+тож кожна метрика має свій lock. Значення,
+які й так уже рахують сервіси (глибина черги, статистика кешів), не
+дублюємо: їх віддають callback-метрики в момент скрейпу.
+
+GET /metrics на keep-alive сервері віддає render().
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+# секунди: від мілісекундних пошуків до довгих викликів Google
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+BYTES_BUCKETS = (16_000, 32_000, 64_000, 128_000, 256_000, 512_000, 1_000_000, 2_000_000, 5_000_000)
+SIZE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+def _fmt(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: tuple[str, ...], values: tuple, extra: dict | None = None) -> str:
+    pairs = list(zip(names, values)) + list((extra or {}).items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in pairs) + "}"
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labels: tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> list[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_labels(self.labelnames, k)} {_fmt(v)}" for k, v in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: tuple[str, ...] = (),
+                 buckets: tuple[float, ...] = LATENCY_BUCKETS) -> None:
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._values: dict[tuple, list] = {}  # key -> [лічильники бакетів..., sum, count]
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self) -> list[str]:
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._values.items()]
+        lines = []
+        for key, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                le = _labels(self.labelnames, key, {"le": _fmt(bound)})
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_fmt(state[-2])}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {state[-1]}")
+        return lines
+
+
+class Callback(_Metric):
+    """Значення, що читається в момент скрейпу: fn() -> число або {значення міток: число}."""
+
+    def __init__(self, name: str, help_text: str, fn, labels: tuple[str, ...] = (),
+                 kind: str = "gauge") -> None:
+        super().__init__(name, help_text, labels)
+        self.kind = kind
+        self.fn = fn
+
+    def render(self) -> list[str]:
+        try:
+            value = self.fn()
+        except Exception:  # noqa: BLE001 — зламаний callback не валить увесь скрейп
+            return []
+        if not isinstance(value, dict):
+            value = {(): value}
+        return [
+            f"{self.name}{_labels(self.labelnames, k if isinstance(k, tuple) else (k,))} {_fmt(v)}"
+            for k, v in value.items() if v is not None
+        ]
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            # повторна реєстрація (напр. новий об'єкт після рестарту сервісу) заміняє стару
+            self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            body = metric.render()
+            if body:
+                lines += metric.header() + body
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def counter(name: str, help_text: str, labels: tuple[str, ...] = ()) -> Counter:
+    return REGISTRY.register(Counter(name, help_text, labels))
+
+
+def histogram(name: str, help_text: str, labels: tuple[str, ...] = (),
+              buckets: tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+    return REGISTRY.register(Histogram(name, help_text, labels, buckets))
+
+
+def callback(name: str, help_text: str, fn, labels: tuple[str, ...] = (), kind: str = "gauge") -> Callback:
+    return REGISTRY.register(Callback(name, help_text, fn, labels, kind))
+
+
+def render() -> str:
+    return REGISTRY.render()
+
+
+# ── кеші (TTLCache): один набір метрик з міткою cache ──
+_CACHES: dict = {}
+
+
+def watch_cache(name: str, cache) -> None:
+    """Експортувати hits/misses/розмір кешу з .stats() під міткою cache=name."""
+    _CACHES[name] = cache
+
+
+def _cache_stat(field: str):
+    return lambda: {name: cache.stats()[field] for name, cache in list(_CACHES.items())}
+
+
+callback("cache_hits_total", "Влучання в кеш", _cache_stat("hits"), ("cache",), kind="counter")
+callback("cache_misses_total", "Промахи кешу", _cache_stat("misses"), ("cache",), kind="counter")
+callback("cache_hit_ratio", "Частка влучань у кеш", _cache_stat("hit_ratio"), ("cache",))
+callback("cache_entries", "Записів у кеші", _cache_stat("size"), ("cache",))
@@ -3,17 +3,25 @@ from zoneinfo import ZoneInfo
 
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
 
 from . import settings
 from .services.reports import ReportService
+from .services.ttn import TTNService
 
 
-def setup_scheduler(reports: ReportService) -> AsyncIOScheduler:
+def setup_scheduler(reports: ReportService, ttn: TTNService) -> AsyncIOScheduler:
     scheduler = AsyncIOScheduler(timezone=ZoneInfo(settings.TIMEZONE))
-    # розсилка підписок — щохвилини (перевіряє, кому настав час)
-    scheduler.add_job(reports.send_subscriptions, CronTrigger(minute="*"))
+    # розсилка підписок — окрема задача на кожен час HH:MM, що є серед підписок
+    reports.schedule_subscriptions(scheduler)
     # очистка таблиці ТТН — щодня о 00:00 за Києвом
     scheduler.add_job(reports.clear_ttn, CronTrigger(hour=0, minute=0))
-    # переконект до Google Sheets + оновлення кешів — щогодини
-    scheduler.add_job(reports.reconnect, CronTrigger(minute=0))
+    # оновлення кешів із Google Sheets (лише змінених таблиць)
+    scheduler.add_job(
+        reports.refresh, IntervalTrigger(minutes=settings.SHEETS_REFRESH_MINUTES), coalesce=True
+    )
+    # допуш рядків, відкладених через збій Google (breaker сам вирішує, чи пробувати)
+    scheduler.add_job(
+        ttn.replay_pending, IntervalTrigger(seconds=settings.SHEETS_REPLAY_SECONDS), coalesce=True
+    )
     return scheduler
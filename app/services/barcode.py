@@ -11,25 +11,60 @@ try_downscale, плюс каскад передобробки OpenCV (grayscale,
 ТТН-подібний (10–18 цифр). Звичайне НП-фото читається з 1-го варіанта (швидко),
 складна етикетка — проходить агресивнішу обробку.
 
-Функції синхронні/CPU-важкі — викликати з async через asyncio.to_thread(...).
+Варіанти ліниві: кожне перетворення рахується лише коли каскад до нього дійшов
+(і кешується для залежних — rot90 бере вже готовий clahe). Порядок адаптивний:
+BarcodeDecoder веде статистику влучань по варіантах і передає воркерам
+порядок за спаданням hit rate (див. VariantStats).
+
+Перед повнокадровим каскадом — локалізація: градієнт + морфологія знаходять
+кілька кандидатних областей штрих-коду, і кожен кроп спершу читається
+дешевими варіантами (grayscale, Otsu). Повний каскад — лише по повному
+кадру, коли жоден кроп не дав ТТН. Кроп повертає лише власні коди, тож ТТН
+відокремлюється від «сміттєвих» кодів сусідніх областей етикетки.
+
+Функції синхронні/CPU-важкі. З async-коду декодувати через BarcodeDecoder:
+пул процесів cpu із executors.py (паралельно по ядрах, поза GIL і поза
+пулами диска/мережі), обмежена черга з явним DecoderBusy при переповненні
+та таймаут на кожне фото.
 """
+import asyncio
+import hashlib
 import logging
 import re
+import time
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
 
-import cv2
-import numpy as np
-import zxingcpp
+from .. import executors, metrics, settings
+from ..cache import TTLCache
 
 log = logging.getLogger(__name__)
 
-# Формати, що реально трапляються на ТТН (Нова Пошта — Code128) + поширені сусіди.
-_FORMATS = (
-    zxingcpp.BarcodeFormat.Code128
-    | zxingcpp.BarcodeFormat.Code39
-    | zxingcpp.BarcodeFormat.EAN13
-    | zxingcpp.BarcodeFormat.ITF
-    | zxingcpp.BarcodeFormat.QRCode
-)
+# cv2/numpy/zxingcpp важкі (секунди й десятки МБ на старті): головний процес
+# їх не імпортує зовсім, воркер пулу — при першому фото (_load_stack).
+cv2 = np = zxingcpp = None
+_FORMATS = None
+_CLAHE = None
+
+
+def _load_stack() -> None:
+    global cv2, np, zxingcpp, _FORMATS, _CLAHE
+    if cv2 is not None:
+        return
+    import cv2 as _cv2
+    import numpy as _np
+    import zxingcpp as _zxingcpp
+
+    # Формати, що реально трапляються на ТТН (Нова Пошта — Code128) + поширені сусіди.
+    _FORMATS = (
+        _zxingcpp.BarcodeFormat.Code128
+        | _zxingcpp.BarcodeFormat.Code39
+        | _zxingcpp.BarcodeFormat.EAN13
+        | _zxingcpp.BarcodeFormat.ITF
+        | _zxingcpp.BarcodeFormat.QRCode
+    )
+    _CLAHE = _cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8, 8))
+    np, zxingcpp, cv2 = _np, _zxingcpp, _cv2
 
 
 def _looks_like_ttn(text: str) -> bool:
@@ -47,37 +82,349 @@ def _read(img) -> list[str]:
     return [r.text for r in results if r.valid and r.text]
 
 
-def _variants(img):
-    """Дедалі агресивніша передобробка. Порядок: дешеве -> дороге."""
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8, 8)).apply(gray)
-    up = cv2.resize(clahe, None, fx=2, fy=2, interpolation=cv2.INTER_CUBIC)
-    yield "color", img                                            # 1) як є
-    yield "gray", gray                                            # 2) grayscale
-    yield "clahe", clahe                                          # 3) контраст
-    yield "clahe+up2x", up                                        # 4) контраст + апскейл
-    yield "rot90", cv2.rotate(clahe, cv2.ROTATE_90_CLOCKWISE)     # 5) вертикальні коди
-    yield "rot270", cv2.rotate(clahe, cv2.ROTATE_90_COUNTERCLOCKWISE)  # 6) вертикальні коди
+# Передобробка: назва -> побудова з кадру. Порядок оголошення — базовий
+# (дешеве -> дороге), він же використовується, доки немає статистики.
+_BUILDERS = {
+    "color": lambda f: f.img,                                             # 1) як є
+    "gray": lambda f: cv2.cvtColor(f.img, cv2.COLOR_BGR2GRAY),            # 2) grayscale
+    "clahe": lambda f: _CLAHE.apply(f.get("gray")),                       # 3) контраст
+    "clahe+up2x": lambda f: cv2.resize(                                   # 4) контраст + апскейл
+        f.get("clahe"), None, fx=2, fy=2, interpolation=cv2.INTER_CUBIC
+    ),
+    "rot90": lambda f: cv2.rotate(f.get("clahe"), cv2.ROTATE_90_CLOCKWISE),         # 5) вертикальні
+    "rot270": lambda f: cv2.rotate(f.get("clahe"), cv2.ROTATE_90_COUNTERCLOCKWISE),  # 6) вертикальні
+    "otsu": lambda f: cv2.threshold(                                      # лише для кропів
+        f.get("gray"), 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU
+    )[1],
+}
+VARIANTS = tuple(n for n in _BUILDERS if n != "otsu")  # каскад повного кадру
+# Кроп — маленька чиста область: вистачає дешевого (grayscale, бінаризація).
+# Повороти й апскейл лишаються повному кадру, інакше кропи множать вартість фото.
+_CROP_VARIANTS = ("gray", "otsu")
 
 
-def decode_barcodes(image_bytes: bytes) -> list[str]:
-    """Повертає список текстів знайдених штрих-кодів (дедуплікований, може бути порожнім).
+class _Frame:
+    """Ліниві перетворення одного кадру: кожне будується при першому зверненні."""
 
-    Зупиняється рано, щойно з'явився ТТН-подібний код; інакше проходить усі варіанти.
+    def __init__(self, img) -> None:
+        self.img = img
+        self._cache: dict[str, object] = {}
+
+    def get(self, name: str):
+        if name not in self._cache:
+            self._cache[name] = _BUILDERS[name](self)
+        return self._cache[name]
+
+
+# ── локалізація областей штрих-коду ──
+_LOCATE_MAX_SIDE = 800        # шукаємо області на зменшеній копії (швидко)
+_REGION_MIN_AREA = 0.002      # частка кадру; дрібніше — шум
+_REGION_PAD = 0.15            # запас навколо області (тихі зони коду)
+
+
+def _locate_regions(gray, max_regions: int) -> list[tuple[int, int, int, int]]:
+    """Кандидатні області штрих-кодів (x, y, w, h) у координатах повного кадру.
+
+    Класика: різниця |Gx| і |Gy| (щільні паралельні смуги дають великий
+    градієнт лише в одному напрямку) -> blur -> Otsu -> closing, що зливає
+    смуги в суцільний блок -> erode/dilate проти шуму -> найбільші контури.
+    Closing двома ядрами — для горизонтальних і вертикальних кодів.
     """
+    h, w = gray.shape[:2]
+    scale = min(1.0, _LOCATE_MAX_SIDE / max(h, w))
+    small = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1 else gray
+
+    gx = cv2.convertScaleAbs(cv2.Sobel(small, cv2.CV_32F, 1, 0, ksize=-1))
+    gy = cv2.convertScaleAbs(cv2.Sobel(small, cv2.CV_32F, 0, 1, ksize=-1))
+    grad = cv2.blur(cv2.absdiff(gx, gy), (9, 9))
+    _, mask = cv2.threshold(grad, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
+    mask = cv2.bitwise_or(
+        cv2.morphologyEx(mask, cv2.MORPH_CLOSE, cv2.getStructuringElement(cv2.MORPH_RECT, (21, 7))),
+        cv2.morphologyEx(mask, cv2.MORPH_CLOSE, cv2.getStructuringElement(cv2.MORPH_RECT, (7, 21))),
+    )
+    mask = cv2.dilate(cv2.erode(mask, None, iterations=4), None, iterations=4)
+
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    min_area = _REGION_MIN_AREA * small.shape[0] * small.shape[1]
+    boxes = sorted(
+        (cv2.boundingRect(c) for c in contours if cv2.contourArea(c) >= min_area),
+        key=lambda b: b[2] * b[3],
+        reverse=True,
+    )[:max_regions]
+
+    regions = []
+    for x, y, bw, bh in boxes:
+        pad_x, pad_y = int(bw * _REGION_PAD) + 4, int(bh * _REGION_PAD) + 4
+        x0, y0 = max(0, int((x - pad_x) / scale)), max(0, int((y - pad_y) / scale))
+        x1, y1 = min(w, int((x + bw + pad_x) / scale)), min(h, int((y + bh + pad_y) / scale))
+        if x1 - x0 < 0.9 * w or y1 - y0 < 0.9 * h:  # «область» на весь кадр = повний кадр
+            regions.append((x0, y0, x1 - x0, y1 - y0))
+    return regions
+
+
+@dataclass
+class DecodeResult:
+    codes: list[str] = field(default_factory=list)
+    variant: str | None = None                       # на якому варіанті знайдено ТТН
+    stage: str | None = None                         # "roi" (кроп) або "full" (повний кадр)
+    regions: int = 0                                 # скільки областей знайшла локалізація
+    tried: list[tuple[str, float]] = field(default_factory=list)  # повний кадр: (варіант, секунд)
+    roi_seconds: float = 0.0                         # усі кропи разом (одна спроба)
+    started_at: float = 0.0                          # time.time() початку у воркері
+
+
+def _cascade(frame: _Frame, names, found: dict, tried: list | None = None) -> str | None:
+    """Проганяє варіанти кадру по черзі; повертає назву варіанта, що дав ТТН."""
+    for name in names:
+        started = time.perf_counter()
+        for text in _read(frame.get(name)):
+            found.setdefault(text, None)
+        if tried is not None:
+            tried.append((name, time.perf_counter() - started))
+        if any(_looks_like_ttn(t) for t in found):
+            return name
+    return None
+
+
+def decode_detailed(image_bytes: bytes, order=None, localize: bool | None = None) -> DecodeResult:
+    """Каскад із деталями для статистики: який варіант влучив і скільки коштував кожен.
+
+    order — порядок варіантів (невідомі назви ігноруються, пропущені
+    додаються в кінець у базовому порядку). localize=None -> DECODE_LOCALIZE.
+    """
+    result = DecodeResult(started_at=time.time())
+    _load_stack()
     img = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
     if img is None:
         log.warning("Не вдалося декодувати зображення (cv2.imdecode -> None).")
-        return []
+        return result
 
-    found: dict[str, None] = {}  # збереження порядку + дедуплікація
-    for name, variant in _variants(img):
-        for text in _read(variant):
-            found.setdefault(text, None)
-        if any(_looks_like_ttn(t) for t in found):
-            log.info("Штрих-код знайдено на варіанті '%s'. Усі коди: %s", name, list(found))
-            return list(found)
+    names = [n for n in (order or ()) if n in VARIANTS]
+    names += [n for n in VARIANTS if n not in names]
+    frame = _Frame(img)
+
+    if settings.DECODE_LOCALIZE if localize is None else localize:
+        started = time.perf_counter()
+        regions = _locate_regions(frame.get("gray"), settings.DECODE_MAX_REGIONS)
+        result.regions = len(regions)
+        for x, y, w, h in regions:
+            crop = _Frame(np.ascontiguousarray(img[y:y + h, x:x + w]))
+            crop_found: dict[str, None] = {}  # свій для кропу: коди сусідніх областей не змішуються
+            winner = _cascade(crop, _CROP_VARIANTS, crop_found)
+            if winner:
+                result.roi_seconds = time.perf_counter() - started
+                log.info("Штрих-код знайдено в області на варіанті '%s'. Коди: %s", winner, list(crop_found))
+                result.variant, result.stage, result.codes = winner, "roi", list(crop_found)
+                return result
+        result.roi_seconds = time.perf_counter() - started
+        if regions:
+            # області знайдено, але не прочитано: апскейл усього кадру — найдорожчий
+            # варіант і на таких фото майже не додає влучань (див. scripts/bench_barcode.py)
+            names = [n for n in names if n != "clahe+up2x"]
 
-    if found:
+    found: dict[str, None] = {}  # збереження порядку + дедуплікація
+    winner = _cascade(frame, names, found, result.tried)
+    if winner:
+        log.info("Штрих-код знайдено на варіанті '%s'. Усі коди: %s", winner, list(found))
+        result.variant, result.stage = winner, "full"
+    elif found:
         log.info("ТТН-подібного коду не знайдено. Прочитані коди: %s", list(found))
-    return list(found)
+    result.codes = list(found)
+    return result
+
+
+def decode_barcodes(image_bytes: bytes, order=None) -> list[str]:
+    """Повертає список текстів знайдених штрих-кодів (дедуплікований, може бути порожнім).
+
+    Зупиняється рано, щойно з'явився ТТН-подібний код; інакше проходить усі варіанти.
+    """
+    return decode_detailed(image_bytes, order).codes
+
+
+class VariantStats:
+    """Статистика каскаду: спроби, влучання і час по кожному варіанту.
+
+    hit rate = влучання / спроби (умовна ймовірність, що варіант знайде ТТН,
+    коли до нього дійшла черга). Порядок — за спаданням влучань на секунду
+    роботи варіанта (hit rate / середній час): дешевий варіант із трохи
+    нижчим hit rate лишається попереду дорогого. Доки фото менше за
+    ADAPT_MIN_DECODES, порядок базовий; варіанти з менш ніж ADAPT_MIN_ATTEMPTS
+    спробами не оцінюються і йдуть після оцінених у базовому порядку
+    (сортування стабільне).
+    """
+
+    ADAPT_MIN_DECODES = 30
+    ADAPT_MIN_ATTEMPTS = 20
+
+    def __init__(self) -> None:
+        self.decodes = 0
+        self.attempts = dict.fromkeys(VARIANTS, 0)
+        self.hits = dict.fromkeys(VARIANTS, 0)
+        self.seconds = dict.fromkeys(VARIANTS, 0.0)
+        self.stages = {"roi": 0, "full": 0}  # де саме знайдено ТТН
+        self.roi_attempts = 0                # проходи по кропах (кожен — одна спроба)
+        self.roi_seconds = 0.0
+
+    def record(self, result: DecodeResult) -> None:
+        self.decodes += 1
+        if result.stage is not None:
+            self.stages[result.stage] += 1
+        if result.regions:
+            self.roi_attempts += 1
+            self.roi_seconds += result.roi_seconds
+        for name, spent in result.tried:
+            self.attempts[name] += 1
+            self.seconds[name] += spent
+        if result.stage == "full":
+            self.hits[result.variant] += 1
+
+    def hit_rate(self, name: str) -> float | None:
+        attempts = self.attempts[name]
+        return self.hits[name] / attempts if attempts else None
+
+    def score(self, name: str) -> float | None:
+        """Влучань на секунду роботи варіанта; None — замало спроб для оцінки."""
+        if self.attempts[name] < self.ADAPT_MIN_ATTEMPTS:
+            return None
+        return self.hits[name] / max(self.seconds[name], 1e-6)
+
+    def order(self) -> list[str]:
+        if self.decodes < self.ADAPT_MIN_DECODES:
+            return list(VARIANTS)
+        scores = {name: self.score(name) for name in VARIANTS}
+        return sorted(VARIANTS, key=lambda n: (scores[n] is None, -(scores[n] or 0.0)))
+
+    def snapshot(self) -> dict[str, dict]:
+        return {
+            name: {
+                "attempts": self.attempts[name],
+                "hits": self.hits[name],
+                "hit_rate": round(self.hits[name] / self.attempts[name], 3) if self.attempts[name] else None,
+                "avg_ms": round(1000 * self.seconds[name] / self.attempts[name], 1) if self.attempts[name] else None,
+            }
+            for name in VARIANTS
+        } | {
+            "roi": {
+                "attempts": self.roi_attempts,
+                "hits": self.stages["roi"],
+                "hit_rate": round(self.stages["roi"] / self.roi_attempts, 3) if self.roi_attempts else None,
+                "avg_ms": round(1000 * self.roi_seconds / self.roi_attempts, 1) if self.roi_attempts else None,
+            }
+        }
+
+
+_DECODE_SECONDS = metrics.histogram(
+    "barcode_decode_seconds", "Час розпізнавання фото (з очікуванням у черзі пулу)", ("outcome",)
+)
+_VARIANT_SECONDS = metrics.histogram(
+    "barcode_variant_seconds", "Час одного варіанта каскаду (_count — спроби)", ("variant",)
+)
+_VARIANT_HITS = metrics.counter(
+    "barcode_variant_hits_total", "Варіант, на якому знайдено ТТН", ("variant", "stage")
+)
+
+
+class DecoderBusy(RuntimeError):
+    """Черга декодування заповнена — фото варто надіслати ще раз пізніше."""
+
+
+class DecodeTimeout(RuntimeError):
+    """Фото не розпізнано за DECODE_TIMEOUT_SECONDS."""
+
+
+class BarcodeDecoder:
+    """Пул процесів для decode_barcodes з обмеженою чергою та backpressure.
+
+    Місткість = процеси + DECODE_QUEUE_SIZE. Слот звільняється лише коли
+    процес реально завершив роботу (навіть після таймауту), тож зависле фото
+    не дає черзі рости безмежно. Сам пул — executors CPU: створюється
+    ліниво, при падінні воркера — перестворюється.
+
+    Результати кешуються (LRU+TTL) за Telegram file_unique_id — повторне чи
+    переслане фото відповідається ще до завантаження — і за sha1 вмісту.
+    Порожній результат кешується лише на DECODE_NEGATIVE_TTL_SECONDS.
+    """
+
+    def __init__(self, queue_size: int | None = None, timeout: float | None = None) -> None:
+        self._pool = executors.get(executors.CPU)
+        self.workers = self._pool.workers
+        queue_size = settings.DECODE_QUEUE_SIZE if queue_size is None else queue_size
+        self.capacity = self.workers + queue_size
+        self.timeout = settings.DECODE_TIMEOUT_SECONDS if timeout is None else timeout
+        self._inflight = 0
+        self.variant_stats = VariantStats()
+        self.cache = TTLCache(settings.DECODE_CACHE_SIZE, settings.DECODE_CACHE_TTL_SECONDS)
+        metrics.watch_cache("decode", self.cache)
+        metrics.callback("barcode_decoder_inflight", "Фото в роботі та в черзі пулу", lambda: self._inflight)
+        metrics.callback("barcode_variant_hit_rate", "Hit rate варіанта каскаду",
+                         lambda: {n: self.variant_stats.hit_rate(n) for n in VARIANTS}, ("variant",))
+        metrics.callback("barcode_variant_score", "Влучань на секунду варіанта (порядок каскаду)",
+                         lambda: {n: self.variant_stats.score(n) for n in VARIANTS}, ("variant",))
+
+    @property
+    def inflight(self) -> int:
+        return self._inflight
+
+    def _release(self) -> None:
+        self._inflight -= 1
+
+    def stats(self) -> dict[str, dict]:
+        """Статистика варіантів каскаду (які реально окуповують свій час)."""
+        return self.variant_stats.snapshot()
+
+    def cached(self, file_unique_id: str) -> list[str] | None:
+        """Готовий результат для цього Telegram-файлу (до завантаження) або None."""
+        return self.cache.get(("file", file_unique_id))
+
+    def remember(self, file_unique_id: str, codes: list[str]) -> None:
+        """Закріпити остаточний результат за Telegram-файлом."""
+        self._store(("file", file_unique_id), list(codes))
+
+    def _store(self, key, codes: list[str]) -> None:
+        self.cache.set(key, codes, None if codes else settings.DECODE_NEGATIVE_TTL_SECONDS)
+
+    async def decode(self, image_bytes: bytes) -> list[str]:
+        digest = hashlib.sha1(image_bytes).hexdigest()
+        codes = self.cache.get(("sha1", digest))
+        if codes is None:
+            codes = await self._decode(image_bytes)
+            self._store(("sha1", digest), codes)
+        return list(codes)
+
+    async def _decode(self, image_bytes: bytes) -> list[str]:
+        if self._inflight >= self.capacity:
+            _DECODE_SECONDS.observe(0, outcome="busy")
+            raise DecoderBusy(f"decoder queue is full ({self._inflight}/{self.capacity})")
+        loop = asyncio.get_running_loop()
+        order = self.variant_stats.order()
+        submitted = time.time()
+        try:
+            cf = self._pool.submit(decode_detailed, image_bytes, order)
+        except BrokenProcessPool:
+            self._pool.reset()
+            cf = self._pool.submit(decode_detailed, image_bytes, order)
+        self._inflight += 1
+        cf.add_done_callback(lambda _: loop.call_soon_threadsafe(self._release))
+        started = time.perf_counter()
+        try:
+            # по таймауту wait_for скасовує cf: якщо фото ще в черзі — слот звільниться одразу
+            result = await asyncio.wait_for(asyncio.wrap_future(cf), self.timeout)
+        except asyncio.TimeoutError:
+            _DECODE_SECONDS.observe(time.perf_counter() - started, outcome="timeout")
+            raise DecodeTimeout(f"decode took longer than {self.timeout}s") from None
+        except BrokenProcessPool:
+            self._pool.reset()
+            raise
+        self._pool.observe(result.started_at - submitted, time.time() - result.started_at)
+        _DECODE_SECONDS.observe(time.perf_counter() - started, outcome="found" if result.variant else "not_found")
+        if result.regions:
+            _VARIANT_SECONDS.observe(result.roi_seconds, variant="roi")
+        for name, spent in result.tried:
+            _VARIANT_SECONDS.observe(spent, variant=name)
+        if result.variant is not None:
+            _VARIANT_HITS.inc(variant=result.variant, stage=result.stage)
+        self.variant_stats.record(result)
+        if self.variant_stats.decodes % 50 == 0:
+            log.info("Barcode variant stats: %s; TTN found at: %s",
+                     self.stats(), self.variant_stats.stages)
+        return result.codes
@@ -0,0 +1,238 @@
+"""Спільний диспетчер вихідних повідомлень Telegram.
+
+Замість послідовних `await bot.send_message(...)` усі сервіси й хендлери
+ставлять повідомлення в чергу, яку розбирають кілька воркерів паралельно,
+дотримуючись лімітів Telegram:
+  - глобальний token bucket (OUTBOUND_GLOBAL_RATE повідомлень/сек);
+  - bucket на чат (≈1/сек для приватних, 20/хв для груп): у кожного чату
+    своя FIFO, і чат із вичерпаним bucket-ом чекає на таймері, не займаючи
+    воркера — сплеск в один чат не гальмує інші;
+  - TelegramRetryAfter (flood wait) ставить на паузу всю відправку на
+    вказаний час і повертає повідомлення в чергу, виклику не видно.
+Інтерактивні відповіді (PRIORITY_INTERACTIVE) завжди йдуть перед масовими
+звітами (PRIORITY_BULK). stats() — глибина черги та латентність відправки.
+"""
+import asyncio
+import itertools
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass
+
+from aiogram.exceptions import TelegramRetryAfter
+
+from .. import metrics, settings
+from ..cache import TTLCache
+
+log = logging.getLogger(__name__)
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 1
+
+_GROUP_RATE = 20 / 60   # Telegram: ~20 повідомлень/хв у групу
+_MAX_RETRY_AFTER_ATTEMPTS = 5
+
+_SEND_SECONDS = metrics.histogram(
+    "outbound_send_seconds", "Від постановки в чергу до відправки", ("priority",)
+)
+
+
+class _TokenBucket:
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self) -> float:
+        """Забирає токен; повертає, скільки секунд треба почекати перед відправкою."""
+        self._refill()
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def wait(self) -> float:
+        """Через скільки секунд буде вільний токен (не забирає його)."""
+        self._refill()
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+
+@dataclass
+class _Job:
+    priority: int
+    seq: int
+    chat_id: int | str
+    text: str
+    kwargs: dict
+    future: asyncio.Future | None
+    enqueued: float
+    attempts: int = 0
+
+
+class OutboundDispatcher:
+    def __init__(self, bot, workers: int | None = None) -> None:
+        self.bot = bot
+        self.workers = workers or settings.OUTBOUND_WORKERS
+        # чати, що можуть слати просто зараз: (пріоритет, seq) голови черги чату
+        self._ready: asyncio.PriorityQueue[tuple[int, int, int | str]] = asyncio.PriorityQueue()
+        self._seq = itertools.count()
+        self._global = _TokenBucket(settings.OUTBOUND_GLOBAL_RATE, settings.OUTBOUND_GLOBAL_RATE)
+        self._buckets = TTLCache(10_000, 600)  # bucket на чат; давно неактивні витісняються
+        self._chat_jobs: dict[int | str, deque[_Job]] = {}  # FIFO чату, поки в ньому є повідомлення
+        self._scheduled: set[int | str] = set()  # чат у _ready, чекає на таймері або у воркера
+        self._timers: dict[int | str, asyncio.TimerHandle] = {}
+        self._depth = 0
+        self._drained = asyncio.Event()
+        self._drained.set()
+        self._paused_until = 0.0
+        self._tasks: list[asyncio.Task] = []
+        self.sent = 0
+        self.failed = 0
+        self.flood_waits = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        metrics.callback("outbound_queue_depth", "Повідомлень у черзі відправки", lambda: self._depth)
+        metrics.callback("outbound_messages_total", "Результати відправки",
+                         lambda: {"sent": self.sent, "failed": self.failed, "flood_wait": self.flood_waits},
+                         ("result",), kind="counter")
+        metrics.watch_cache("outbound_chats", self._buckets)
+
+    # ── API для сервісів ──
+    async def send_message(self, chat_id, text: str, *, priority: int = PRIORITY_INTERACTIVE,
+                           wait: bool = True, **kwargs):
+        """Як bot.send_message, але через чергу. wait=False — не чекати відправки."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future() if wait else None
+        job = _Job(priority, next(self._seq), chat_id, text, kwargs, future, time.monotonic())
+        self._chat_jobs.setdefault(chat_id, deque()).append(job)
+        self._depth += 1
+        self._drained.clear()
+        if chat_id not in self._scheduled:
+            self._schedule(chat_id)
+        if future is not None:
+            return await future
+        return None
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self._depth,
+            "sent": self.sent,
+            "failed": self.failed,
+            "flood_waits": self.flood_waits,
+            "latency_avg_ms": round(1000 * self.latency_total / self.sent, 1) if self.sent else None,
+            "latency_max_ms": round(1000 * self.latency_max, 1),
+        }
+
+    # ── життєвий цикл ──
+    def start(self) -> None:
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def close(self, timeout: float = 10) -> None:
+        """Дочекатися відправки черги (не довше timeout) і зупинити воркерів."""
+        try:
+            await asyncio.wait_for(self._drained.wait(), timeout)
+        except asyncio.TimeoutError:
+            log.warning("Outbound queue not drained on shutdown: %d left", self._depth)
+        for handle in self._timers.values():
+            handle.cancel()
+        self._timers.clear()
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    # ── планування чатів ──
+    # Воркер ніколи не спить на ліміті чату: чат із порожнім bucket-ом чекає на
+    # таймері циклу (купа за часом готовності) і лише тоді потрапляє в _ready.
+    # Тож сплеск в один чат займає не більше одного воркера, решта обслуговує
+    # інші чати. У кожного чату щонайбільше одне повідомлення в роботі — FIFO.
+    def _bucket(self, chat_id) -> _TokenBucket:
+        bucket = self._buckets.get(chat_id)
+        if bucket is None:
+            is_group = str(chat_id).startswith("-")
+            rate = _GROUP_RATE if is_group else settings.OUTBOUND_CHAT_RATE
+            bucket = _TokenBucket(rate, 1 if is_group else 3)
+        self._buckets.set(chat_id, bucket)  # продовжує TTL активного чату
+        return bucket
+
+    def _schedule(self, chat_id) -> None:
+        """Чат із непорожньою чергою -> у _ready, щойно його bucket і flood wait дозволять."""
+        self._scheduled.add(chat_id)
+        delay = max(self._bucket(chat_id).wait(), self._paused_until - time.monotonic())
+        if delay > 0:
+            self._timers[chat_id] = asyncio.get_running_loop().call_later(delay, self._make_ready, chat_id)
+        else:
+            self._make_ready(chat_id)
+
+    def _make_ready(self, chat_id) -> None:
+        self._timers.pop(chat_id, None)
+        head = self._chat_jobs[chat_id][0]
+        self._ready.put_nowait((head.priority, head.seq, chat_id))
+
+    # ── воркер ──
+    async def _worker(self) -> None:
+        while True:
+            _, _, chat_id = await self._ready.get()
+            try:
+                await self._deliver(chat_id)
+            except Exception as e:  # noqa: BLE001 — воркер не повинен падати
+                log.exception("Outbound worker error: %s", e)
+
+    async def _deliver(self, chat_id) -> None:
+        jobs = self._chat_jobs[chat_id]
+        job = jobs.popleft()
+        finished = True
+        try:
+            # загальний ліміт і flood wait спільні для всіх чатів — тут чекати можна
+            pause = self._global.reserve()
+            while True:
+                pause = max(pause, self._paused_until - time.monotonic())
+                if pause <= 0:
+                    break
+                await asyncio.sleep(pause)
+                pause = 0.0
+            self._bucket(chat_id).reserve()
+            try:
+                result = await self.bot.send_message(job.chat_id, job.text, **job.kwargs)
+            except TelegramRetryAfter as e:
+                self.flood_waits += 1
+                self._paused_until = max(self._paused_until, time.monotonic() + e.retry_after)
+                job.attempts += 1
+                log.warning("Flood wait %ss (chat %s), pausing outbound.", e.retry_after, job.chat_id)
+                if job.attempts < _MAX_RETRY_AFTER_ATTEMPTS:
+                    jobs.appendleft(job)  # знову голова черги чату
+                    finished = False
+                    return
+                self._fail(job, e)
+                return
+            except Exception as e:
+                self._fail(job, e)
+                return
+            latency = time.monotonic() - job.enqueued
+            _SEND_SECONDS.observe(latency, priority="interactive" if job.priority == PRIORITY_INTERACTIVE else "bulk")
+            self.sent += 1
+            self.latency_total += latency
+            self.latency_max = max(self.latency_max, latency)
+            if job.future is not None and not job.future.done():
+                job.future.set_result(result)
+        finally:
+            if finished:
+                self._depth -= 1
+                if not self._depth:
+                    self._drained.set()
+            if jobs:
+                self._schedule(chat_id)
+            else:
+                del self._chat_jobs[chat_id]
+                self._scheduled.discard(chat_id)
+
+    def _fail(self, job: _Job, error: Exception) -> None:
+        self.failed += 1
+        if job.future is not None and not job.future.done():
+            job.future.set_exception(error)
+        else:
+            log.error("Failed to send message to %s: %s", job.chat_id, error)
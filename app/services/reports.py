@@ -1,63 +1,170 @@
-"""Щоденні звіти підписникам, добова очистка таблиці ТТН та reconnect Sheets.
+"""Щоденні звіти підписникам, добова очистка таблиці ТТН та refresh кешів із Sheets.
 
 Викликається планувальником (APScheduler). Порт із попередньої версії, але:
   - читаємо підписників із кешу users (а не щохвилини з мережі);
-  - очистку о 00:00 робить cron-розклад, тут лише саме очищення.
+  - розсилка не опитує всіх щохвилини: на кожен час підписки HH:MM — своя
+    cron-задача, яка бере лише підписників цього часу з індексу users;
+  - очистку о 00:00 робить cron-розклад, тут лише саме очищення;
+  - refresh перечитує таблицю, лише якщо змінилась її ревізія.
 """
 import asyncio
 import logging
+import re
+import time
 from datetime import datetime
 from zoneinfo import ZoneInfo
 
-from .. import settings
+from apscheduler.triggers.cron import CronTrigger
+
+from .. import executors, metrics, settings
 from ..storage import local_cache as lc
 from ..storage.sheets import Sheets
 from ..storage.users import AdminNotifier, UserRepository
+from .outbound import PRIORITY_BULK, OutboundDispatcher
 
 log = logging.getLogger(__name__)
 _KIEV = ZoneInfo(settings.TIMEZONE)
+_TIME_RE = re.compile(r"^([01]\d|2[0-3]):([0-5]\d)$")
+_JOB_PREFIX = "subs:"
+
+_REFRESHES = metrics.counter(
+    "sheets_refresh_total",
+    "Перевірки таблиць: skipped — без змін, changed — перечитано, forced — за розкладом, startup — на старті",
+    ("sheet", "result"),
+)
 
 
 class ReportService:
-    def __init__(self, bot, sheets: Sheets, users: UserRepository, notifier: AdminNotifier) -> None:
-        self.bot = bot
+    def __init__(
+        self, outbound: OutboundDispatcher, sheets: Sheets, users: UserRepository, notifier: AdminNotifier
+    ) -> None:
+        self.outbound = outbound
         self.sheets = sheets
         self.users = users
         self.notifier = notifier
+        self._scheduler = None
+        self._forced_at = time.monotonic()    # старт теж повний pull
+
+    # ── планування розсилок ──
+    def schedule_subscriptions(self, scheduler) -> None:
+        """Тримати по одній cron-задачі на кожен час підписки (оновлюється з індексу users)."""
+        self._scheduler = scheduler
+        self.users.on_subscriptions_changed(self._reschedule)
+        self._reschedule()
 
-    async def send_subscriptions(self) -> None:
-        """Щохвилини: кому настав час підписки — шлемо звіт раз на день."""
+    def _reschedule(self) -> None:
+        if self._scheduler is None:
+            return
+        wanted = set()
+        for hhmm in self.users.subscription_times():
+            if _TIME_RE.match(hhmm):
+                wanted.add(hhmm)
+            else:
+                log.warning("Ignoring invalid subscription time %r", hhmm)
+        for job in self._scheduler.get_jobs():
+            if job.id.startswith(_JOB_PREFIX) and job.id[len(_JOB_PREFIX):] not in wanted:
+                job.remove()
+        for hhmm in wanted:
+            job_id = _JOB_PREFIX + hhmm
+            if self._scheduler.get_job(job_id) is None:
+                hour, minute = hhmm.split(":")
+                self._scheduler.add_job(
+                    self.send_subscriptions,
+                    CronTrigger(hour=int(hour), minute=int(minute)),
+                    args=[hhmm],
+                    id=job_id,
+                    coalesce=True,
+                    misfire_grace_time=60,
+                )
+        log.info("Subscription jobs scheduled at: %s", sorted(wanted) or "none")
+
+    async def send_subscriptions(self, hhmm: str | None = None) -> None:
+        """Звіт підписникам часу hhmm (за замовчуванням — поточна хвилина), раз на день."""
         now = datetime.now(_KIEV)
-        current_time = now.strftime("%H:%M")
+        hhmm = hhmm or now.strftime("%H:%M")
         today = now.strftime("%Y-%m-%d")
-        for chat_id, info in list(self.users.cache.items()):
-            if not info.time or info.time != current_time or info.last_sent == today:
-                continue
-            try:
-                count = await asyncio.to_thread(lc.count_office_ttn)
-            except Exception as e:
-                count = "Невідомо (помилка)"
-                await self.notifier.notify(f"Error counting TTН for chat {chat_id}: {e}")
-            await self.bot.send_message(chat_id, f"За сьогодні оброблено TTН: {count}")
-            await self.users.update(chat_id, info.role, info.username, info.time, today)
+        due = [
+            chat_id for chat_id in self.users.subscribers_at(hhmm)
+            if self.users.get(chat_id).last_sent != today
+        ]
+        if not due:
+            return
+        try:
+            count = await executors.run(executors.DISK, lc.count_office_ttn)  # один раз на тік
+        except Exception as e:
+            count = "Невідомо (помилка)"
+            await self.notifier.notify(f"Error counting TTН for {hhmm} subscribers: {e}")
+        # паралельно через диспетчер (ліміти Telegram тримає він), з низьким пріоритетом
+        results = await asyncio.gather(
+            *(self._send_report(chat_id, count, today) for chat_id in due), return_exceptions=True
+        )
+        failed = [chat_id for chat_id, r in zip(due, results) if isinstance(r, Exception)]
+        if failed:
+            log.warning("Report for %s not delivered to %d chats: %s", hhmm, len(failed), failed)
+
+    async def _send_report(self, chat_id: str, count, today: str) -> None:
+        await self.outbound.send_message(
+            chat_id, f"За сьогодні оброблено TTН: {count}", priority=PRIORITY_BULK
+        )
+        info = self.users.get(chat_id)
+        await self.users.update(chat_id, info.role, info.username, info.time, today)
 
     async def clear_ttn(self) -> None:
         """Cron 00:00 (Київ): очистити таблицю ТТН і локальні файли."""
         try:
-            await asyncio.to_thread(self.sheets.clear_ttn)
+            await self.sheets.clear_ttn()
         except Exception as e:
             log.error("Error clearing Google Sheet TTN: %s", e)
             await self.notifier.notify(f"Error clearing Google Sheet TTN: {e}")
-        await asyncio.to_thread(lc.clear_ttn_locals)
+        await executors.run(executors.DISK, lc.clear_ttn_locals)
+
+    async def refresh(self) -> None:
+        """Раз на SHEETS_REFRESH_MINUTES: перечитати лише таблиці, що змінились.
+
+        Спершу дешевий запит ревізії (Sheets.revision); збіг із ревізією
+        останнього pull-а чи власного запису бота (Sheets.revisions) -> pull
+        пропускається. Раз на
+        SHEETS_REFRESH_FORCE_MINUTES pull безумовний — страховка для
+        відбитків, що не бачать правок посеред рядка. Сесія й хендли
+        постійні, тож connect лише відкриває те, що не вдалося раніше.
+        """
+        force = time.monotonic() - self._forced_at >= settings.SHEETS_REFRESH_FORCE_MINUTES * 60
+        try:
+            await self.sheets.connect()
+            # таблиця ТТН — одним читанням на обидва локальні набори; users — паралельно
+            await asyncio.gather(
+                self._refresh_sheet("users", self.users.load, force),
+                self._refresh_sheet("ttn", self.sheets.pull_ttn_to_local, force),
+            )
+        except Exception as e:
+            log.error("Error refreshing Google Sheets: %s", e)
+            await self.notifier.notify(f"Error refreshing Google Sheets: {e}")
+            return
+        if force:
+            self._forced_at = time.monotonic()
+
+    async def pull_sheet(self, sheet: str, pull) -> None:
+        """Безумовний pull зі стартовою ревізією (main, оновлення з Google на старті)."""
+        await self._refresh_sheet(sheet, pull, force=True, result="startup")
 
-    async def reconnect(self) -> None:
-        """Щогодини: переконект до Sheets + перезавантаження кешів."""
+    async def _refresh_sheet(self, sheet: str, pull, force: bool, result: str | None = None) -> None:
+        # ревізія береться ДО pull: правку, що прийшла під час читання, підхопить наступний раз
         try:
-            await asyncio.to_thread(self.sheets.connect)
-            await self.users.load()
-            await asyncio.to_thread(self.sheets.pull_office_to_local)
-            await asyncio.to_thread(self.sheets.pull_warehouse_to_local)
-            log.info("Google Sheets reconnected.")
+            revision = await self.sheets.revision(sheet)
         except Exception as e:
-            log.error("Error reconnecting Google Sheets: %s", e)
-            await self.notifier.notify(f"Error reconnecting Google Sheets: {e}")
+            if not force:
+                raise
+            revision = None  # pull однаково потрібен; ревізію візьме наступний refresh
+            log.info("Revision of %s sheet unavailable, pulling anyway: %s", sheet, e)
+        if not force and revision == self.sheets.revisions.get(sheet):
+            _REFRESHES.inc(sheet=sheet, result="skipped")
+            return
+        if await pull() is False:  # users.load сам гасить помилки
+            return
+        if revision is None:
+            self.sheets.revisions.pop(sheet, None)
+        else:
+            self.sheets.revisions[sheet] = revision
+        result = result or ("forced" if force else "changed")
+        _REFRESHES.inc(sheet=sheet, result=result)
+        log.info("Sheet %s refreshed (%s).", sheet, result)
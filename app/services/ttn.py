@@ -1,21 +1,32 @@
 """Логіка ролей та буфер Складу (порт із попередньої версії, потоки -> asyncio).
 
-Роль "Склад": ТТН -> буфер; через BUFFER_DELAY_SECONDS пакет переноситься в
-warehouse, пушиться в Google, оновлюється office, і користувачу шлеться
-перелік "Додано / Не додано".
+Роль "Склад": ТТН -> буфер чату; через BUFFER_DELAY_SECONDS пакет чату
+переноситься в warehouse, пушиться в Google, оновлюється office, і саме цьому
+чату шлеться перелік "Додано / Не додано". Вікна різних чатів незалежні й
+флешаться паралельно; запис у Google між ними коалесціюється (один push+pull
+на всіх, хто встиг злити буфер у warehouse до його старту).
 Роль "Офіс": миттєвий пошук ТТН у локальному office-кеші.
 """
 import asyncio
 import logging
 import re
+import time
 
-from .. import settings
+from .. import executors, metrics, settings
 from ..storage import local_cache as lc
 from ..storage.sheets import Sheets
 from ..storage.users import AdminNotifier
+from .outbound import OutboundDispatcher
 
 log = logging.getLogger(__name__)
 
+_FLUSH_SECONDS = metrics.histogram(
+    "buffer_flush_seconds", "Обробка буфера чату: warehouse -> Google -> порівняння з office", ("mode",)
+)
+_FLUSH_SIZE = metrics.histogram(
+    "buffer_flush_ttns", "ТТН в одному флеші буфера", buckets=metrics.SIZE_BUCKETS
+)
+
 
 def extract_ttn(raw: str) -> str | None:
     """Дістає ТТН-номер зі сканованого/введеного тексту або повертає None.
@@ -36,75 +47,139 @@ def extract_ttn(raw: str) -> str | None:
 
 
 class TTNService:
-    def __init__(self, bot, sheets: Sheets, notifier: AdminNotifier) -> None:
-        self.bot = bot
+    def __init__(self, outbound: OutboundDispatcher, sheets: Sheets, notifier: AdminNotifier) -> None:
+        self.outbound = outbound
         self.sheets = sheets
         self.notifier = notifier
-        self._lock = asyncio.Lock()
-        self._timer_task: asyncio.Task | None = None
+        self._timers: dict[str, asyncio.Task] = {}  # chat_id -> вікно акумуляції
+        # коалесценція синку з Google: номери "квитків" запитаних/виконаних синків
+        self._sync_lock = asyncio.Lock()
+        self._sync_requested = 0
+        self._sync_done = 0
+        self._sync_error: Exception | None = None
 
     async def handle_ttn(self, chat_id: str, ttn: str, username: str, role: str) -> None:
+        await self.handle_ttns(chat_id, [ttn], username, role)
+
+    async def handle_ttns(self, chat_id: str, ttns: list[str], username: str, role: str) -> None:
+        """Пакет ТТН одного чату (напр. з альбому): один запис у буфер / одна відповідь."""
         if role == "Склад":
-            await asyncio.to_thread(lc.add_ttn_to_buffer, ttn, username)
+            await executors.run(executors.DISK, lc.add_ttns_to_buffer, ttns, username, chat_id)
             self._start_buffer_timer(chat_id)
         elif role == "Офіс":
-            await self._check_office(chat_id, ttn)
+            await self._check_office(chat_id, ttns)
         else:
-            await self.bot.send_message(
+            await self.outbound.send_message(
                 chat_id, "Спочатку встановіть роль за допомогою /Office або /Cklad"
             )
 
+    async def replay_pending(self) -> None:
+        """Допушити warehouse-рядки, що застрягли після збою Sheets (крон і відновлення breaker-а)."""
+        pending = await executors.run(executors.DISK, self.sheets.pending_push_rows)
+        if not pending:
+            return
+        try:
+            await self._sync_to_google()
+        except Exception as e:
+            log.info("Replay of %d pending TTN rows postponed: %s", pending, e)
+            return
+        log.info("Replayed %d pending TTN rows to Google Sheet.", pending)
+
+    async def resume(self) -> None:
+        """Після рестарту дообробити ТТН, що лишились у буфері з минулого запуску."""
+        for chat_id in await executors.run(executors.DISK, lc.buffer_chats):
+            self._start_buffer_timer(chat_id)
+
     # ── Офіс ──
-    async def _check_office(self, chat_id: str, ttn: str) -> None:
-        row = await asyncio.to_thread(lc.find_office_row, ttn)
-        if row is not None:
-            await self.bot.send_message(chat_id, f"✅TTН {ttn} на рядку {row}.")
-        else:
-            await self.bot.send_message(chat_id, f"❌TTН {ttn} не знайдено.")
+    async def _check_office(self, chat_id: str, ttns: list[str]) -> None:
+        lines = []
+        rows = await executors.run(executors.DISK, lc.find_office_rows, ttns)
+        for ttn, row in zip(ttns, rows):
+            if row is not None:
+                lines.append(f"✅TTН {ttn} на рядку {row}.")
+            else:
+                lines.append(f"❌TTН {ttn} не знайдено.")
+        await self.outbound.send_message(chat_id, "\n".join(lines))
 
     # ── Склад: буфер ──
     def _start_buffer_timer(self, chat_id: str) -> None:
-        """Один активний таймер (як у попередній версії)."""
-        if self._timer_task is None or self._timer_task.done():
-            self._timer_task = asyncio.create_task(self._buffer_timer(chat_id))
+        """Один активний таймер на чат: вікно відкриває перший скан."""
+        task = self._timers.get(chat_id)
+        if task is None or task.done():
+            self._timers[chat_id] = asyncio.create_task(self._buffer_timer(chat_id))
 
     async def _buffer_timer(self, chat_id: str) -> None:
         await asyncio.sleep(settings.BUFFER_DELAY_SECONDS)
+        # вікно закрито: скани під час обробки відкривають нове
+        self._timers.pop(chat_id, None)
         try:
             await self._process_buffer(chat_id)
         except Exception as e:
-            log.exception("Buffer processing failed: %s", e)
+            log.exception("Buffer processing failed for chat %s: %s", chat_id, e)
             await self.notifier.notify(f"Buffer processing failed: {e}")
 
     async def _process_buffer(self, chat_id: str) -> None:
-        async with self._lock:
-            try:
-                await asyncio.to_thread(self._sync_buffer_to_google)
-            except Exception as e:
-                log.warning("Google Sheets query failed, comparing local files: %s", e)
-                await self._offline_diff()
-
-            added, not_added = await asyncio.to_thread(lc.compare_buffer_with_office)
-            msg = "Оновлення:\n"
-            if added:
-                msg += "Додано:\n" + "\n".join(added) + "\n"
-            if not_added:
-                msg += "Не додано:\n" + "\n".join(not_added)
-            await self.bot.send_message(chat_id, msg)
-            await asyncio.to_thread(lc.clear_buffer)
-            log.info("Buffer cleared.")
-
-    def _sync_buffer_to_google(self) -> None:
-        """Блокуючий ланцюжок: buffer -> warehouse -> Google -> office."""
-        lc.merge_buffer_into_warehouse()
-        self.sheets.push_warehouse_to_google()
-        self.sheets.pull_office_to_local()
+        entries = await executors.run(executors.DISK, lc.take_buffer, chat_id)
+        if not entries:
+            return
+        started = time.perf_counter()
+        _FLUSH_SIZE.observe(len(entries))
+        await executors.run(executors.DISK, lc.merge_buffer_into_warehouse, entries)
+        mode = "online"
+        try:
+            await self._sync_to_google()
+        except Exception as e:
+            mode = "offline"
+            log.warning("Google Sheets query failed, comparing local files: %s", e)
+            await self._offline_diff()
+
+        added, not_added = await executors.run(
+            executors.DISK, lc.compare_buffer_with_office, entries
+        )
+        _FLUSH_SECONDS.observe(time.perf_counter() - started, mode=mode)  # без черги відправки
+        if not chat_id:  # записи старого формату без чату — звіту нікому слати
+            log.info("Orphan buffer entries processed: %d", len(entries))
+            return
+        msg = "Оновлення:\n"
+        if added:
+            msg += "Додано:\n" + "\n".join(added) + "\n"
+        if not_added:
+            msg += "Не додано:\n" + "\n".join(not_added)
+        await self.outbound.send_message(chat_id, msg)
+        log.info("Buffer of chat %s processed (%d TTN).", chat_id, len(entries))
+
+    async def _sync_to_google(self) -> None:
+        """Коалесцений warehouse -> Google -> office.
+
+        Виклик бере "квиток" уже після того, як його записи злиті у warehouse.
+        Синк, що стартував пізніше за квиток, гарантовано їх запушив (push іде
+        за high-water mark), тож усі, кого він покрив, просто беруть його
+        результат — N одночасних флешів коштують один-два синки, а не N.
+        """
+        self._sync_requested += 1
+        ticket = self._sync_requested
+        async with self._sync_lock:
+            if self._sync_done < ticket:
+                self._sync_done = self._sync_requested
+                try:
+                    await self._sync_warehouse_to_google()
+                    self._sync_error = None
+                except Exception as e:
+                    self._sync_error = e
+            if self._sync_error is not None:
+                raise self._sync_error
+
+    async def _sync_warehouse_to_google(self) -> None:
+        """Ланцюжок: warehouse -> Google -> office."""
+        await self.sheets.push_warehouse_to_google()
+        await self.sheets.pull_office_to_local()
 
     async def _offline_diff(self) -> None:
-        missing = await asyncio.to_thread(lc.warehouse_office_diff)
+        missing = await executors.run(executors.DISK, lc.warehouse_office_diff)
         if missing:
-            await asyncio.to_thread(lc.write_diff_file, missing)
+            await executors.run(executors.DISK, lc.write_diff_file, missing)
             await self.notifier.notify(
                 f"Failed to update from Google Sheets. Missing TTНs: {missing}. "
-                f"See attached file {lc.DIFF_FILE}."
+                f"See attached file {lc.DIFF_FILE}. Rows are queued and will be pushed "
+                "automatically when Google Sheets is available again."
             )
@@ -34,11 +34,62 @@ GOOGLE_SHEETS_CREDENTIALS_JSON = _get("GOOGLE_SHEETS_CREDENTIALS_JSON")
 GOOGLE_SHEET_URL = _get("GOOGLE_SHEET_URL")                    # таблиця ТТН
 GOOGLE_SHEET_URL_USERS = _get("GOOGLE_SHEET_URL_USERS")        # таблиця користувачів
 
+# Стійкість до збоїв Google: таймаут виклику, повтори, circuit breaker, фоновий допуш
+SHEETS_TIMEOUT_SECONDS = float(_get("SHEETS_TIMEOUT_SECONDS", 20))
+SHEETS_RETRIES = int(_get("SHEETS_RETRIES", 3))
+SHEETS_MAX_CONNECTIONS = int(_get("SHEETS_MAX_CONNECTIONS", 10))  # keep-alive з'єднань у пулі aiohttp
+SHEETS_BREAKER_THRESHOLD = int(_get("SHEETS_BREAKER_THRESHOLD", 5))      # невдач поспіль
+SHEETS_BREAKER_COOLDOWN_SECONDS = float(_get("SHEETS_BREAKER_COOLDOWN_SECONDS", 30))
+SHEETS_REPLAY_SECONDS = int(_get("SHEETS_REPLAY_SECONDS", 60))          # період допушу відкладених рядків
+SHEETS_REFRESH_MINUTES = int(_get("SHEETS_REFRESH_MINUTES", 60))          # перевірка змін таблиць
+SHEETS_REFRESH_FORCE_MINUTES = int(_get("SHEETS_REFRESH_FORCE_MINUTES", 360))  # безумовний pull
+
 # ── Інфраструктура ──
 PORT = int(_get("PORT", 8080))           # keep-alive порт для Render
+# Отримання апдейтів: "polling" | "webhook" (set_webhook на WEBHOOK_BASE_URL) |
+# "webhook-local" (лише приймати POST-и, напр. від scripts/replay_updates.py)
+BOT_MODE = str(_get("BOT_MODE", "polling")).lower()
+WEBHOOK_BASE_URL = _get("WEBHOOK_BASE_URL", "")   # напр. https://<service>.onrender.com
+WEBHOOK_PATH = _get("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = _get("WEBHOOK_SECRET", "")       # порожній -> випадковий на кожен старт
+WEBHOOK_MAX_UPDATES = int(_get("WEBHOOK_MAX_UPDATES", 32))  # апдейтів в обробці одночасно
+METRICS_TOKEN = _get("METRICS_TOKEN", "")         # порожній -> /metrics вимкнено
 TIMEZONE = "Europe/Kiev"
 BUFFER_DELAY_SECONDS = 5                  # затримка акумуляції буфера (Склад)
 ADMIN_NOTIFY_INTERVAL_MINUTES = 10       # дедуплікація однакових алертів
+ADMIN_DIGEST_MINUTES = 5                 # період зведення повторів
+ADMIN_NOTIFY_MAX_KEYS = 256              # видів алертів у пам'яті (дедуп і дайджест)
+# Локальний кеш: "sqlite" (WAL, один файл) або "csv" (формат попередньої версії)
+LOCAL_STORAGE = str(_get("LOCAL_STORAGE", "sqlite")).lower()
+LOCAL_DB_FILE = _get("LOCAL_DB_FILE", "local.db")
+# Пули блокуючих викликів (executors.py); cpu — це DECODE_WORKERS
+EXECUTOR_DISK_WORKERS = int(_get("EXECUTOR_DISK_WORKERS", 4))   # локальний кеш
+EXECUTOR_NET_WORKERS = int(_get("EXECUTOR_NET_WORKERS", 8))     # DNS, сторонні to_thread
+# Старт із локального кешу/знімка users, поки Google оновлюється фоном
+WARM_START = str(_get("WARM_START", "1")).lower() in ("1", "true", "yes")
+USERS_FLUSH_SECONDS = 2                   # період write-behind флешу таблиці користувачів
+# Вихідні повідомлення (ліміти Telegram: ~30/с загалом, ~1/с у чат)
+OUTBOUND_WORKERS = 8
+OUTBOUND_GLOBAL_RATE = 25.0
+OUTBOUND_CHAT_RATE = 1.0
+
+# ── Декодування штрих-кодів ──
+DECODE_WORKERS = int(_get("DECODE_WORKERS", 0))          # процесів у пулі; 0 -> к-сть ядер
+DECODE_QUEUE_SIZE = int(_get("DECODE_QUEUE_SIZE", 8))    # фото в черзі понад зайняті процеси
+DECODE_TIMEOUT_SECONDS = float(_get("DECODE_TIMEOUT_SECONDS", 20))  # ліміт на одне фото
+# Локалізація областей коду перед повнокадровим каскадом
+DECODE_LOCALIZE = str(_get("DECODE_LOCALIZE", "1")).lower() in ("1", "true", "yes")
+DECODE_MAX_REGIONS = int(_get("DECODE_MAX_REGIONS", 3))
+# Кеш результатів (повторні/переслані фото): к-сть записів і час життя
+DECODE_CACHE_SIZE = int(_get("DECODE_CACHE_SIZE", 1024))
+DECODE_CACHE_TTL_SECONDS = int(_get("DECODE_CACHE_TTL_SECONDS", 6 * 3600))
+# Порожній результат живе недовго: повтор того ж фото після таймауту/перезйомки декодується заново
+DECODE_NEGATIVE_TTL_SECONDS = int(_get("DECODE_NEGATIVE_TTL_SECONDS", 60))
+# Прогресивне завантаження фото: спершу середній розмір (довша сторона >= MIN_SIDE),
+# повний — лише якщо на ньому не знайшлося ТТН
+PHOTO_PROGRESSIVE = str(_get("PHOTO_PROGRESSIVE", "1")).lower() in ("1", "true", "yes")
+PHOTO_PROGRESSIVE_MIN_SIDE = int(_get("PHOTO_PROGRESSIVE_MIN_SIDE", 800))
+MEDIA_GROUP_WAIT_SECONDS = 1.0           # тиша, після якої альбом вважається повним
 
 # ── Debug ──
 # Тимчасово зберігати вхідні фото на диск для офлайн-налаштування сканера.
@@ -1,122 +1,136 @@
-"""Локальний CSV-кеш — офлайн-фолбек на випадок нестабільності Render/Sheets.
-
-Три файли (як у попередній версії):
-  - local_office.csv     дзеркало таблиці ТТН для швидкого пошуку (роль Офіс)
-  - local_warehouse.csv  стейджинг із індексацією row перед пушем у Google (роль Склад)
-  - local_buffer.csv     ТТН, що чекають 5-секундної пакетної обробки
-
-Усі функції тут — синхронний файловий IO. З async-коду викликати через
-asyncio.to_thread(...).
+"""Локальний кеш — офлайн-фолбек на випадок нестабільності Render/Sheets.
+
+Три набори даних:
+  - office     дзеркало таблиці ТТН для швидкого пошуку (роль Офіс)
+  - warehouse  стейджинг із індексацією row перед пушем у Google (роль Склад)
+  - buffer     ТТН, що чекають 5-секундної пакетної обробки (з chat_id:
+               кожен чат Складу має власне вікно й власний звіт)
+плюс high-water mark: останній warehouse-row, який точно є в Google (усе,
+що після нього, ще треба допушити).
+
+Бекенд обирається settings.LOCAL_STORAGE:
+  - "sqlite" (за замовчуванням) — local_sqlite.SqliteStore, один файл БД у
+    режимі WAL; при першому запуску імпортує CSV попередньої версії;
+  - "csv" — local_csv.CsvStore, формат попередньої версії.
+Цей модуль — незмінна поверхня функцій для сервісів.
+
+Усі функції тут — синхронний IO. З async-коду викликати в пулі диска:
+executors.run(executors.DISK, ...).
 """
-import csv
-import os
-from datetime import datetime
-from zoneinfo import ZoneInfo
+import threading
 
 from .. import settings
+from .local_csv import CsvStore, write_csv_file
+from .local_sqlite import SqliteStore
 
-LOCAL_OFFICE_FILE = "local_office.csv"
-LOCAL_WAREHOUSE_FILE = "local_warehouse.csv"
-LOCAL_BUFFER_FILE = "local_buffer.csv"
 DIFF_FILE = "diff_missing.csv"
 
-OFFICE_HEADERS = ["row", "TTN", "Date", "Username"]
-WAREHOUSE_HEADERS = ["row", "TTN", "Date", "Username"]
-BUFFER_HEADERS = ["TTN", "Username"]
+_store: CsvStore | SqliteStore | None = None
+_store_lock = threading.Lock()
+
 
-_KIEV = ZoneInfo(settings.TIMEZONE)
+def _backend() -> CsvStore | SqliteStore:
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if settings.LOCAL_STORAGE == "csv":
+                    _store = CsvStore()
+                elif settings.LOCAL_STORAGE == "sqlite":
+                    _store = SqliteStore(settings.LOCAL_DB_FILE)
+                else:
+                    raise ValueError(f"Unknown LOCAL_STORAGE: {settings.LOCAL_STORAGE!r}")
+    return _store
 
 
 # ── базові операції ──
 def ensure_local_files() -> None:
-    for fname, hdr in (
-        (LOCAL_OFFICE_FILE, OFFICE_HEADERS),
-        (LOCAL_WAREHOUSE_FILE, WAREHOUSE_HEADERS),
-        (LOCAL_BUFFER_FILE, BUFFER_HEADERS),
-    ):
-        if not os.path.exists(fname):
-            with open(fname, "w", newline="", encoding="utf-8") as f:
-                csv.writer(f).writerow(hdr)
+    """Створює файли/схему бекенда (і мігрує старі дані, якщо треба)."""
+    _backend().ensure()
 
 
-def read_csv_file(filename: str):
-    try:
-        with open(filename, "r", newline="", encoding="utf-8") as f:
-            reader = csv.DictReader(f)
-            return reader.fieldnames, list(reader)
-    except Exception:
-        return None, []
+# ── high-water mark пушу warehouse -> Google ──
+def read_push_mark() -> int | None:
+    """Останній warehouse-row, що вже є в Google; None — якщо невідомо."""
+    return _backend().read_push_mark()
 
 
-def write_csv_file(filename: str, headers, rows) -> None:
-    with open(filename, "w", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=headers)
-        writer.writeheader()
-        writer.writerows(rows)
+def write_push_mark(row: int) -> None:
+    _backend().write_push_mark(row)
 
 
-def append_csv_row(filename: str, row, headers) -> None:
-    with open(filename, "a", newline="", encoding="utf-8") as f:
-        csv.DictWriter(f, fieldnames=headers).writerow(row)
+# ── буфер (Склад) ──
+def add_ttns_to_buffer(ttns, username: str, chat_id: str = "") -> None:
+    """Додає пакет ТТН+Username до буфера чату (ті, яких там ще немає) одним записом."""
+    _backend().add_ttns_to_buffer(ttns, username, chat_id)
 
 
-# ── буфер (Склад) ──
-def add_ttn_to_buffer(ttn: str, username: str) -> None:
-    """Додає ТТН+Username до буфера, якщо ще немає."""
-    _, buffer_rows = read_csv_file(LOCAL_BUFFER_FILE)
-    existing = {r["TTN"] for r in buffer_rows}
-    if ttn not in existing:
-        append_csv_row(LOCAL_BUFFER_FILE, {"TTN": ttn, "Username": username}, BUFFER_HEADERS)
-
-
-def clear_buffer() -> None:
-    write_csv_file(LOCAL_BUFFER_FILE, BUFFER_HEADERS, [])
-
-
-def merge_buffer_into_warehouse() -> None:
-    """Переносить нові ТТН з буфера у warehouse із продовженням індексації row."""
-    _, buffer_rows = read_csv_file(LOCAL_BUFFER_FILE)
-    _, warehouse_rows = read_csv_file(LOCAL_WAREHOUSE_FILE)
-    existing = {r["TTN"] for r in warehouse_rows}
-    next_row = max((int(r["row"]) for r in warehouse_rows), default=1) + 1
-    for entry in buffer_rows:
-        ttn = entry["TTN"]
-        if ttn not in existing:
-            now = datetime.now(_KIEV).strftime("%H:%M:%S")
-            append_csv_row(
-                LOCAL_WAREHOUSE_FILE,
-                {"row": str(next_row), "TTN": ttn, "Date": now, "Username": entry.get("Username", "")},
-                WAREHOUSE_HEADERS,
-            )
-            existing.add(ttn)
-            next_row += 1
+def buffer_chats() -> list[str]:
+    """Чати, у яких у буфері лишились ТТН (напр. після рестарту посеред вікна)."""
+    return _backend().buffer_chats()
+
+
+def take_buffer(chat_id: str) -> list[dict]:
+    """Атомарно забирає з буфера записи чату (решта чатів лишається)."""
+    return _backend().take_buffer(chat_id)
+
+
+# ── warehouse ──
+def merge_buffer_into_warehouse(entries) -> None:
+    """Переносить нові ТТН із записів буфера у warehouse із продовженням індексації row."""
+    _backend().merge_buffer_into_warehouse(entries)
+
+
+def replace_warehouse_rows(rows) -> None:
+    """Замінити warehouse дзеркалом Google, не загубивши ще не запушене.
+
+    Локальні рядки після high-water mark (mark невідомий — усі), яких іще
+    немає серед rows, лишаються й перенумеровуються після останнього рядка
+    Google; mark стає останнім рядком Google — наступний push їх допушить.
+    """
+    _backend().replace_warehouse_rows(rows)
+
+
+def warehouse_rows_after(row: int) -> list[dict]:
+    """Рядки warehouse з row > заданого (ще не запушені), за зростанням row."""
+    return _backend().warehouse_rows_after(row)
+
+
+# ── office ──
+def replace_office_rows(rows) -> None:
+    """Повна заміна office (після pull із Google)."""
+    _backend().replace_office_rows(rows)
+
+
+def append_office_rows(rows) -> None:
+    """Інкрементальне доповнення office новими рядками Google."""
+    if not rows:
+        return
+    _backend().append_office_rows(rows)
 
 
 # ── пошук/порівняння (Офіс) ──
 def find_office_row(ttn: str):
-    _, office_rows = read_csv_file(LOCAL_OFFICE_FILE)
-    for row in office_rows:
-        if row["TTN"] == ttn:
-            return row["row"]
-    return None
-
-
-def compare_buffer_with_office():
-    """Повертає (added, not_added) — ТТН з буфера, що (не)потрапили в office."""
-    _, buffer_rows = read_csv_file(LOCAL_BUFFER_FILE)
-    _, office_rows = read_csv_file(LOCAL_OFFICE_FILE)
-    office_ttns = {r["TTN"] for r in office_rows}
+    return _backend().find_office_rows([ttn])[0]
+
+
+def find_office_rows(ttns) -> list:
+    """Пакетний find_office_row (один виклик із потоку на весь пакет)."""
+    return _backend().find_office_rows(ttns)
+
+
+def compare_buffer_with_office(entries):
+    """Повертає (added, not_added) — ТТН із записів буфера, що (не)потрапили в office."""
+    present = _backend().office_ttns([e["TTN"] for e in entries])
     added, not_added = [], []
-    for entry in buffer_rows:
-        (added if entry["TTN"] in office_ttns else not_added).append(entry["TTN"])
+    for entry in entries:
+        (added if entry["TTN"] in present else not_added).append(entry["TTN"])
     return added, not_added
 
 
 def warehouse_office_diff():
     """ТТН, що є в warehouse, але відсутні в office (офлайн-діагностика)."""
-    _, warehouse_rows = read_csv_file(LOCAL_WAREHOUSE_FILE)
-    _, office_rows = read_csv_file(LOCAL_OFFICE_FILE)
-    return list({r["TTN"] for r in warehouse_rows} - {r["TTN"] for r in office_rows})
+    return _backend().warehouse_office_diff()
 
 
 def write_diff_file(missing) -> None:
@@ -124,10 +138,8 @@ def write_diff_file(missing) -> None:
 
 
 def count_office_ttn() -> int:
-    _, office_rows = read_csv_file(LOCAL_OFFICE_FILE)
-    return sum(1 for r in office_rows if r["TTN"].strip() != "")
+    return _backend().count_office_ttn()
 
 
 def clear_ttn_locals() -> None:
-    write_csv_file(LOCAL_OFFICE_FILE, OFFICE_HEADERS, [])
-    write_csv_file(LOCAL_WAREHOUSE_FILE, WAREHOUSE_HEADERS, [])
+    _backend().clear_ttn_locals()
@@ -0,0 +1,385 @@
+"""CSV-бекенд локального кешу (формат попередньої версії).
+
+Файли:
+  - local_office.csv     дзеркало таблиці ТТН для швидкого пошуку (роль Офіс)
+  - local_warehouse.csv  стейджинг із індексацією row перед пушем у Google (роль Склад)
+  - local_buffer.jsonl   журнал буфера ТТН, що чекають 5-секундної пакетної
+                         обробки (з chat_id: кожен чат Складу має власне вікно)
+плюс local_push_state.json — high-water mark: останній warehouse-row, який
+точно є в Google (усе, що після нього, ще треба допушити).
+
+Для пошуку (роль Офіс) поверх local_office.csv тримаємо in-memory індекс
+TTN -> row: будується один раз із даних pull-у (або ліниво з CSV після
+рестарту), тож пошук — O(1) без файлового IO; CSV лишається персистентним
+фолбеком. Так само для warehouse тримаємо множину ТТН і останній row —
+злиття буфера не перечитує файл і дописує всі нові рядки одним записом.
+
+Буфер живе в пам'яті (упорядкована множина ТТН на чат), а на диску — лише
+append-only журнал операцій add/take: вставка не парсить файл, а fsync
+групується — конкурентні записи ділять один fsync. На старті журнал
+програється; коли буфер спорожнів або журнал розрісся — компактується.
+Старий local_buffer.csv одноразово переноситься в журнал.
+"""
+import csv
+import json
+import logging
+import os
+import threading
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+from .. import settings
+
+log = logging.getLogger(__name__)
+
+LOCAL_OFFICE_FILE = "local_office.csv"
+LOCAL_WAREHOUSE_FILE = "local_warehouse.csv"
+LOCAL_BUFFER_FILE = "local_buffer.csv"  # формат попередньої версії (лише міграція)
+BUFFER_JOURNAL_FILE = "local_buffer.jsonl"
+PUSH_STATE_FILE = "local_push_state.json"
+
+OFFICE_HEADERS = ["row", "TTN", "Date", "Username"]
+WAREHOUSE_HEADERS = ["row", "TTN", "Date", "Username"]
+BUFFER_HEADERS = ["TTN", "Username", "Chat"]
+
+_KIEV = ZoneInfo(settings.TIMEZONE)
+_JOURNAL_COMPACT_RECORDS = 5000  # записів у журналі, після яких він переписується знімком
+
+
+class _OfficeIndex:
+    """TTN -> row (перше входження, як у лінійному пошуку) + к-сть непорожніх ТТН."""
+
+    def __init__(self, rows=()) -> None:
+        self.rows: dict[str, str] = {}
+        self.count = 0
+        self.add(rows)
+
+    def add(self, rows) -> None:
+        for r in rows:
+            ttn = r.get("TTN") or ""
+            if ttn.strip() == "":
+                continue
+            self.count += 1
+            self.rows.setdefault(ttn, r.get("row", ""))
+
+
+class _WarehouseIndex:
+    """Множина ТТН warehouse + останній row (для продовження індексації)."""
+
+    def __init__(self, rows=()) -> None:
+        self.ttns: set[str] = set()
+        self.last_row = 1  # заголовок
+        for r in rows:
+            self.ttns.add(r["TTN"])
+            self.last_row = max(self.last_row, int(r["row"]))
+
+
+class _BufferJournal:
+    """Буфер у пам'яті (chat -> {ttn: username}, порядок вставки) + append-only журнал.
+
+    Запис іде в ОС під _lock (порядок записів = порядок змін стану), а fsync —
+    окремо під _sync_lock: потік, що дочекався fsync, покриває й усі батчі,
+    записані до нього, тож решта очікувачів повертається без власного fsync.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.chats: dict[str, dict[str, str]] = {}
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._file = None
+        self._records = 0
+        self._written = 0  # батчів, записаних у файл
+        self._synced = 0   # батчів, покритих fsync
+
+    def load(self, legacy=()) -> None:
+        """Програти журнал (+ записи старого CSV-буфера) і переписати його знімком."""
+        with self._lock:
+            self.chats = {}
+            for entry in [*read_buffer_journal(self.path), *legacy]:
+                self.chats.setdefault(entry["Chat"], {}).setdefault(entry["TTN"], entry["Username"])
+            self._compact()
+        pending = sum(len(ttns) for ttns in self.chats.values())
+        if pending:
+            log.info("Replayed %d buffered TTN from journal.", pending)
+
+    def add(self, ttns, username: str, chat_id: str) -> None:
+        with self._lock:
+            chat = self.chats.setdefault(chat_id, {})
+            lines = []
+            for ttn in ttns:
+                if ttn not in chat:
+                    chat[ttn] = username
+                    lines.append(_journal_line({"op": "add", "chat": chat_id, "ttn": ttn, "user": username}))
+            if not chat:
+                del self.chats[chat_id]
+            if not lines:
+                return
+            seq = self._write(lines)
+        self._sync(seq)
+
+    def take(self, chat_id: str) -> list[dict]:
+        with self._lock:
+            chat = self.chats.pop(chat_id, None)
+            if not chat:
+                return []
+            if not self.chats or self._records >= _JOURNAL_COMPACT_RECORDS:
+                self._compact()  # порожній буфер -> порожній журнал
+                seq = None
+            else:
+                seq = self._write([_journal_line({"op": "take", "chat": chat_id})])
+        if seq is not None:
+            self._sync(seq)
+        return [{"TTN": ttn, "Username": username, "Chat": chat_id} for ttn, username in chat.items()]
+
+    def _write(self, lines: list[str]) -> int:
+        self._file.write("".join(lines))
+        self._file.flush()
+        self._records += len(lines)
+        self._written += 1
+        return self._written
+
+    def _sync(self, seq: int) -> None:
+        with self._sync_lock:
+            if self._synced >= seq:
+                return  # інший потік уже зробив fsync після нашого запису
+            target = self._written
+            os.fsync(self._file.fileno())
+            self._synced = target
+
+    def _compact(self) -> None:
+        """Знімок поточного стану замість історії операцій (викликати під _lock)."""
+        with self._sync_lock:
+            lines = [
+                _journal_line({"op": "add", "chat": chat_id, "ttn": ttn, "user": username})
+                for chat_id, chat in self.chats.items()
+                for ttn, username in chat.items()
+            ]
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.writelines(lines)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+            if self._file is not None:
+                self._file.close()
+            self._file = open(self.path, "a", encoding="utf-8")
+            self._records = len(lines)
+            self._synced = self._written
+
+
+def _journal_line(record: dict) -> str:
+    return json.dumps(record, ensure_ascii=False) + "\n"
+
+
+def read_buffer_journal(path: str = BUFFER_JOURNAL_FILE) -> list[dict]:
+    """Стан буфера з журналу (без побічних ефектів) — записи як у CSV-буфері."""
+    chats: dict[str, dict[str, str]] = {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            lines = f.readlines()
+    except FileNotFoundError:
+        return []
+    for line in lines:
+        try:
+            record = json.loads(line)
+            if record["op"] == "add":
+                chats.setdefault(record["chat"], {}).setdefault(record["ttn"], record["user"])
+            elif record["op"] == "take":
+                chats.pop(record["chat"], None)
+        except (ValueError, KeyError, TypeError):
+            continue  # обірваний останній рядок після падіння
+    return [
+        {"TTN": ttn, "Username": username, "Chat": chat_id}
+        for chat_id, chat in chats.items()
+        for ttn, username in chat.items()
+    ]
+
+
+def unpushed_tail(google_rows, local_rows, mark: int | None) -> tuple[list[dict], int]:
+    """Локальні рядки, яких ще немає в Google, з новими row після його останнього рядка.
+
+    Не запушене — row > mark (mark невідомий — будь-який рядок), причому
+    ТТН, що вже є в google_rows, відкидаються. Повертає (рядки, останній
+    row Google) — це і є новий mark. Спільне для обох бекендів.
+    """
+    last = max((int(r["row"]) for r in google_rows), default=1)
+    known = {r["TTN"] for r in google_rows}
+    tail = []
+    for r in local_rows:
+        if (mark is None or int(r["row"]) > mark) and r["TTN"] not in known:
+            known.add(r["TTN"])
+            tail.append({**r, "row": str(last + 1 + len(tail))})
+    return tail, last
+
+
+def read_csv_file(filename: str):
+    try:
+        with open(filename, "r", newline="", encoding="utf-8") as f:
+            reader = csv.DictReader(f)
+            return reader.fieldnames, list(reader)
+    except Exception:
+        return None, []
+
+
+def read_legacy_buffer() -> list[dict]:
+    """Записи буфера з local_buffer.csv попередньої версії (Chat може бути відсутній)."""
+    _, rows = read_csv_file(LOCAL_BUFFER_FILE)
+    return [
+        {"TTN": r["TTN"], "Username": r.get("Username") or "", "Chat": r.get("Chat") or ""}
+        for r in rows if r.get("TTN")
+    ]
+
+
+def write_csv_file(filename: str, headers, rows) -> None:
+    with open(filename, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=headers)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def append_csv_rows(filename: str, rows, headers) -> None:
+    with open(filename, "a", newline="", encoding="utf-8") as f:
+        csv.DictWriter(f, fieldnames=headers).writerows(rows)
+
+
+class CsvStore:
+    def __init__(self) -> None:
+        self._office_index: _OfficeIndex | None = None
+        self._office_lock = threading.Lock()
+        self._warehouse_index: _WarehouseIndex | None = None
+        # warehouse змінюється з кількох потоків (паралельні флеші різних чатів)
+        self._warehouse_lock = threading.Lock()
+        self._buffer = _BufferJournal(BUFFER_JOURNAL_FILE)
+
+    def _office(self) -> _OfficeIndex:
+        """Поточний індекс office; після рестарту ліниво відновлюється з CSV."""
+        index = self._office_index
+        if index is None:
+            with self._office_lock:
+                if self._office_index is None:
+                    _, office_rows = read_csv_file(LOCAL_OFFICE_FILE)
+                    self._office_index = _OfficeIndex(office_rows)
+                index = self._office_index
+        return index
+
+    def _warehouse(self) -> _WarehouseIndex:
+        """Індекс warehouse (викликати під _warehouse_lock); ліниво з CSV."""
+        if self._warehouse_index is None:
+            _, warehouse_rows = read_csv_file(LOCAL_WAREHOUSE_FILE)
+            self._warehouse_index = _WarehouseIndex(warehouse_rows)
+        return self._warehouse_index
+
+    # ── базові операції ──
+    def ensure(self) -> None:
+        for fname, hdr in (
+            (LOCAL_OFFICE_FILE, OFFICE_HEADERS),
+            (LOCAL_WAREHOUSE_FILE, WAREHOUSE_HEADERS),
+        ):
+            if not os.path.exists(fname):
+                with open(fname, "w", newline="", encoding="utf-8") as f:
+                    csv.writer(f).writerow(hdr)
+        legacy = read_legacy_buffer()
+        self._buffer.load(legacy)
+        if os.path.exists(LOCAL_BUFFER_FILE):
+            os.remove(LOCAL_BUFFER_FILE)  # уже в журналі
+            log.info("Moved %d TTN from %s to buffer journal.", len(legacy), LOCAL_BUFFER_FILE)
+
+    # ── high-water mark пушу warehouse -> Google ──
+    def read_push_mark(self) -> int | None:
+        try:
+            with open(PUSH_STATE_FILE, "r", encoding="utf-8") as f:
+                return int(json.load(f)["row"])
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def write_push_mark(self, row: int) -> None:
+        tmp = PUSH_STATE_FILE + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"row": row}, f)
+        os.replace(tmp, PUSH_STATE_FILE)  # атомарно: або старий, або новий mark
+
+    # ── буфер (Склад) ──
+    def add_ttns_to_buffer(self, ttns, username: str, chat_id: str) -> None:
+        self._buffer.add(ttns, username, chat_id)
+
+    def buffer_chats(self) -> list[str]:
+        return list(self._buffer.chats)
+
+    def take_buffer(self, chat_id: str) -> list[dict]:
+        return self._buffer.take(chat_id)
+
+    # ── warehouse ──
+    def merge_buffer_into_warehouse(self, entries) -> None:
+        with self._warehouse_lock:
+            index = self._warehouse()
+            now = datetime.now(_KIEV).strftime("%H:%M:%S")
+            new_rows = []
+            for entry in entries:
+                ttn = entry["TTN"]
+                if ttn not in index.ttns:
+                    index.ttns.add(ttn)
+                    index.last_row += 1
+                    new_rows.append(
+                        {"row": str(index.last_row), "TTN": ttn, "Date": now, "Username": entry.get("Username", "")}
+                    )
+            if new_rows:
+                append_csv_rows(LOCAL_WAREHOUSE_FILE, new_rows, WAREHOUSE_HEADERS)
+
+    def replace_warehouse_rows(self, rows) -> None:
+        with self._warehouse_lock:
+            _, local_rows = read_csv_file(LOCAL_WAREHOUSE_FILE)
+            tail, last = unpushed_tail(rows, local_rows, self.read_push_mark())
+            rows = list(rows) + tail
+            write_csv_file(LOCAL_WAREHOUSE_FILE, WAREHOUSE_HEADERS, rows)
+            self._warehouse_index = _WarehouseIndex(rows)
+            self.write_push_mark(last)
+
+    def warehouse_rows_after(self, row: int) -> list[dict]:
+        _, warehouse_rows = read_csv_file(LOCAL_WAREHOUSE_FILE)
+        pending = []
+        for entry in warehouse_rows:
+            try:
+                if int(entry["row"]) > row:
+                    pending.append(entry)
+            except (KeyError, ValueError):
+                continue
+        return pending
+
+    # ── office: запис + індекс ──
+    def replace_office_rows(self, rows) -> None:
+        index = _OfficeIndex(rows)
+        with self._office_lock:
+            write_csv_file(LOCAL_OFFICE_FILE, OFFICE_HEADERS, rows)
+            self._office_index = index
+
+    def append_office_rows(self, rows) -> None:
+        index = self._office()
+        with self._office_lock:
+            append_csv_rows(LOCAL_OFFICE_FILE, rows, OFFICE_HEADERS)
+            index.add(rows)
+
+    # ── пошук/порівняння (Офіс) ──
+    def find_office_rows(self, ttns) -> list:
+        rows = self._office().rows
+        return [rows.get(ttn) for ttn in ttns]
+
+    def office_ttns(self, ttns) -> set[str]:
+        rows = self._office().rows
+        return {ttn for ttn in ttns if ttn in rows}
+
+    def warehouse_office_diff(self) -> list[str]:
+        _, warehouse_rows = read_csv_file(LOCAL_WAREHOUSE_FILE)
+        office_ttns = self._office().rows
+        return list({r["TTN"] for r in warehouse_rows if r["TTN"] not in office_ttns})
+
+    def count_office_ttn(self) -> int:
+        return self._office().count
+
+    def clear_ttn_locals(self) -> None:
+        self.replace_office_rows([])
+        # не replace_warehouse_rows: той зберігає не запушене, а тут нова доба з нуля
+        with self._warehouse_lock:
+            write_csv_file(LOCAL_WAREHOUSE_FILE, WAREHOUSE_HEADERS, [])
+            self._warehouse_index = _WarehouseIndex()
+            self.write_push_mark(1)  # у Google лишився тільки заголовок
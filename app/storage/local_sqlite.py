@@ -0,0 +1,240 @@
+"""SQLite-бекенд локального кешу (WAL): ті самі операції, що й CSV, але
+без перечитування файлів — індекси по TTN, транзакційні злиття й різниці
+множин прямо в SQL. Вартість операції не росте з обсягом дня, а запис
+переживає падіння процесу посеред операції.
+
+Кожен потік пулу disk (executors.py) має власне з'єднання; WAL дає читачам не
+блокувати письменника, а busy_timeout — дочекатись, поки інший потік
+завершить транзакцію.
+
+При першому запуску одноразово імпортує наявні CSV (local_office.csv,
+local_warehouse.csv, буфер local_buffer.csv/.jsonl, local_push_state.json).
+"""
+import logging
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+from .. import settings
+from . import local_csv
+
+log = logging.getLogger(__name__)
+
+_KIEV = ZoneInfo(settings.TIMEZONE)
+_IN_CHUNK = 500  # параметрів в одному IN (...) — з запасом під ліміт SQLite
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS office (
+    row INTEGER PRIMARY KEY, ttn TEXT NOT NULL, date TEXT NOT NULL DEFAULT '',
+    username TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS office_ttn ON office (ttn);
+CREATE TABLE IF NOT EXISTS warehouse (
+    row INTEGER PRIMARY KEY, ttn TEXT NOT NULL, date TEXT NOT NULL DEFAULT '',
+    username TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS warehouse_ttn ON warehouse (ttn);
+CREATE TABLE IF NOT EXISTS buffer (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT, chat TEXT NOT NULL, ttn TEXT NOT NULL,
+    username TEXT NOT NULL DEFAULT '', UNIQUE (chat, ttn)
+);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+"""
+
+
+def _row_dict(row) -> dict:
+    return {"row": str(row[0]), "TTN": row[1], "Date": row[2], "Username": row[3]}
+
+
+def _chunks(items: list, size: int = _IN_CHUNK):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+class SqliteStore:
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._local = threading.local()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # isolation_level=None: транзакції відкриваємо явно (BEGIN IMMEDIATE)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")  # у WAL — без втрат при падінні процесу
+            self._local.conn = conn
+        return conn
+
+    def _tx(self):
+        return _Transaction(self._conn())
+
+    # ── базові операції ──
+    def ensure(self) -> None:
+        conn = self._conn()
+        conn.executescript(_SCHEMA)
+        if conn.execute("SELECT 1 FROM meta WHERE key = 'migrated'").fetchone() is None:
+            self._migrate_from_csv()
+
+    def _migrate_from_csv(self) -> None:
+        """Одноразовий імпорт CSV-кешу попередніх версій."""
+        _, office = local_csv.read_csv_file(local_csv.LOCAL_OFFICE_FILE)
+        _, warehouse = local_csv.read_csv_file(local_csv.LOCAL_WAREHOUSE_FILE)
+        buffer = local_csv.read_legacy_buffer() + local_csv.read_buffer_journal()
+        mark = local_csv.CsvStore().read_push_mark() if os.path.exists(local_csv.PUSH_STATE_FILE) else None
+        with self._tx() as conn:
+            for table, rows in (("office", office), ("warehouse", warehouse)):
+                conn.executemany(
+                    f"INSERT OR REPLACE INTO {table} (row, ttn, date, username) VALUES (?, ?, ?, ?)",
+                    [(int(r["row"]), r.get("TTN") or "", r.get("Date") or "", r.get("Username") or "")
+                     for r in rows if (r.get("row") or "").isdigit()],
+                )
+            conn.executemany(
+                "INSERT OR IGNORE INTO buffer (chat, ttn, username) VALUES (?, ?, ?)",
+                [(r["Chat"], r["TTN"], r["Username"]) for r in buffer],
+            )
+            if mark is not None:
+                conn.execute("INSERT OR REPLACE INTO meta VALUES ('push_mark', ?)", (str(mark),))
+            conn.execute("INSERT OR REPLACE INTO meta VALUES ('migrated', '1')")
+        if office or warehouse or buffer:
+            log.info("Migrated CSV cache to SQLite: office=%d warehouse=%d buffer=%d",
+                     len(office), len(warehouse), len(buffer))
+
+    # ── high-water mark ──
+    def read_push_mark(self) -> int | None:
+        row = self._conn().execute("SELECT value FROM meta WHERE key = 'push_mark'").fetchone()
+        return int(row[0]) if row else None
+
+    def write_push_mark(self, row: int, conn: sqlite3.Connection | None = None) -> None:
+        (conn or self._conn()).execute(
+            "INSERT OR REPLACE INTO meta VALUES ('push_mark', ?)", (str(row),)
+        )
+
+    # ── буфер (Склад) ──
+    def add_ttns_to_buffer(self, ttns, username: str, chat_id: str) -> None:
+        with self._tx() as conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO buffer (chat, ttn, username) VALUES (?, ?, ?)",
+                [(chat_id, ttn, username) for ttn in ttns],
+            )
+
+    def buffer_chats(self) -> list[str]:
+        rows = self._conn().execute("SELECT chat FROM buffer GROUP BY chat ORDER BY MIN(seq)")
+        return [r[0] for r in rows]
+
+    def take_buffer(self, chat_id: str) -> list[dict]:
+        with self._tx() as conn:
+            rows = conn.execute(
+                "SELECT ttn, username FROM buffer WHERE chat = ? ORDER BY seq", (chat_id,)
+            ).fetchall()
+            conn.execute("DELETE FROM buffer WHERE chat = ?", (chat_id,))
+        return [{"TTN": ttn, "Username": username, "Chat": chat_id} for ttn, username in rows]
+
+    # ── warehouse ──
+    def merge_buffer_into_warehouse(self, entries) -> None:
+        entries = list(entries)
+        if not entries:
+            return
+        now = datetime.now(_KIEV).strftime("%H:%M:%S")
+        with self._tx() as conn:
+            existing = set()
+            for chunk in _chunks([e["TTN"] for e in entries]):
+                marks = ",".join("?" * len(chunk))
+                existing.update(r[0] for r in conn.execute(
+                    f"SELECT ttn FROM warehouse WHERE ttn IN ({marks})", chunk
+                ))
+            next_row = conn.execute("SELECT COALESCE(MAX(row), 1) + 1 FROM warehouse").fetchone()[0]
+            new_rows = []
+            for entry in entries:
+                if entry["TTN"] in existing:
+                    continue
+                existing.add(entry["TTN"])
+                new_rows.append((next_row, entry["TTN"], now, entry.get("Username", "")))
+                next_row += 1
+            conn.executemany(
+                "INSERT INTO warehouse (row, ttn, date, username) VALUES (?, ?, ?, ?)", new_rows
+            )
+
+    def replace_warehouse_rows(self, rows) -> None:
+        with self._tx() as conn:
+            local_rows = [_row_dict(r) for r in conn.execute(
+                "SELECT row, ttn, date, username FROM warehouse ORDER BY row"
+            )]
+            tail, last = local_csv.unpushed_tail(rows, local_rows, self.read_push_mark())
+            conn.execute("DELETE FROM warehouse")
+            conn.executemany(
+                "INSERT OR REPLACE INTO warehouse (row, ttn, date, username) VALUES (?, ?, ?, ?)",
+                [(int(r["row"]), r["TTN"], r["Date"], r["Username"]) for r in list(rows) + tail],
+            )
+            self.write_push_mark(last, conn)
+
+    def warehouse_rows_after(self, row: int) -> list[dict]:
+        rows = self._conn().execute(
+            "SELECT row, ttn, date, username FROM warehouse WHERE row > ? ORDER BY row", (row,)
+        )
+        return [_row_dict(r) for r in rows]
+
+    # ── office ──
+    def replace_office_rows(self, rows) -> None:
+        with self._tx() as conn:
+            conn.execute("DELETE FROM office")
+            self._insert_office(conn, rows)
+
+    def append_office_rows(self, rows) -> None:
+        with self._tx() as conn:
+            self._insert_office(conn, rows)
+
+    @staticmethod
+    def _insert_office(conn, rows) -> None:
+        conn.executemany(
+            "INSERT OR REPLACE INTO office (row, ttn, date, username) VALUES (?, ?, ?, ?)",
+            [(int(r["row"]), r["TTN"], r["Date"], r["Username"]) for r in rows],
+        )
+
+    # ── пошук/порівняння (Офіс) ──
+    def find_office_rows(self, ttns) -> list:
+        ttns = list(ttns)
+        found: dict[str, str] = {}
+        conn = self._conn()
+        for chunk in _chunks(ttns):
+            marks = ",".join("?" * len(chunk))
+            for ttn, row in conn.execute(
+                f"SELECT ttn, MIN(row) FROM office WHERE ttn IN ({marks}) GROUP BY ttn", chunk
+            ):
+                found[ttn] = str(row)
+        return [found.get(ttn) for ttn in ttns]
+
+    def office_ttns(self, ttns) -> set[str]:
+        return {ttn for ttn, row in zip(ttns, self.find_office_rows(ttns)) if row is not None}
+
+    def warehouse_office_diff(self) -> list[str]:
+        rows = self._conn().execute(
+            "SELECT DISTINCT w.ttn FROM warehouse w "
+            "WHERE NOT EXISTS (SELECT 1 FROM office o WHERE o.ttn = w.ttn)"
+        )
+        return [r[0] for r in rows]
+
+    def count_office_ttn(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM office WHERE trim(ttn) != ''").fetchone()[0]
+
+    def clear_ttn_locals(self) -> None:
+        with self._tx() as conn:
+            conn.execute("DELETE FROM office")
+            conn.execute("DELETE FROM warehouse")
+            self.write_push_mark(1, conn)  # у Google лишився тільки заголовок
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT/ROLLBACK: запис одразу бере write-lock (без deadlock-ів апгрейду)."""
+
+    def __init__(self, conn: sqlite3.Connection) -> None:
+        self.conn = conn
+
+    def __enter__(self) -> sqlite3.Connection:
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
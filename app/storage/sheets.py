@@ -1,121 +1,464 @@
-"""Обгортка над двома Google-таблицями (gspread + google-auth).
+"""Обгортка над двома Google-таблицями (async-клієнт sheets_client.py).
 
-Усі методи синхронні/блокуючі — викликати з async-коду через
-asyncio.to_thread(...). Містить також мости Google <-> локальний CSV-кеш.
+Методи асинхронні: мережа — через спільну aiohttp-сесію, локальний кеш —
+через пул disk (executors.py). Хендли таблиць відкриваються один раз (connect) і
+живуть увесь процес. Містить також мости Google <-> локальний кеш.
+
+Стійкість до збоїв Google:
+  - кожен виклик API має таймаут і повтори з експоненційним backoff із
+    jitter для тимчасових помилок (429, 5xx, мережа); append-и (не
+    ідемпотентні) повторюються лише на 429 — їх точно не виконано;
+  - операції йдуть через circuit breaker: після SHEETS_BREAKER_THRESHOLD
+    невдач поспіль він відкривається і виклики одразу падають
+    SheetsUnavailable, без очікування таймаутів; після cooldown одна пробна
+    операція вирішує, закритись чи чекати вдвічі довше;
+  - черга повтору — те, що вже персистентно лежить локально: warehouse-рядки
+    після high-water mark і журнал users. Слухачі on_state (main) при
+    закритті breaker-а допушують їх одразу, крон — періодично.
+
+Office тягнеться дельтами: пам'ятаємо, скільки рядків уже віддзеркалено і
+що лежить в останньому з них. Один batch_get бере цей рядок (перевірка, що
+таблицю не правили/не чистили вручну) і все після нього; збіг -> локально
+дописуються лише нові рядки, розбіжність -> повний pull.
 """
+import asyncio
+import functools
 import json
 import logging
 import os
+import random
+import re
+import time
 
-import gspread
-from google.oauth2.service_account import Credentials
+import aiohttp
 
-from .. import settings
+from .. import executors, metrics, settings
 from . import local_cache as lc
+from .sheets_client import AsyncSheetsClient, SheetsAPIError
 
 log = logging.getLogger(__name__)
 
+# "'Аркуш1'!A12:C14" -> 12 (перший рядок, куди лягли дані append_rows)
+_RANGE_START_RE = re.compile(r"![A-Z]+(\d+)")
+
+_CALL_SECONDS = metrics.histogram(
+    "sheets_call_seconds", "Тривалість операцій з Google Sheets", ("method",)
+)
+_CALL_ERRORS = metrics.counter(
+    "sheets_call_errors_total",
+    "Невдалі операції з Google Sheets (rejected — відхилені відкритим breaker-ом)",
+    ("method", "kind"),
+)
+_RETRIES = metrics.counter("sheets_retries_total", "Повтори викликів Google API", ("reason",))
+
+_RETRY_BASE_SECONDS = 0.5
+_RETRY_MAX_SECONDS = 8.0
+_BREAKER_MAX_COOLDOWN_SECONDS = 300
+
+
+class SheetsUnavailable(RuntimeError):
+    """Breaker відкритий — Google зараз не викликаємо."""
+
+
+def _transient(error: Exception) -> bool:
+    """Тимчасова помилка: є сенс повторити / це ознака недоступності Google."""
+    if isinstance(error, SheetsAPIError):
+        return error.status == 429 or error.status >= 500
+    return isinstance(error, (aiohttp.ClientError, asyncio.TimeoutError))
+
+
+def _retry_delay(attempt: int, error: Exception) -> float:
+    """Retry-After для 429, інакше full jitter: U(0, base * 2^attempt)."""
+    if isinstance(error, SheetsAPIError) and error.retry_after.isdigit():
+        return min(float(error.retry_after), _RETRY_MAX_SECONDS)
+    return random.uniform(0, min(_RETRY_MAX_SECONDS, _RETRY_BASE_SECONDS * 2 ** attempt))
+
+
+class CircuitBreaker:
+    """closed -> (threshold невдач поспіль) -> open -> (cooldown) -> half_open.
+
+    У half_open пропускається одна пробна операція: успіх закриває breaker,
+    невдача знову відкриває його з подвоєним cooldown (до 5 хв). Слухачі
+    отримують "open" / "closed" лише на переходах між доступністю й
+    недоступністю, синхронно в event loop: усі операції Sheets — корутини,
+    тож стан змінюється лише з циклу і блокування не потрібні.
+    """
+
+    def __init__(self, threshold: int, cooldown: float) -> None:
+        self.threshold = threshold
+        self.base_cooldown = cooldown
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.last_error: str | None = None
+        self._probing = False
+        self._listeners = []
+
+    def on_state(self, callback) -> None:
+        self._listeners.append(callback)
+
+    def allow(self) -> None:
+        if self.state == "closed":
+            return
+        remaining = self.opened_at + self.cooldown - time.monotonic()
+        if self.state == "open" and remaining <= 0:
+            self.state = "half_open"
+            self._probing = False
+        if self.state == "half_open" and not self._probing:
+            self._probing = True
+            return
+        raise SheetsUnavailable(
+            f"Google Sheets unavailable (circuit {self.state}, retry in {max(remaining, 0):.0f}s): "
+            f"{self.last_error}"
+        )
+
+    def success(self) -> None:
+        recovered = self.state != "closed"
+        self.state = "closed"
+        self.failures = 0
+        self.cooldown = self.base_cooldown
+        self._probing = False
+        if recovered:
+            self._emit("closed")
+
+    def failure(self, error: Exception) -> None:
+        self.failures += 1
+        self.last_error = f"{type(error).__name__}: {error}"
+        if self.state == "half_open":
+            self.cooldown = min(self.cooldown * 2, _BREAKER_MAX_COOLDOWN_SECONDS)
+        elif self.state == "open" or self.failures < self.threshold:
+            return
+        opened = self.state == "closed"
+        self.state = "open"
+        self.opened_at = time.monotonic()
+        self._probing = False
+        log.warning("Sheets circuit open for %.0fs after %d failures: %s",
+                    self.cooldown, self.failures, self.last_error)
+        if opened:
+            self._emit("open")
+
+    def abandon(self) -> None:
+        """Операцію скасовано (CancelledError) до відповіді: пробу віддати наступному виклику."""
+        self._probing = False
+
+    def snapshot(self) -> dict:
+        retry_in = self.opened_at + self.cooldown - time.monotonic() if self.state == "open" else 0
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "retry_in": max(0, round(retry_in)),
+            "last_error": self.last_error,
+        }
+
+    def _emit(self, state: str) -> None:
+        for callback in self._listeners:
+            try:
+                callback(state)
+            except Exception as e:  # noqa: BLE001
+                log.error("Sheets state listener failed: %s", e)
+
+
+def _guarded(fn):
+    """Операція Sheets: breaker + латентність/помилки під міткою method=<ім'я>."""
+
+    @functools.wraps(fn)
+    async def wrapper(self, *args, **kwargs):
+        try:
+            self.breaker.allow()
+        except SheetsUnavailable:
+            _CALL_ERRORS.inc(method=fn.__name__, kind="rejected")
+            raise
+        started = time.perf_counter()
+        try:
+            result = await fn(self, *args, **kwargs)
+        except Exception as e:
+            transient = _transient(e)
+            _CALL_ERRORS.inc(method=fn.__name__, kind="transient" if transient else "error")
+            if transient:
+                self.breaker.failure(e)
+            else:
+                self.breaker.success()  # Google відповів — сервіс доступний
+            raise
+        except BaseException:
+            self.breaker.abandon()  # скасування — не успіх і не збій, але проба не повинна зависнути
+            raise
+        else:
+            self.breaker.success()
+            return result
+        finally:
+            _CALL_SECONDS.observe(time.perf_counter() - started, method=fn.__name__)
+
+    return wrapper
+
+
 _SCOPES = [
     "https://www.googleapis.com/auth/spreadsheets",
     "https://www.googleapis.com/auth/drive",
 ]
 
 
-def _load_credentials() -> Credentials:
-    """Креди з env-змінної (вміст JSON) або з файлу за шляхом."""
+def _load_credentials() -> dict:
+    """JSON-ключ сервісного акаунта з env-змінної (вміст) або з файлу за шляхом."""
     raw = settings.GOOGLE_SHEETS_CREDENTIALS_JSON
     if raw:
-        return Credentials.from_service_account_info(json.loads(raw), scopes=_SCOPES)
+        return json.loads(raw)
     path = settings.GOOGLE_SHEETS_CREDENTIALS
     if path:
         # Render монтує Secret Files у /etc/secrets/ — пробуємо і там за іменем файлу.
         for candidate in (path, os.path.join(settings.SECRETS_DIR, os.path.basename(path))):
             if os.path.exists(candidate):
-                return Credentials.from_service_account_file(candidate, scopes=_SCOPES)
+                with open(candidate, "r", encoding="utf-8") as f:
+                    return json.load(f)
     raise RuntimeError(
         "Не задано облікові дані Google. Вкажіть GOOGLE_SHEETS_CREDENTIALS_JSON "
         "(вміст JSON-ключа, зручно для Render) або GOOGLE_SHEETS_CREDENTIALS (шлях до файлу)."
     )
 
 
+def _ttn_row(i: int, row) -> dict:
+    return {
+        "row": str(i),
+        "TTN": row[0] if len(row) > 0 else "",
+        "Date": row[1] if len(row) > 1 else "",
+        "Username": row[2] if len(row) > 2 else "",
+    }
+
+
+def _norm(row) -> list[str]:
+    """Рядок A:C без хвостових порожніх клітинок (так їх віддає API)."""
+    cells = [str(c) for c in list(row)[:3]]
+    while cells and cells[-1] == "":
+        cells.pop()
+    return cells
+
+
 class Sheets:
     def __init__(self) -> None:
         self.client = None
         self.ttn = None      # worksheet таблиці ТТН
         self.users = None    # worksheet таблиці користувачів
+        # стан дельта-синку office: (к-сть рядків із заголовком, вміст останнього A:C)
+        self._office_synced: tuple[int, list[str]] | None = None
+        self._drive_ok = True  # False — Drive API недоступний, ревізії за відбитком аркуша
+        # таблиця -> ревізія, яку вже відображає локальний стан (pull або власний запис)
+        self.revisions: dict[str, str] = {}
+        # push і pull таблиці ТТН не перетинаються: pull, що прочитав таблицю до
+        # паралельного push, інакше записав би застарілий mark
+        self._ttn_lock = asyncio.Lock()
+        self.breaker = CircuitBreaker(settings.SHEETS_BREAKER_THRESHOLD, settings.SHEETS_BREAKER_COOLDOWN_SECONDS)
+        metrics.callback("sheets_circuit_open", "Breaker Google Sheets: 0 closed, 0.5 half_open, 1 open",
+                         lambda: {"closed": 0, "half_open": 0.5, "open": 1}[self.breaker.state])
+
+    @staticmethod
+    async def _api(fn, *args, idempotent: bool = True, **kwargs):
+        """Виклик API із повторами тимчасових помилок (не-ідемпотентні — лише 429)."""
+        for attempt in range(settings.SHEETS_RETRIES + 1):
+            try:
+                return await fn(*args, **kwargs)
+            except Exception as e:
+                rate_limited = isinstance(e, SheetsAPIError) and e.status == 429
+                if attempt == settings.SHEETS_RETRIES or not (rate_limited or (idempotent and _transient(e))):
+                    raise
+                delay = _retry_delay(attempt, e)
+                _RETRIES.inc(reason="429" if rate_limited else type(e).__name__)
+                log.info("Sheets call %s failed (%s), retry %d in %.1fs.",
+                         getattr(fn, "__name__", fn), e, attempt + 1, delay)
+                await asyncio.sleep(delay)
 
-    def connect(self) -> None:
-        creds = _load_credentials()
-        self.client = gspread.authorize(creds)
-        self.ttn = self.client.open_by_url(settings.GOOGLE_SHEET_URL).sheet1
-        self.users = self.client.open_by_url(settings.GOOGLE_SHEET_URL_USERS).sheet1
+    @_guarded
+    async def connect(self) -> None:
+        """Відкрити обидві таблиці; вже відкриті хендли не перевідкриваються."""
+        if self.ttn is not None and self.users is not None:
+            return
+        if self.client is None:
+            self.client = AsyncSheetsClient(
+                _load_credentials(), _SCOPES, settings.SHEETS_TIMEOUT_SECONDS, settings.SHEETS_MAX_CONNECTIONS
+            )
+        if self.ttn is None:
+            self.ttn = await self._api(self.client.open_by_url, settings.GOOGLE_SHEET_URL)
+        if self.users is None:
+            self.users = await self._api(self.client.open_by_url, settings.GOOGLE_SHEET_URL_USERS)
         log.info("Google Sheets connected.")
 
+    async def close(self) -> None:
+        if self.client is not None:
+            await self.client.close()
+
     # ── таблиця ТТН ──
-    def push_warehouse_to_google(self) -> None:
-        """Пушить локальні warehouse-рядки з індексом більшим за останній у Google."""
-        records = self.ttn.get_all_values()
-        last_google_row = len(records)  # враховуючи заголовок
-        _, warehouse_rows = lc.read_csv_file(lc.LOCAL_WAREHOUSE_FILE)
-        for entry in warehouse_rows:
+    @_guarded
+    async def push_warehouse_to_google(self) -> None:
+        """Пушить одним append_rows усі warehouse-рядки після high-water mark.
+
+        Mark зберігається локально, тож пакет будь-якого розміру коштує один
+        запит. Якщо mark ще невідомий (перший запуск, втрачений стан) —
+        одне читання колонки A: пушиться все, чого в ній немає.
+        Результат звіряємо з відповіддю API; при розбіжності — RuntimeError,
+        mark не рухається і рядки допушаться наступного разу.
+        """
+        async with self._ttn_lock:
+            await self._push_warehouse()
+
+    async def _push_warehouse(self) -> None:
+        mark = await executors.run(executors.DISK, lc.read_push_mark)
+        rows = await executors.run(executors.DISK, lc.warehouse_rows_after, mark or 1)
+        if mark is None:
+            in_google = set(await self._api(self.ttn.col_values, 1))
+            new_mark = max((int(e["row"]) for e in rows), default=1)
+            rows = [e for e in rows if e["TTN"] not in in_google]
+        pending = [(int(e["row"]), e) for e in rows]
+        if not pending:
+            if mark is None:
+                await executors.run(executors.DISK, lc.write_push_mark, new_mark)
+            return
+
+        response = await self._api(
+            self.ttn.append_rows, [[e["TTN"], e["Date"], e["Username"]] for _, e in pending],
+            idempotent=False,
+        )
+        updates = (response or {}).get("updates", {})
+        if updates.get("updatedRows") != len(pending):
+            raise RuntimeError(
+                f"Google appended {updates.get('updatedRows')} rows instead of {len(pending)}"
+            )
+        match = _RANGE_START_RE.search(updates.get("updatedRange", ""))
+        if match and int(match.group(1)) != pending[0][0]:
+            # хтось писав у таблицю паралельно — індекси вирівняє наступний pull
+            log.warning(
+                "Warehouse rows landed at row %s instead of %s.", match.group(1), pending[0][0]
+            )
+        # mark був невідомий: решта рядків до new_mark уже є в колонці A
+        last = max(row_num for row_num, _ in pending) if mark is not None else new_mark
+        await executors.run(executors.DISK, lc.write_push_mark, last)
+        log.info("Pushed %d TTN rows to Google Sheet in one request.", len(pending))
+        await self._own_write("ttn")
+
+    @staticmethod
+    def pending_push_rows() -> int:
+        """Скільки warehouse-рядків чекає пушу (черга повтору); mark невідомий — усі."""
+        return len(lc.warehouse_rows_after(lc.read_push_mark() or 1))
+
+    @_guarded
+    async def pull_office_to_local(self, full: bool = False) -> None:
+        """Оновити office із Google: дельтою, якщо можна, інакше повністю."""
+        if not full and self._office_synced is not None and await self._pull_office_delta():
+            return
+        records = await self._api(self.ttn.get_all_values)  # включно із заголовком
+        await executors.run(executors.DISK, lc.replace_office_rows, self._ttn_rows(records))
+        self._office_synced = (len(records), _norm(records[-1]) if records else [])
+
+    async def _pull_office_delta(self) -> bool:
+        """Дописати в office лише нові рядки; False — якщо потрібен повний pull."""
+        known, last = self._office_synced
+        if known < 1:
+            return False
+        anchor, tail = await self._api(self.ttn.batch_get, [f"A{known}:C{known}", f"A{known + 1}:C"])
+        if _norm(anchor[0] if anchor else []) != last:
+            log.info("TTN sheet changed above row %s, falling back to full pull.", known + 1)
+            return False
+        tail = list(tail)
+        if tail:
+            rows = [_ttn_row(known + 1 + i, row) for i, row in enumerate(tail)]
+            await executors.run(executors.DISK, lc.append_office_rows, rows)
+            self._office_synced = (known + len(tail), _norm(tail[-1]))
+            log.info("Office delta pull: %d new rows.", len(tail))
+        return True
+
+    @_guarded
+    async def revision(self, sheet: str) -> str:
+        """Ревізія таблиці "ttn" або "users" — змінюється разом із вмістом.
+
+        Версія файла з Drive ловить будь-яку правку. Якщо Drive API вимкнено
+        для проєкту (403/404) — відбиток аркуша (колонка A + хвіст): він
+        бачить додані/видалені рядки, але не ручну правку посеред рядка.
+        """
+        return await self._revision(sheet)
+
+    async def _revision(self, sheet: str) -> str:
+        worksheet = self.ttn if sheet == "ttn" else self.users
+        if self._drive_ok:
             try:
-                row_num = int(entry["row"])
-            except (KeyError, ValueError):
-                continue
-            if row_num > last_google_row:
-                self.ttn.append_row([entry["TTN"], entry["Date"], entry["Username"]])
-                log.info("Pushed TTN %s (row %s) to Google Sheet.", entry["TTN"], row_num)
-
-    def pull_office_to_local(self) -> None:
-        lc.write_csv_file(lc.LOCAL_OFFICE_FILE, lc.OFFICE_HEADERS, self._ttn_rows())
-
-    def pull_warehouse_to_local(self) -> None:
-        lc.write_csv_file(lc.LOCAL_WAREHOUSE_FILE, lc.WAREHOUSE_HEADERS, self._ttn_rows())
-
-    def _ttn_rows(self):
-        records = self.ttn.get_all_values()  # включно із заголовком
-        rows = []
-        for i, row in enumerate(records, start=1):
-            if i == 1:
-                continue  # пропускаємо заголовок
-            rows.append({
-                "row": str(i),
-                "TTN": row[0] if len(row) > 0 else "",
-                "Date": row[1] if len(row) > 1 else "",
-                "Username": row[2] if len(row) > 2 else "",
-            })
-        return rows
-
-    def clear_ttn(self) -> None:
+                return "drive:" + await self._api(worksheet.revision)
+            except SheetsAPIError as e:
+                if e.status not in (403, 404):
+                    raise
+                if self._drive_ok:  # обидві таблиці перевіряються паралельно — пишемо раз
+                    log.warning("Drive API unavailable (%s), using sheet fingerprints for change detection.", e)
+                self._drive_ok = False
+        return "tail:" + await self._api(worksheet.fingerprint)
+
+    async def _own_write(self, sheet: str) -> None:
+        """Після власного запису: запам'ятати нову ревізію, щоб refresh не вважав її чужою правкою.
+
+        Лише якщо ревізію вже відстежуємо (був pull). Чужа правка, що
+        вклинилась між записом і цим читанням, дочекається безумовного pull.
+        Не вдалося прочитати — ревізію забуваємо: наступний refresh перечитає.
+        """
+        if sheet not in self.revisions:
+            return
+        try:
+            # без _guarded: ми вже всередині операції (можливо, пробної в half_open)
+            self.revisions[sheet] = await self._revision(sheet)
+        except Exception as e:  # noqa: BLE001 — запис уже вдався, це лише бухгалтерія
+            self.revisions.pop(sheet, None)
+            log.info("Revision of %s sheet not updated after own write: %s", sheet, e)
+
+    @_guarded
+    async def pull_ttn_to_local(self) -> None:
+        """Одне читання таблиці ТТН -> і office, і warehouse (старт і періодичний refresh).
+
+        Не запушені warehouse-рядки переживають pull (див. lc.replace_warehouse_rows).
+        """
+        async with self._ttn_lock:
+            records = await self._api(self.ttn.get_all_values)  # включно із заголовком
+            rows = self._ttn_rows(records)
+            await executors.run(executors.DISK, lc.replace_office_rows, rows)
+            await executors.run(executors.DISK, lc.replace_warehouse_rows, rows)
+            self._office_synced = (len(records), _norm(records[-1]) if records else [])
+
+    @staticmethod
+    def _ttn_rows(records):
+        # records включно із заголовком -> пропускаємо його
+        return [_ttn_row(i, row) for i, row in enumerate(records[1:], start=2)]
+
+    @_guarded
+    async def clear_ttn(self) -> None:
         """Очищає таблицю ТТН, лишаючи заголовок (форматування не чіпаємо)."""
-        header = self.ttn.row_values(1)
-        self.ttn.clear()
-        self.ttn.append_row(header)
+        async with self._ttn_lock:
+            header = await self._api(self.ttn.row_values, 1)
+            await self._api(self.ttn.clear)
+            await self._api(self.ttn.append_row, header, idempotent=False)
+            self._office_synced = (1, _norm(header))
         log.info("Google Sheet TTN cleared.")
+        await self._own_write("ttn")
 
     # ── таблиця користувачів ──
-    def get_users_values(self):
-        return self.users.get_all_values()
-
-    def find_user_row(self, tg_id: str):
-        rows = self.users.get_all_values()
-        for i, row in enumerate(rows, start=1):
-            if row and row[0] == tg_id:
-                return i
-        return None
-
-    def upsert_user(self, tg_id, role, username, report_time, last_sent) -> None:
-        row_index = self.find_user_row(tg_id)
-        if row_index is None:
-            next_row = len(self.users.get_all_values()) + 1
-            self.users.update(
-                f"A{next_row}:F{next_row}",
-                [[tg_id, role, username, report_time, last_sent, ""]],
-            )
-        else:
-            current = self.users.row_values(row_index)
-            admin_value = current[5] if len(current) >= 6 else ""
-            self.users.update(
-                f"A{row_index}:F{row_index}",
-                [[tg_id, role, username, report_time, last_sent, admin_value]],
-            )
+    @_guarded
+    async def get_users_values(self):
+        return await self._api(self.users.get_all_values)
+
+    @_guarded
+    async def user_ids_at(self, rows: list[int]) -> list[str]:
+        """tg_id (колонка A) у вказаних рядках — одним batch_get лише ключових клітинок."""
+        ranges = await self._api(self.users.batch_get, [f"A{r}" for r in rows])
+        return [(vr[0][0] if vr and vr[0] else "") for vr in ranges]
+
+    @_guarded
+    async def write_user_rows(self, rows: dict[int, list]) -> None:
+        """Ранжований запис A:F кількох рядків одним запитом."""
+        await self._api(
+            self.users.batch_update,
+            [{"range": f"A{r}:F{r}", "values": [values]} for r, values in rows.items()],
+        )
+        await self._own_write("users")
+
+    @_guarded
+    async def append_user_rows(self, values: list[list]) -> int:
+        """Дописує рядки в кінець таблиці; повертає номер першого доданого рядка."""
+        response = await self._api(self.users.append_rows, values, table_range="A1", idempotent=False)
+        updated = (response or {}).get("updates", {}).get("updatedRange", "")
+        match = _RANGE_START_RE.search(updated)
+        if not match:
+            raise RuntimeError(f"Unexpected append response for users sheet: {response!r}")
+        await self._own_write("users")
+        return int(match.group(1))
@@ -0,0 +1,239 @@
+"""Асинхронний клієнт Google Sheets API v4 (aiohttp) замість gspread.
+
+  - одна спільна aiohttp-сесія з пулом keep-alive з'єднань на весь процес;
+  - токен сервісного акаунта (JWT-bearer -> access token) оновлюється
+    наперед, за TOKEN_REFRESH_MARGIN до закінчення, одним запитом на всіх
+    одночасних викликачів; 401 посеред життя токена -> примусове оновлення
+    і один повтор;
+  - Worksheet — постійний хендл (id таблиці + назва першого аркуша),
+    визначається один раз; якщо аркуш перейменували, назва перечитується;
+  - revision()/fingerprint() — дешева перевірка, чи змінилась таблиця
+    (версія файла в Drive або хвіст аркуша), без завантаження всього вмісту.
+
+Методи Worksheet повторюють ті, що ми брали з gspread (col_values,
+append_rows, batch_get, ...), і повертають ті самі структури. Помилки API —
+SheetsAPIError зі статусом; мережеві — aiohttp.ClientError / asyncio.TimeoutError.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import re
+import time
+from urllib.parse import quote
+
+import aiohttp
+from google.auth import crypt, jwt
+
+log = logging.getLogger(__name__)
+
+API_ROOT = "https://sheets.googleapis.com/v4/spreadsheets"
+DRIVE_FILES = "https://www.googleapis.com/drive/v3/files"
+TOKEN_URI = "https://oauth2.googleapis.com/token"
+TOKEN_REFRESH_MARGIN = 300  # секунд до закінчення токена, коли вже оновлюємо
+
+_SPREADSHEET_ID_RE = re.compile(r"/spreadsheets/d/([a-zA-Z0-9-_]+)")
+
+
+class SheetsAPIError(RuntimeError):
+    def __init__(self, status: int, message: str, retry_after: str = "") -> None:
+        super().__init__(f"{status}: {message}")
+        self.status = status
+        self.message = message
+        self.retry_after = retry_after
+
+
+class _ServiceAccountToken:
+    def __init__(self, info: dict, scopes: list[str]) -> None:
+        self.email = info["client_email"]
+        self.token_uri = info.get("token_uri") or TOKEN_URI
+        self.scopes = " ".join(scopes)
+        self._signer = crypt.RSASigner.from_service_account_info(info)
+        self._token: str | None = None
+        self._expires_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def get(self, session: aiohttp.ClientSession, force: bool = False) -> str:
+        if not force and self._token and time.time() < self._expires_at - TOKEN_REFRESH_MARGIN:
+            return self._token
+        stale = self._token
+        async with self._lock:
+            # поки чекали lock, токен міг оновити інший викликач
+            if self._token != stale and time.time() < self._expires_at - TOKEN_REFRESH_MARGIN:
+                return self._token
+            now = int(time.time())
+            assertion = jwt.encode(self._signer, {
+                "iss": self.email, "scope": self.scopes, "aud": self.token_uri,
+                "iat": now, "exp": now + 3600,
+            })
+            async with session.post(self.token_uri, data={
+                "grant_type": "urn:ietf:params:oauth:grant-type:jwt-bearer",
+                "assertion": assertion.decode(),
+            }) as resp:
+                payload = await resp.json(content_type=None)
+                if resp.status != 200:
+                    raise SheetsAPIError(resp.status, f"token refresh failed: {payload}")
+            self._token = payload["access_token"]
+            self._expires_at = now + int(payload.get("expires_in", 3600))
+            log.info("Google access token refreshed (valid %ss).", payload.get("expires_in"))
+            return self._token
+
+
+class AsyncSheetsClient:
+    def __init__(self, credentials_info: dict, scopes: list[str], timeout: float,
+                 max_connections: int = 10) -> None:
+        self._auth = _ServiceAccountToken(credentials_info, scopes)
+        self._timeout = aiohttp.ClientTimeout(total=timeout)
+        self._max_connections = max_connections
+        self._session: aiohttp.ClientSession | None = None
+
+    def _http(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                timeout=self._timeout,
+                connector=aiohttp.TCPConnector(limit=self._max_connections, keepalive_timeout=60),
+            )
+        return self._session
+
+    async def request(self, method: str, url: str, **kwargs):
+        session = self._http()
+        for attempt in range(2):
+            token = await self._auth.get(session, force=attempt > 0)
+            async with session.request(
+                method, url, headers={"Authorization": f"Bearer {token}"}, **kwargs
+            ) as resp:
+                if resp.status == 401 and attempt == 0:
+                    continue  # токен відкликано/прострочено раніше, ніж чекали
+                text = await resp.text()
+                if resp.status >= 400:
+                    raise SheetsAPIError(resp.status, _error_message(text) or resp.reason or "",
+                                         resp.headers.get("Retry-After", ""))
+                return json.loads(text) if text else {}
+
+    async def open_by_url(self, url: str) -> "Worksheet":
+        """Хендл першого аркуша таблиці (аналог gspread open_by_url(...).sheet1)."""
+        match = _SPREADSHEET_ID_RE.search(url or "")
+        if not match:
+            raise ValueError(f"Not a Google Sheets URL: {url!r}")
+        worksheet = Worksheet(self, match.group(1))
+        await worksheet.resolve()
+        return worksheet
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+class Worksheet:
+    def __init__(self, client: AsyncSheetsClient, spreadsheet_id: str) -> None:
+        self.client = client
+        self.spreadsheet_id = spreadsheet_id
+        self.title = ""
+
+    async def resolve(self) -> None:
+        """Назва першого аркуша (за index) — до неї прив'язуються всі діапазони."""
+        meta = await self.client.request(
+            "GET", f"{API_ROOT}/{self.spreadsheet_id}",
+            params={"fields": "sheets.properties(title,index)"},
+        )
+        sheets = sorted(meta.get("sheets", []), key=lambda s: s["properties"].get("index", 0))
+        if not sheets:
+            raise SheetsAPIError(404, f"spreadsheet {self.spreadsheet_id} has no sheets")
+        self.title = sheets[0]["properties"]["title"]
+
+    def _range(self, a1: str = "") -> str:
+        name = "'" + self.title.replace("'", "''") + "'"
+        return f"{name}!{a1}" if a1 else name
+
+    async def _call(self, method: str, build):
+        """build() -> (суфікс URL, kwargs); збирається заново, якщо аркуш перейменували."""
+        for attempt in range(2):
+            suffix, kwargs = build()
+            try:
+                return await self.client.request(
+                    method, f"{API_ROOT}/{self.spreadsheet_id}/values{suffix}", **kwargs
+                )
+            except SheetsAPIError as e:
+                if attempt or e.status != 400 or "Unable to parse range" not in e.message:
+                    raise
+                old = self.title
+                await self.resolve()
+                if self.title == old:
+                    raise
+                log.info("Worksheet renamed %r -> %r.", old, self.title)
+
+    # ── операції (як у gspread) ──
+    async def col_values(self, col: int) -> list[str]:
+        letter = _column_letter(col)
+        data = await self._call("GET", lambda: (
+            "/" + quote(self._range(f"{letter}:{letter}"), safe=""),
+            {"params": {"majorDimension": "COLUMNS"}},
+        ))
+        values = data.get("values") or [[]]
+        return values[0]
+
+    async def row_values(self, row: int) -> list[str]:
+        data = await self._call("GET", lambda: ("/" + quote(self._range(f"{row}:{row}"), safe=""), {}))
+        values = data.get("values") or [[]]
+        return values[0]
+
+    async def get_all_values(self) -> list[list[str]]:
+        data = await self._call("GET", lambda: ("/" + quote(self._range(), safe=""), {}))
+        return data.get("values", [])
+
+    async def batch_get(self, ranges: list[str]) -> list[list[list[str]]]:
+        data = await self._call("GET", lambda: (
+            ":batchGet", {"params": [("ranges", self._range(r)) for r in ranges]},
+        ))
+        return [vr.get("values", []) for vr in data.get("valueRanges", [])]
+
+    async def revision(self) -> str:
+        """Версія файла в Drive: зростає з кожною правкою будь-де в таблиці."""
+        data = await self.client.request(
+            "GET", f"{DRIVE_FILES}/{self.spreadsheet_id}",
+            params={"fields": "version", "supportsAllDrives": "true"},
+        )
+        return str(data.get("version", ""))
+
+    async def fingerprint(self, tail: int = 3) -> str:
+        """Без Drive: хеш колонки A (к-сть і порядок рядків) + останніх tail рядків повністю."""
+        column = await self.col_values(1)
+        start = max(1, len(column) - tail + 1)
+        (last,) = await self.batch_get([f"A{start}:Z{len(column) or 1}"])
+        return hashlib.sha1(json.dumps([column, last], ensure_ascii=False).encode()).hexdigest()
+
+    async def append_rows(self, values: list[list], table_range: str | None = None) -> dict:
+        return await self._call("POST", lambda: (
+            "/" + quote(self._range(table_range or ""), safe="") + ":append",
+            {"params": {"valueInputOption": "RAW"}, "json": {"values": values}},
+        ))
+
+    async def append_row(self, values: list) -> dict:
+        return await self.append_rows([values])
+
+    async def clear(self) -> dict:
+        return await self._call("POST", lambda: (
+            "/" + quote(self._range(), safe="") + ":clear", {"json": {}},
+        ))
+
+    async def batch_update(self, data: list[dict]) -> dict:
+        return await self._call("POST", lambda: (":batchUpdate", {"json": {
+            "valueInputOption": "RAW",
+            "data": [{"range": self._range(d["range"]), "values": d["values"]} for d in data],
+        }}))
+
+
+def _error_message(text: str) -> str:
+    try:
+        return json.loads(text)["error"]["message"]
+    except (ValueError, KeyError, TypeError):
+        return text[:200]
+
+
+def _column_letter(col: int) -> str:
+    letters = ""
+    while col:
+        col, rem = divmod(col - 1, 26)
+        letters = chr(ord("A") + rem) + letters
+    return letters
@@ -2,17 +2,49 @@
 
 Схема таблиці користувачів (як у попередній версії):
   A tg_id | B role | C username | D report_time | E last_sent | F admin
+
+Разом із кешем тримаємо мапу tg_id -> номер рядка (і сирий вміст колонки F),
+тож upsert — це перевірка однієї ключової клітинки + один ранжований запис
+(новий користувач — один append). Якщо таблицю правили вручну і в рядку вже
+інший tg_id — мапа перечитується з таблиці.
+
+Запис write-behind: update() одразу змінює кеш, а рядок ставить у чергу,
+коалесцовану за tg_id (лишається останній стан), і дописує в локальний
+журнал. Фонова задача раз на USERS_FLUSH_SECONDS шле всю чергу одним
+batch_update (+ один append для нових), при збої — повтор із backoff.
+Журнал переграється при старті, тож смерть процесу посеред флешу нічого
+не губить.
+
+Останній прочитаний вміст таблиці зберігається локальним знімком
+(local_users.json): з нього бот стартує одразу (warm start), поки Google
+ще читається, і на ньому ж лишається, якщо Google недоступний.
+
+Підписки індексуються за часом HH:MM (subscribers_at): індекс підтримується
+при кожному update/load, а слухачі (ReportService) дізнаються, коли набір
+часів змінився, щоб перепланувати cron-задачі саме на ці хвилини.
 """
 import asyncio
+import json
 import logging
+import os
+import re
 from dataclasses import dataclass
-from datetime import datetime, timedelta
 
-from .. import settings
+from .. import executors, metrics, settings
+from ..cache import TTLCache
+from ..services.outbound import OutboundDispatcher
 from .sheets import Sheets
 
 log = logging.getLogger(__name__)
 
+USERS_JOURNAL_FILE = "local_users_journal.jsonl"
+USERS_SNAPSHOT_FILE = "local_users.json"
+_FLUSH_BACKOFF_MAX_SECONDS = 60
+
+_ALERTS = metrics.counter(
+    "admin_alerts_total", "Алерти адмінам: sent — надіслані, suppressed — у дайджест", ("result",)
+)
+
 
 @dataclass
 class User:
@@ -27,22 +59,108 @@ class UserRepository:
     def __init__(self, sheets: Sheets) -> None:
         self.sheets = sheets
         self.cache: dict[str, User] = {}
+        self._rows: dict[str, int] = {}          # tg_id -> номер рядка в таблиці
+        self._admin_cells: dict[str, str] = {}   # tg_id -> сирий вміст F (зберігаємо як є)
+        self._write_lock = asyncio.Lock()
+        self._pending: dict[str, list] = {}      # tg_id -> рядок A:F, що чекає запису
+        self._flush_lock = asyncio.Lock()
+        self._journal_lock = asyncio.Lock()
+        self._journal_queue: list[str] = []      # рядки журналу, що чекають групового запису
+        self._flusher: asyncio.Task | None = None
+        self._failures = 0
+        self._subs: dict[str, set[str]] = {}    # "HH:MM" -> tg_id підписників
+        self._subs_listeners: list = []
+        self._journal_loaded = False
 
-    async def load(self) -> None:
-        self.cache = await asyncio.to_thread(self._read_all)
+    async def load(self) -> bool:
+        """Кеш із Google (+ знімок); при збої лишається поточний кеш або знімок -> False."""
+        await self._load_journal()
+        # флеш чекає: інакше рядок, записаний після нашого читання, зник би з кешу
+        # разом із _pending (флеш прибирає записане), а таблиця віддала б старий стан
+        async with self._flush_lock:
+            try:
+                rows = await self.sheets.get_users_values()
+            except Exception as e:
+                log.error("Error reading users data: %s", e)
+                if not self.cache and not await self.load_snapshot():
+                    self._apply_rows([])
+                return False
+            self._apply_rows(rows)
         log.info("Users cache loaded. Total users: %d", len(self.cache))
+        try:
+            await executors.run(executors.DISK, _write_snapshot, rows)
+        except OSError as e:
+            log.warning("Users snapshot not saved: %s", e)
+        return True
+
+    async def load_snapshot(self) -> bool:
+        """Кеш із локального знімка останнього читання; False — знімка немає."""
+        await self._load_journal()
+        rows = await executors.run(executors.DISK, _read_snapshot)
+        if rows is None:
+            return False
+        self._apply_rows(rows)
+        log.info("Users cache loaded from local snapshot. Total users: %d", len(self.cache))
+        return True
+
+    def _apply_rows(self, rows) -> None:
+        self.cache = self._parse_rows(rows)
+        # черга write-behind новіша за будь-яке читання таблиці
+        for tg_id, values in self._pending.items():
+            self._apply(tg_id, values)
+        self._reindex_subscriptions()
+
+    # ── індекс підписок ──
+    def on_subscriptions_changed(self, callback) -> None:
+        """callback() викликається, коли з'явився новий час підписки або зник старий."""
+        self._subs_listeners.append(callback)
+
+    def subscription_times(self) -> list[str]:
+        return sorted(self._subs)
+
+    def subscribers_at(self, hhmm: str) -> list[str]:
+        return list(self._subs.get(hhmm, ()))
+
+    def _reindex_subscriptions(self) -> None:
+        before = set(self._subs)
+        self._subs = {}
+        for tg_id, user in self.cache.items():
+            if user.time:
+                self._subs.setdefault(user.time, set()).add(tg_id)
+        if set(self._subs) != before:
+            self._notify_subscriptions()
+
+    def _move_subscription(self, tg_id: str, old: str, new: str) -> None:
+        if old == new:
+            return
+        changed = False
+        if old and old in self._subs:
+            self._subs[old].discard(tg_id)
+            if not self._subs[old]:
+                del self._subs[old]
+                changed = True
+        if new:
+            changed |= new not in self._subs
+            self._subs.setdefault(new, set()).add(tg_id)
+        if changed:
+            self._notify_subscriptions()
+
+    def _notify_subscriptions(self) -> None:
+        for callback in self._subs_listeners:
+            try:
+                callback()
+            except Exception as e:
+                log.error("Subscription listener failed: %s", e)
 
-    def _read_all(self) -> dict[str, User]:
+    def _parse_rows(self, rows) -> dict[str, User]:
+        """Рядки таблиці -> кеш User; заодно перебудовує мапу рядків і колонку F."""
         data: dict[str, User] = {}
-        try:
-            rows = self.sheets.get_users_values()
-        except Exception as e:
-            log.error("Error reading users data: %s", e)
-            return data
-        for row in rows[1:]:  # пропускаємо заголовок
+        row_index: dict[str, int] = {}
+        admin_cells: dict[str, str] = {}
+        for i, row in enumerate(rows[1:], start=2):  # пропускаємо заголовок
             if not row or not row[0]:
                 continue
-            # gspread обрізає порожні хвостові клітинки -> доповнюємо до 6 колонок
+            # API обрізає порожні хвостові клітинки -> доповнюємо до 6 колонок
             row = list(row) + [""] * (6 - len(row))
             data[row[0]] = User(
                 role=row[1],
@@ -51,8 +169,131 @@ class UserRepository:
                 last_sent=row[4],
                 admin=(row[5].strip().lower() == "admin"),
             )
+            row_index.setdefault(row[0], i)  # як і раніше — перше входження
+            admin_cells.setdefault(row[0], row[5])
+        self._rows, self._admin_cells = row_index, admin_cells
         return data
 
+    async def _resync_rows(self) -> None:
+        """Перечитати мапу рядків (після ручної правки таблиці). Кеш значень не чіпаємо."""
+        fresh = self._parse_rows(await self.sheets.get_users_values())  # помилка -> назовні, не пишемо навмання
+        for tg_id, user in fresh.items():
+            if tg_id in self.cache:
+                self.cache[tg_id].admin = user.admin
+        log.info("Users row map re-synced: %d rows.", len(self._rows))
+
+    async def _write_rows(self, batch: dict[str, list]) -> None:
+        """Запис черги: 1 batch_get ключових клітинок, 1 batch_update, 1 append."""
+        async with self._write_lock:
+            known = {tg_id: self._rows[tg_id] for tg_id in batch if tg_id in self._rows}
+            if known and await self.sheets.user_ids_at(list(known.values())) != list(known):
+                log.warning("Users sheet rows moved (edited by hand?), re-syncing.")
+                await self._resync_rows()
+                known = {tg_id: self._rows[tg_id] for tg_id in batch if tg_id in self._rows}
+            for tg_id, values in batch.items():
+                values[5] = self._admin_cells.get(tg_id, "")
+            if known:
+                await self.sheets.write_user_rows({row: batch[tg_id] for tg_id, row in known.items()})
+            new_ids = [tg_id for tg_id in batch if tg_id not in known]
+            if new_ids:
+                first = await self.sheets.append_user_rows([batch[tg_id] for tg_id in new_ids])
+                for offset, tg_id in enumerate(new_ids):
+                    self._rows[tg_id] = first + offset
+                    self._admin_cells[tg_id] = ""
+
+    # ── write-behind ──
+    # Журнал пишеться в disk-пулі під _journal_lock: дозапис і компакція не
+    # переганяють одне одного, а рядки, що встигли накопичитись, поки йшов
+    # попередній запис, лягають одним write+fsync (груповий коміт).
+    async def _journal_append(self, tg_id: str, values: list) -> None:
+        self._journal_queue.append(_journal_line(tg_id, values))
+        async with self._journal_lock:
+            if not self._journal_queue:
+                return  # уже записано чужим груповим комітом
+            lines, self._journal_queue = self._journal_queue, []
+            await executors.run(executors.DISK, _journal_write, lines)
+
+    async def _journal_compact(self) -> None:
+        """Лишити в журналі тільки те, що досі не записано в Google."""
+        async with self._journal_lock:
+            # черга вже є в _pending (update кладе туди раніше) — окремо не потрібна
+            self._journal_queue.clear()
+            lines = [_journal_line(tg_id, values) for tg_id, values in self._pending.items()]
+            await executors.run(executors.DISK, _journal_rewrite, lines)
+
+    async def _load_journal(self) -> None:
+        """Один раз на процес: незаписане з минулого запуску -> у чергу (далі — лише пам'ять)."""
+        if self._journal_loaded:
+            return
+        self._journal_loaded = True
+        entries = await executors.run(executors.DISK, _read_journal)
+        for tg_id, values in entries:
+            self._pending.setdefault(tg_id, values)  # оновлення цього запуску новіші
+        if entries:
+            log.info("Replayed %d pending user writes from journal.", len(self._pending))
+
+    def _apply(self, tg_id: str, values: list) -> None:
+        existing = self.cache.get(tg_id)
+        self._move_subscription(tg_id, existing.time if existing else "", values[3])
+        self.cache[tg_id] = User(
+            role=values[1],
+            username=values[2],
+            time=values[3],
+            last_sent=values[4],
+            admin=existing.admin if existing else False,
+        )
+
+    def start(self) -> None:
+        """Запуск фонового флешу черги (після load())."""
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def close(self) -> None:
+        """Зупинка при завершенні: останній флеш (що не встигне — лишиться в журналі)."""
+        if self._flusher is not None:
+            self._flusher.cancel()
+            self._flusher = None
+        await self.flush()
+
+    async def _flush_loop(self) -> None:
+        while True:
+            delay = settings.USERS_FLUSH_SECONDS
+            if self._failures:
+                delay = min(delay * 2 ** self._failures, _FLUSH_BACKOFF_MAX_SECONDS)
+            await asyncio.sleep(delay)
+            try:
+                await self.flush()
+            except Exception as e:  # напр. OSError компакції журналу — цикл не повинен вмерти
+                self._failures += 1
+                log.exception("Users flush loop error: %s", e)
+
+    async def flush(self) -> bool:
+        """Записати всю чергу в Google; True — якщо черга порожня після флешу."""
+        async with self._flush_lock:
+            if not self._pending:
+                return True
+            snapshot = dict(self._pending)
+            batch = {tg_id: list(values) for tg_id, values in snapshot.items()}
+            try:
+                await self._write_rows(batch)
+            except Exception as e:
+                self._failures += 1
+                log.warning("Users flush failed (%d pending, attempt %d): %s",
+                            len(batch), self._failures, e)
+                return False
+            self._failures = 0
+            for tg_id, values in snapshot.items():
+                # за час запису могло прийти новіше оновлення — його лишаємо в черзі
+                if self._pending.get(tg_id) is values:
+                    del self._pending[tg_id]
+            await self._journal_compact()
+            log.info("Flushed %d user rows to Google.", len(batch))
+            return not self._pending
+
+    @property
+    def pending_count(self) -> int:
+        return len(self._pending)
+
     def get(self, tg_id: str) -> User:
         return self.cache.get(tg_id, User())
 
@@ -60,40 +301,167 @@ class UserRepository:
         return [tg_id for tg_id, u in self.cache.items() if u.admin]
 
     async def update(self, tg_id, role, username, report_time, last_sent="") -> None:
-        await asyncio.to_thread(
-            self.sheets.upsert_user, tg_id, role, username, report_time, last_sent
-        )
-        existing = self.cache.get(tg_id)
-        self.cache[tg_id] = User(
-            role=role,
-            username=username,
-            time=report_time,
-            last_sent=last_sent,
-            admin=existing.admin if existing else False,
-        )
+        """Миттєво в кеш + у чергу на запис (write-behind, див. flush)."""
+        values = [tg_id, role, username, report_time, last_sent, ""]
+        self._apply(tg_id, values)
+        self._pending[tg_id] = values
+        await self._journal_append(tg_id, values)
+
+
+def _journal_line(tg_id: str, values: list) -> str:
+    return json.dumps({"tg_id": tg_id, "values": values}, ensure_ascii=False) + "\n"
+
+
+def _read_journal() -> list[tuple[str, list]]:
+    try:
+        with open(USERS_JOURNAL_FILE, "r", encoding="utf-8") as f:
+            lines = f.readlines()
+    except FileNotFoundError:
+        return []
+    entries = {}
+    for line in lines:
+        try:
+            entry = json.loads(line)
+            entries[entry["tg_id"]] = list(entry["values"])
+        except (ValueError, KeyError, TypeError):
+            continue  # обірваний останній рядок після падіння
+    return list(entries.items())
+
+
+def _journal_write(lines: list[str]) -> None:
+    with open(USERS_JOURNAL_FILE, "a", encoding="utf-8") as f:
+        f.writelines(lines)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _journal_rewrite(lines: list[str]) -> None:
+    tmp = USERS_JOURNAL_FILE + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.writelines(lines)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, USERS_JOURNAL_FILE)
+
+
+def _read_snapshot() -> list | None:
+    try:
+        with open(USERS_SNAPSHOT_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except ValueError as e:
+        log.warning("Users snapshot is corrupted, ignoring: %s", e)
+        return None
+
+
+def _write_snapshot(rows) -> None:
+    tmp = USERS_SNAPSHOT_FILE + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(rows, f, ensure_ascii=False)
+    os.replace(tmp, USERS_SNAPSHOT_FILE)
 
 
 class AdminNotifier:
-    """Шле адмінам алерти з дедуплікацією однакових повідомлень."""
+    """Шле адмінам алерти: перший випадок — одразу, повтори — зведенням.
+
+    Повідомлення групуються за відбитком (цифри, списки й лапки знормовано),
+    тож "Missing TTНs: [...]" із різними ТТН чи помилки різних чатів — один
+    вид алерту. Перший у вікні ADMIN_NOTIFY_INTERVAL_MINUTES іде одразу,
+    повтори лише рахуються і раз на ADMIN_DIGEST_MINUTES ідуть одним
+    дайджестом ("37 × ..."). Обидва сховища обмежені ADMIN_NOTIFY_MAX_KEYS.
+    """
+
+    DIGEST_MAX_LINES = 20
+    SAMPLE_CHARS = 300
 
-    def __init__(self, bot, users: UserRepository) -> None:
-        self.bot = bot
+    def __init__(self, outbound: OutboundDispatcher, users: UserRepository) -> None:
+        self.outbound = outbound
         self.users = users
-        self._last: dict[str, datetime] = {}
+        self._seen = TTLCache(settings.ADMIN_NOTIFY_MAX_KEYS, settings.ADMIN_NOTIFY_INTERVAL_MINUTES * 60)
+        self._suppressed: dict[str, list] = {}  # відбиток -> [к-сть, перше повідомлення]
+        self._overflow = 0                      # повтори, що не влізли в _suppressed
+        self._digester: asyncio.Task | None = None
+        metrics.watch_cache("admin_alerts", self._seen)
 
     async def notify(self, message: str) -> None:
-        now = datetime.now()
-        interval = timedelta(minutes=settings.ADMIN_NOTIFY_INTERVAL_MINUTES)
-        last = self._last.get(message)
-        if last and now - last < interval:
+        key = _fingerprint(message)
+        if self._seen.get(key) is not None:
+            _ALERTS.inc(result="suppressed")
+            entry = self._suppressed.get(key)
+            if entry is not None:
+                entry[0] += 1
+            elif len(self._suppressed) < settings.ADMIN_NOTIFY_MAX_KEYS:
+                self._suppressed[key] = [1, message]
+            else:
+                self._overflow += 1
+            return
+        self._seen.set(key, True)
+        _ALERTS.inc(result="sent")
+        await self._broadcast(f"[ALERT] {message}")
+
+    def start(self) -> None:
+        if self._digester is None:
+            self._digester = asyncio.create_task(self._digest_loop())
+
+    async def close(self) -> None:
+        """Зупинка: накопичені повтори — останнім дайджестом."""
+        if self._digester is not None:
+            self._digester.cancel()
+            self._digester = None
+        await self.send_digest()
+
+    async def _digest_loop(self) -> None:
+        while True:
+            await asyncio.sleep(settings.ADMIN_DIGEST_MINUTES * 60)
+            try:
+                await self.send_digest()
+            except Exception as e:  # noqa: BLE001 — цикл дайджестів не повинен померти
+                log.error("Admin digest failed: %s", e)
+
+    async def send_digest(self) -> None:
+        if not self._suppressed and not self._overflow:
             return
-        self._last[message] = now
+        groups = sorted(self._suppressed.values(), key=lambda entry: -entry[0])
+        overflow = self._overflow
+        self._suppressed, self._overflow = {}, 0
+        lines = [f"[DIGEST] Repeated alerts in the last {settings.ADMIN_DIGEST_MINUTES} min:"]
+        for count, sample in groups[:self.DIGEST_MAX_LINES]:
+            lines.append(f"{count} × {_shorten(sample, self.SAMPLE_CHARS)}")
+        rest = sum(count for count, _ in groups[self.DIGEST_MAX_LINES:]) + overflow
+        if rest:
+            lines.append(f"…and {rest} more")
+        await self._broadcast("\n".join(lines))
+
+    async def _broadcast(self, text: str) -> None:
         admin_ids = self.users.admin_ids()
         if not admin_ids:
-            log.warning("No admin IDs available to notify: %s", message)
+            log.warning("No admin IDs available to notify: %s", text)
             return
-        for admin_id in admin_ids:
-            try:
-                await self.bot.send_message(admin_id, f"[ALERT] {message}")
-            except Exception as e:
-                log.error("Failed to notify admin %s: %s", admin_id, e)
+        results = await asyncio.gather(
+            *(self.outbound.send_message(admin_id, text) for admin_id in admin_ids),
+            return_exceptions=True,
+        )
+        for admin_id, result in zip(admin_ids, results):
+            if isinstance(result, Exception):
+                log.error("Failed to notify admin %s: %s", admin_id, result)
+
+
+# що відрізняє однакові за суттю алерти: списки/словники, рядки в лапках, числа.
+# Одинарні лапки — лише на межі слова: апостроф ("Sheets' quota", "з'єднання") не лапка
+_FINGERPRINT_SUBS = (
+    (re.compile(r"\[[^\]]*\]|\{[^}]*\}"), "[…]"),
+    (re.compile(r"\"[^\"]*\"|(?<!\w)'[^']*'(?!\w)"), "'…'"),
+    (re.compile(r"\d+"), "#"),
+    (re.compile(r"\s+"), " "),
+)
+
+
+def _fingerprint(message: str) -> str:
+    for pattern, repl in _FINGERPRINT_SUBS:
+        message = pattern.sub(repl, message)
+    return message.strip()[:200]
+
+
+def _shorten(text: str, limit: int) -> str:
+    return text if len(text) <= limit else text[:limit - 1] + "…"
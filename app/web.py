@@ -1,17 +1,41 @@
 """Keep-alive HTTP-сервер для безкоштовного Render (щоб сервіс не засинав).
 
 Працює в тому ж event loop, що й бот (aiohttp уже є залежністю aiogram).
+GET /metrics — метрики у текстовому форматі Prometheus (app/metrics.py), лише
+з METRICS_TOKEN ("Authorization: Bearer <токен>" або ?token=); без токена вимкнено.
+У webhook-режимі тут же висить POST WEBHOOK_PATH (app/webhook.py).
 """
+import logging
+import secrets
+
 from aiohttp import web
 
+from . import metrics, settings
+
+log = logging.getLogger(__name__)
+
 
 async def _ping(_request: web.Request) -> web.Response:
     return web.Response(text="OK")
 
 
-async def start_web(port: int) -> web.AppRunner:
+async def _metrics(request: web.Request) -> web.Response:
+    auth = request.headers.get("Authorization", "")
+    token = auth[len("Bearer "):] if auth.startswith("Bearer ") else request.query.get("token", "")
+    if not secrets.compare_digest(token.encode(), settings.METRICS_TOKEN.encode()):
+        return web.Response(status=401, text="Unauthorized")
+    return web.Response(text=metrics.render(), content_type="text/plain", charset="utf-8")
+
+
+async def start_web(port: int, webhook=None, webhook_path: str = "/webhook") -> web.AppRunner:
     app = web.Application()
     app.router.add_get("/", _ping)
+    if settings.METRICS_TOKEN:
+        app.router.add_get("/metrics", _metrics)
+    else:
+        log.info("METRICS_TOKEN is not set: /metrics is disabled.")
+    if webhook is not None:
+        webhook.register(app, webhook_path)
     runner = web.AppRunner(app)
     await runner.setup()
     site = web.TCPSite(runner, "0.0.0.0", port)
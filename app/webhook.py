@@ -0,0 +1,70 @@
+"""Webhook-режим: апдейти Telegram приходять POST-ом на той самий aiohttp-сервер.
+
+Telegram отримує 200 одразу після перевірки секрету й розбору JSON, а
+обробка йде фоновою задачею — повільний хендлер (фото, Google) не тримає
+з'єднання і не провокує повторну доставку. Одночасно обробляється не
+більше WEBHOOK_MAX_UPDATES апдейтів, решта чекає на семафорі.
+
+Секрет звіряється із заголовком X-Telegram-Bot-Api-Secret-Token (Telegram
+шле той, що переданий у set_webhook).
+"""
+import asyncio
+import logging
+import secrets
+
+from aiogram import Bot, Dispatcher
+from aiohttp import web
+
+from . import metrics
+
+log = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+_UPDATES = metrics.counter("webhook_requests_total", "Запити на webhook", ("result",))
+
+
+class WebhookHandler:
+    def __init__(self, dp: Dispatcher, bot: Bot, secret: str | None, max_updates: int) -> None:
+        self.dp = dp
+        self.bot = bot
+        self.secret = secret  # None — без перевірки (лише локальний режим)
+        self._slots = asyncio.Semaphore(max_updates)
+        self._tasks: set[asyncio.Task] = set()
+        metrics.callback("webhook_updates_inflight", "Апдейти в обробці та в очікуванні слота",
+                         lambda: len(self._tasks))
+
+    def register(self, app: web.Application, path: str) -> None:
+        app.router.add_post(path, self.handle)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        # байти: compare_digest на str падає (TypeError -> 500) на не-ASCII заголовку
+        if self.secret is not None and not secrets.compare_digest(
+            request.headers.get(SECRET_HEADER, "").encode("utf-8", "surrogateescape"), self.secret.encode()
+        ):
+            _UPDATES.inc(result="unauthorized")
+            return web.Response(status=401, text="Unauthorized")
+        try:
+            update = await request.json()
+        except ValueError:
+            _UPDATES.inc(result="bad_request")
+            return web.Response(status=400, text="Bad Request")
+        _UPDATES.inc(result="accepted")
+        task = asyncio.create_task(self._process(update))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return web.json_response({})
+
+    async def _process(self, update: dict) -> None:
+        async with self._slots:
+            try:
+                await self.dp.feed_raw_update(self.bot, update)
+            except Exception as e:  # noqa: BLE001 — некоректний апдейт не повинен губити інші
+                log.exception("Webhook update %s failed: %s", update.get("update_id"), e)
+
+    async def close(self, timeout: float = 10) -> None:
+        """Дочекатися апдейтів, що вже в обробці (не довше timeout)."""
+        if self._tasks:
+            done, pending = await asyncio.wait(set(self._tasks), timeout=timeout)
+            if pending:
+                log.warning("Webhook shutdown: %d updates still in progress.", len(pending))
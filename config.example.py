@@ -16,3 +16,12 @@ GOOGLE_SHEETS_CREDENTIALS = "..."
 # Посилання на дві Google-таблиці
 GOOGLE_SHEET_URL = "https://docs.google.com/spreadsheets/d/.../edit"
 GOOGLE_SHEET_URL_USERS = "https://docs.google.com/spreadsheets/d/.../edit?gid=0#gid=0"
+
+# Необов'язково: webhook замість long polling (той самий порт, що й keep-alive).
+# BOT_MODE = "webhook"
+# WEBHOOK_BASE_URL = "https://<service>.onrender.com"
+# WEBHOOK_SECRET = "..."   # якщо не задано — випадковий на кожен старт
+
+# Необов'язково: GET /metrics (Prometheus) з "Authorization: Bearer <токен>"
+# або ?token=<токен>. Без токена ендпойнт вимкнено.
+# METRICS_TOKEN = "..."
@@ -0,0 +1,246 @@
+"""Офлайн-бенчмарк декодера штрих-кодів на синтетичному корпусі.
+
+Генерує відтворюваний (за --seed) корпус етикеток із ТТН: Code128/ITF/QR
+через writer zxing-cpp, плюс спотворення, як на реальних фото — розмиття,
+поворот, перспектива, шум, повторне JPEG-стискання та «сміттєві» короткі
+коди поруч. Далі проганяє app/services/barcode.decode_detailed і рахує:
+  - точність (чи є серед кодів саме ТТН етикетки) і hit rate по варіантах;
+  - латентність p50/p95/p99, пікову пам'ять (RSS процесу);
+  - пропускну здатність в одному процесі та в пулі процесів.
+Результат — JSON, який зручно порівнювати між версіями (--compare).
+
+Запуск:
+    python -m scripts.bench_barcode --count 200 --out bench.json
+    python -m scripts.bench_barcode --count 200 --compare bench.json   # регресії -> exit 1
+    python -m scripts.bench_barcode --count 50 --save-corpus corpus/   # PNG/JPG для test_barcode
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import statistics
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import cv2
+import numpy as np
+import zxingcpp
+
+from app.services.barcode import VariantStats, decode_detailed
+
+_FORMATS = {
+    "code128": zxingcpp.BarcodeFormat.Code128,
+    "itf": zxingcpp.BarcodeFormat.ITF,
+    "qr": zxingcpp.BarcodeFormat.QRCode,
+}
+# Пороги регресії для --compare
+_MAX_ACCURACY_DROP = 0.01   # абсолютна частка
+_MAX_LATENCY_GROWTH = 0.20  # відносно p95
+_QUIET = 24          # px вільного поля навколо коду ТТН (сміттєві коди туди не лізуть)
+_TEXT_TOP = 1200     # рядок тексту внизу етикетки: код ТТН лишається вище
+_PLACE_ATTEMPTS = 50
+
+
+# ── генерація корпусу ──
+def _barcode(text: str, fmt: str, scale: int) -> np.ndarray:
+    bc = zxingcpp.create_barcode(text, _FORMATS[fmt])
+    return np.array(zxingcpp.write_barcode_to_image(bc, scale=scale))
+
+
+Box = tuple[int, int, int, int]  # x0, y0, x1, y1
+
+
+def _overlaps(a: Box, b: Box) -> bool:
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+
+def _paste(canvas: np.ndarray, patch: np.ndarray, rng: random.Random,
+           avoid: Box | None = None, bottom: int | None = None) -> Box | None:
+    """Вставити patch у випадкове місце поза avoid (вище bottom); None — місця не знайшлось."""
+    h, w = patch.shape[:2]
+    bottom = canvas.shape[0] if bottom is None else bottom
+    for _ in range(_PLACE_ATTEMPTS):
+        y = rng.randint(0, bottom - h)
+        x = rng.randint(0, canvas.shape[1] - w)
+        box = (x, y, x + w, y + h)
+        if avoid is None or not _overlaps(box, avoid):
+            canvas[y:y + h, x:x + w] = patch[..., None]
+            return box
+    return None
+
+
+def _label(rng: random.Random) -> tuple[bytes, dict]:
+    """Одна етикетка: JPEG-байти + опис (ТТН, формат, застосовані спотворення)."""
+    ttn = "20" + "".join(rng.choice("0123456789") for _ in range(12))  # 14 цифр, як у НП
+    fmt = rng.choice(list(_FORMATS))
+    canvas = np.full((1280, 960, 3), 255, np.uint8)
+    code = _barcode(ttn, fmt, scale=rng.randint(2, 4) if fmt != "qr" else rng.randint(4, 8))
+    if code.shape[0] > _TEXT_TOP - 2 * _QUIET or code.shape[1] > canvas.shape[1] - 2 * _QUIET:
+        code = cv2.resize(code, None, fx=0.5, fy=0.5, interpolation=cv2.INTER_NEAREST)
+    x0, y0, x1, y1 = _paste(canvas, code, rng, bottom=_TEXT_TOP)
+    ttn_box = (x0 - _QUIET, y0 - _QUIET, x1 + _QUIET, y1 + _QUIET)
+    meta = {"ttn": ttn, "format": fmt, "decoys": 0, "distortions": []}
+
+    for _ in range(rng.randint(0, 3)):  # короткі внутрішні номери маркетплейсів
+        decoy = _barcode(str(rng.randint(10_000, 9_999_999)), "code128", scale=2)
+        if _paste(canvas, decoy, rng, avoid=ttn_box) is not None:
+            meta["decoys"] += 1
+    cv2.putText(canvas, "NOVA POSHTA  " + ttn, (40, 1240), cv2.FONT_HERSHEY_SIMPLEX, 1.2, (0, 0, 0), 2)
+    # еталон: до спотворень код ТТН читається, інакше точність міряла б генератор
+    assert ttn in {r.text for r in zxingcpp.read_barcodes(canvas)}, f"generated label lost its TTN {ttn}"
+
+    img = canvas
+    if rng.random() < 0.5:
+        angle = rng.uniform(-25, 25)
+        m = cv2.getRotationMatrix2D((img.shape[1] / 2, img.shape[0] / 2), angle, 1.0)
+        img = cv2.warpAffine(img, m, (img.shape[1], img.shape[0]), borderValue=(255, 255, 255))
+        meta["distortions"].append(f"rotate{angle:+.0f}")
+    if rng.random() < 0.4:
+        h, w = img.shape[:2]
+        d = 0.08
+        src = np.float32([[0, 0], [w, 0], [w, h], [0, h]])
+        dst = np.float32([[rng.uniform(0, d) * w, rng.uniform(0, d) * h],
+                          [w - rng.uniform(0, d) * w, rng.uniform(0, d) * h],
+                          [w - rng.uniform(0, d) * w, h - rng.uniform(0, d) * h],
+                          [rng.uniform(0, d) * w, h - rng.uniform(0, d) * h]])
+        img = cv2.warpPerspective(img, cv2.getPerspectiveTransform(src, dst), (w, h),
+                                  borderValue=(255, 255, 255))
+        meta["distortions"].append("perspective")
+    if rng.random() < 0.5:
+        k = rng.choice((3, 5, 7))
+        img = cv2.GaussianBlur(img, (k, k), 0)
+        meta["distortions"].append(f"blur{k}")
+    if rng.random() < 0.4:
+        sigma = rng.uniform(5, 20)
+        noise = np.random.default_rng(rng.randint(0, 2**31)).normal(0, sigma, img.shape)
+        img = np.clip(img.astype(np.float32) + noise, 0, 255).astype(np.uint8)
+        meta["distortions"].append(f"noise{sigma:.0f}")
+    quality = rng.randint(35, 95)
+    ok, enc = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if rng.random() < 0.3:  # пересилання через месенджери = повторне стискання
+        ok, enc = cv2.imencode(".jpg", cv2.imdecode(enc, cv2.IMREAD_COLOR),
+                               [cv2.IMWRITE_JPEG_QUALITY, rng.randint(35, 80)])
+        meta["distortions"].append("recompress")
+    meta["jpeg_quality"] = quality
+    return enc.tobytes(), meta
+
+
+def generate_corpus(count: int, seed: int) -> list[tuple[bytes, dict]]:
+    rng = random.Random(seed)
+    return [_label(rng) for _ in range(count)]
+
+
+# ── прогін ──
+def _decode_one(image_bytes: bytes):
+    started = time.perf_counter()
+    result = decode_detailed(image_bytes)
+    return result, time.perf_counter() - started
+
+
+def _percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def _throughput(corpus, workers: int) -> float:
+    """Фото/сек у пулі з workers процесів (spawn, як у боті)."""
+    import multiprocessing
+
+    payload = [img for img, _ in corpus]
+    with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        list(pool.map(_decode_one, payload[:workers]))  # прогрів: імпорти у воркерах
+        started = time.perf_counter()
+        list(pool.map(_decode_one, payload))
+        return len(payload) / (time.perf_counter() - started)
+
+
+def run(corpus, workers: int) -> dict:
+    stats = VariantStats()
+    latencies, correct, by_format = [], 0, {}
+    started = time.perf_counter()
+    for image_bytes, meta in corpus:
+        result, spent = _decode_one(image_bytes)
+        stats.record(result)
+        latencies.append(spent)
+        hit = meta["ttn"] in result.codes
+        correct += hit
+        fmt = by_format.setdefault(meta["format"], {"total": 0, "correct": 0})
+        fmt["total"] += 1
+        fmt["correct"] += hit
+    single_elapsed = time.perf_counter() - started
+
+    report = {
+        "images": len(corpus),
+        "accuracy": round(correct / len(corpus), 4) if corpus else 0.0,
+        "by_format": by_format,
+        "latency_ms": {
+            "p50": round(1000 * _percentile(latencies, 0.50), 1),
+            "p95": round(1000 * _percentile(latencies, 0.95), 1),
+            "p99": round(1000 * _percentile(latencies, 0.99), 1),
+            "mean": round(1000 * statistics.fmean(latencies), 1) if latencies else 0.0,
+        },
+        "variants": stats.snapshot(),
+        "found_at": stats.stages,
+        # ru_maxrss у Linux — КБ
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "throughput_per_s": {"single": round(len(corpus) / single_elapsed, 2) if single_elapsed else 0.0},
+    }
+    if workers > 1:
+        report["throughput_per_s"][f"pool{workers}"] = round(_throughput(corpus, workers), 2)
+    return report
+
+
+def compare(current: dict, baseline: dict) -> list[str]:
+    """Список регресій відносно baseline (порожній — усе гаразд)."""
+    problems = []
+    drop = baseline["accuracy"] - current["accuracy"]
+    if drop > _MAX_ACCURACY_DROP:
+        problems.append(f"accuracy {baseline['accuracy']:.3f} -> {current['accuracy']:.3f}")
+    old_p95, new_p95 = baseline["latency_ms"]["p95"], current["latency_ms"]["p95"]
+    if old_p95 and (new_p95 - old_p95) / old_p95 > _MAX_LATENCY_GROWTH:
+        problems.append(f"p95 latency {old_p95}ms -> {new_p95}ms")
+    return problems
+
+
+def main(argv) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=100, help="к-сть синтетичних етикеток")
+    parser.add_argument("--seed", type=int, default=1, help="зерно генератора (відтворюваність)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="процесів для заміру пропускної здатності (1 — без пулу)")
+    parser.add_argument("--out", help="зберегти JSON-звіт у файл")
+    parser.add_argument("--compare", help="JSON попередньої версії для пошуку регресій")
+    parser.add_argument("--save-corpus", help="зберегти згенеровані фото в папку")
+    args = parser.parse_args(argv)
+
+    corpus = generate_corpus(args.count, args.seed)
+    if args.save_corpus:
+        out_dir = Path(args.save_corpus)
+        out_dir.mkdir(parents=True, exist_ok=True)
+        for i, (image_bytes, meta) in enumerate(corpus):
+            (out_dir / f"{i:04d}_{meta['format']}_{meta['ttn']}.jpg").write_bytes(image_bytes)
+        (out_dir / "corpus.json").write_text(
+            json.dumps([m for _, m in corpus], ensure_ascii=False, indent=1), encoding="utf-8"
+        )
+
+    report = run(corpus, args.workers)
+    report["seed"] = args.seed
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.out:
+        Path(args.out).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    if args.compare:
+        problems = compare(report, json.loads(Path(args.compare).read_text(encoding="utf-8")))
+        for p in problems:
+            print(f"[REGRESSION] {p}")
+        return 1 if problems else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,103 @@
+"""Програвання записаних апдейтів Telegram на webhook бота (локальний тест).
+
+Бот запускається з BOT_MODE=webhook-local: приймає POST-и на WEBHOOK_PATH,
+але не реєструє webhook у Telegram. Скрипт шле апдейти з файлу (JSON-масив
+або JSONL, як їх віддає getUpdates) і друкує статус/латентність відповіді —
+зручно перевірити секрет, швидкий 200 і поведінку під пачкою апдейтів.
+
+Записати реальні апдейти (поки webhook не встановлено, інакше getUpdates
+поверне конфлікт):
+    python -m scripts.replay_updates --fetch updates.jsonl
+Програти:
+    python -m scripts.replay_updates updates.jsonl --url http://127.0.0.1:8080/webhook
+    python -m scripts.replay_updates updates.jsonl --concurrency 20 --repeat 5
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from pathlib import Path
+
+import aiohttp
+
+from app import settings
+from app.webhook import SECRET_HEADER
+
+
+def load_updates(path: Path) -> list[dict]:
+    text = path.read_text(encoding="utf-8").strip()
+    if text.startswith("["):
+        return json.loads(text)
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+async def fetch(path: Path) -> int:
+    """Зберегти апдейти, що чекають у Telegram (getUpdates без підтвердження offset)."""
+    url = f"https://api.telegram.org/bot{settings.TOKEN}/getUpdates"
+    async with aiohttp.ClientSession() as session:
+        async with session.get(url, params={"timeout": 0}) as resp:
+            payload = await resp.json()
+    if not payload.get("ok"):
+        print(f"getUpdates failed: {payload.get('description')}")
+        return 1
+    with path.open("w", encoding="utf-8") as f:
+        for update in payload["result"]:
+            f.write(json.dumps(update, ensure_ascii=False) + "\n")
+    print(f"Saved {len(payload['result'])} updates -> {path}")
+    return 0
+
+
+def _percentile_ms(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    return 1000 * ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+async def replay(updates: list[dict], url: str, secret: str, concurrency: int, repeat: int) -> int:
+    headers = {SECRET_HEADER: secret} if secret else {}
+    slots = asyncio.Semaphore(concurrency)
+    latencies: list[float] = []
+    statuses: dict[int, int] = {}
+
+    async def post(session: aiohttp.ClientSession, update: dict) -> None:
+        async with slots:
+            started = time.perf_counter()
+            async with session.post(url, json=update, headers=headers) as resp:
+                await resp.read()
+                latencies.append(time.perf_counter() - started)
+                statuses[resp.status] = statuses.get(resp.status, 0) + 1
+
+    payload = [dict(u, update_id=u.get("update_id", 0) + i * 1_000_000)
+               for i in range(repeat) for u in updates]
+    started = time.perf_counter()
+    async with aiohttp.ClientSession() as session:
+        await asyncio.gather(*(post(session, u) for u in payload))
+    elapsed = time.perf_counter() - started
+
+    print(f"Posted {len(payload)} updates in {elapsed:.2f}s; statuses: {statuses}")
+    if latencies:
+        print(f"ack latency ms: p50={_percentile_ms(latencies, 0.5):.1f} "
+              f"p95={_percentile_ms(latencies, 0.95):.1f} max={1000 * max(latencies):.1f}")
+    return 0 if set(statuses) == {200} else 1
+
+
+def main(argv) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("file", nargs="?", help="JSON/JSONL з апдейтами")
+    parser.add_argument("--fetch", metavar="OUT", help="записати апдейти з getUpdates у файл і вийти")
+    parser.add_argument("--url", default=f"http://127.0.0.1:{settings.PORT}{settings.WEBHOOK_PATH}")
+    parser.add_argument("--secret", default=settings.WEBHOOK_SECRET, help="за замовчуванням WEBHOOK_SECRET")
+    parser.add_argument("--concurrency", type=int, default=1, help="одночасних POST-ів")
+    parser.add_argument("--repeat", type=int, default=1, help="скільки разів програти файл")
+    args = parser.parse_args(argv)
+
+    if args.fetch:
+        return asyncio.run(fetch(Path(args.fetch)))
+    if not args.file:
+        parser.error("потрібен файл з апдейтами або --fetch")
+    updates = load_updates(Path(args.file))
+    return asyncio.run(replay(updates, args.url, args.secret, args.concurrency, args.repeat))
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,11 @@
+import time
+
+import pytest
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Керований time.monotonic: тест рухає час через clock[0] += секунди."""
+    now = [1000.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    return now
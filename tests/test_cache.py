@@ -0,0 +1,38 @@
+from app.cache import TTLCache
+
+
+def test_expires_after_ttl(clock):
+    cache = TTLCache(maxsize=10, ttl=60)
+    cache.set("a", 1)
+    clock[0] += 59
+    assert cache.get("a") == 1
+    clock[0] += 1
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_per_entry_ttl(clock):
+    cache = TTLCache(maxsize=10, ttl=3600)
+    cache.set("long", [1])
+    cache.set("short", [], ttl=60)
+    clock[0] += 61
+    assert cache.get("short") is None
+    assert cache.get("long") == [1]
+
+
+def test_evicts_least_recently_used(clock):
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")  # "b" тепер найстаріший
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+
+
+def test_stats(clock):
+    cache = TTLCache(maxsize=10, ttl=60)
+    cache.set("a", 1)
+    cache.get("a")
+    cache.get("missing")
+    assert cache.stats() == {"size": 1, "hits": 1, "misses": 1, "hit_ratio": 0.5}
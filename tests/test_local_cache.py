@@ -0,0 +1,110 @@
+import pytest
+
+from app import settings
+from app.storage import local_cache, local_csv
+from app.storage.local_csv import CsvStore, write_csv_file
+from app.storage.local_sqlite import SqliteStore
+
+
+def _google(*ttns):
+    return [{"row": str(i), "TTN": ttn, "Date": "", "Username": ""} for i, ttn in enumerate(ttns, start=2)]
+
+
+@pytest.fixture(params=["csv", "sqlite"])
+def store(request, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # бекенди пишуть файли відносно робочого каталогу
+    store = CsvStore() if request.param == "csv" else SqliteStore(str(tmp_path / "local.db"))
+    store.ensure()
+    return store
+
+
+def _pending(store) -> list[tuple[str, str]]:
+    return [(r["row"], r["TTN"]) for r in store.warehouse_rows_after(store.read_push_mark())]
+
+
+def test_pull_keeps_rows_not_yet_pushed(store):
+    store.replace_warehouse_rows(_google("A", "B"))
+    store.merge_buffer_into_warehouse([{"TTN": "C"}, {"TTN": "D"}])
+    assert _pending(store) == [("4", "C"), ("5", "D")]
+
+    # у Google тим часом дописали X, а D вже встиг запушитись
+    store.replace_warehouse_rows(_google("A", "B", "X", "D"))
+    assert store.read_push_mark() == 5
+    assert _pending(store) == [("6", "C")]
+
+
+def test_pull_without_mark_keeps_everything_missing_in_google(store):
+    store.merge_buffer_into_warehouse([{"TTN": "A"}, {"TTN": "B"}])
+    assert store.read_push_mark() is None
+    store.replace_warehouse_rows(_google("A"))
+    assert _pending(store) == [("3", "B")]
+
+
+def test_merge_after_pull_continues_numbering(store):
+    store.merge_buffer_into_warehouse([{"TTN": "C"}])
+    store.replace_warehouse_rows(_google("A", "B"))
+    store.merge_buffer_into_warehouse([{"TTN": "E"}, {"TTN": "C"}])
+    assert _pending(store) == [("4", "C"), ("5", "E")]
+
+
+def test_clear_drops_unpushed_rows_and_resets_mark(store):
+    store.replace_warehouse_rows(_google("A"))
+    store.merge_buffer_into_warehouse([{"TTN": "B"}])
+    store.clear_ttn_locals()
+    assert store.read_push_mark() == 1
+    assert store.warehouse_rows_after(1) == []
+    assert store.count_office_ttn() == 0
+    store.merge_buffer_into_warehouse([{"TTN": "B"}])  # нова доба: той самий ТТН знову новий
+    assert _pending(store) == [("2", "B")]
+
+
+def test_sqlite_imports_csv_cache_once(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    csv_store = CsvStore()
+    csv_store.ensure()
+    csv_store.replace_office_rows([{"row": "2", "TTN": "A", "Date": "d", "Username": "u"}])
+    csv_store.merge_buffer_into_warehouse([{"TTN": "B"}])
+    csv_store.write_push_mark(1)
+    csv_store.add_ttns_to_buffer(["C"], "u", "42")
+    write_csv_file(local_csv.LOCAL_BUFFER_FILE, local_csv.BUFFER_HEADERS,
+                   [{"TTN": "D", "Username": "old", "Chat": ""}])  # буфер ще старішої версії
+
+    store = SqliteStore(str(tmp_path / "local.db"))
+    store.ensure()
+    assert store.find_office_rows(["A"]) == ["2"]
+    assert store.read_push_mark() == 1
+    assert [(r["row"], r["TTN"]) for r in store.warehouse_rows_after(1)] == [("2", "B")]
+    assert sorted(store.buffer_chats()) == ["", "42"]
+
+    # повторний старт не імпортує CSV вдруге поверх живих даних
+    store.take_buffer("42")
+    store.ensure()
+    assert store.buffer_chats() == [""]
+
+
+def test_sqlite_without_csv_starts_empty(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    store = SqliteStore(str(tmp_path / "local.db"))
+    store.ensure()
+    assert store.read_push_mark() is None
+    assert store.buffer_chats() == []
+    assert store.count_office_ttn() == 0
+
+
+@pytest.mark.parametrize("backend, cls", [("csv", CsvStore), ("sqlite", SqliteStore)])
+def test_backend_follows_setting(backend, cls, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(settings, "LOCAL_STORAGE", backend)
+    monkeypatch.setattr(settings, "LOCAL_DB_FILE", str(tmp_path / "local.db"))
+    monkeypatch.setattr(local_cache, "_store", None)
+    local_cache.ensure_local_files()
+    assert isinstance(local_cache._backend(), cls)
+    local_cache.add_ttns_to_buffer(["A"], "u", "42")
+    assert local_cache.buffer_chats() == ["42"]
+
+
+def test_unknown_backend_is_rejected(monkeypatch):
+    monkeypatch.setattr(settings, "LOCAL_STORAGE", "redis")
+    monkeypatch.setattr(local_cache, "_store", None)
+    with pytest.raises(ValueError, match="redis"):
+        local_cache._backend()
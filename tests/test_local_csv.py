@@ -0,0 +1,93 @@
+import json
+
+import pytest
+
+from app.storage import local_csv
+from app.storage.local_csv import CsvStore, read_buffer_journal, write_csv_file
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # файли кешу — відносно робочого каталогу
+    store = CsvStore()
+    store.ensure()
+    return store
+
+
+def _restart() -> CsvStore:
+    store = CsvStore()
+    store.ensure()
+    return store
+
+
+def _journal() -> list[dict]:
+    with open(local_csv.BUFFER_JOURNAL_FILE, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_buffer_survives_restart(store):
+    store.add_ttns_to_buffer(["A", "B"], "u1", "1")
+    store.add_ttns_to_buffer(["C", "A"], "u2", "2")
+    store.add_ttns_to_buffer(["A"], "u1", "1")  # повтор у тому ж чаті не дублюється
+    store.add_ttns_to_buffer(["D"], "u3", "3")
+    assert store.take_buffer("3") == [{"TTN": "D", "Username": "u3", "Chat": "3"}]
+
+    store = _restart()
+    assert store.buffer_chats() == ["1", "2"]
+    assert store.take_buffer("1") == [
+        {"TTN": "A", "Username": "u1", "Chat": "1"},
+        {"TTN": "B", "Username": "u1", "Chat": "1"},
+    ]
+    assert [e["TTN"] for e in store.take_buffer("2")] == ["C", "A"]
+
+
+def test_torn_last_line_is_skipped(store):
+    store.add_ttns_to_buffer(["A"], "u", "1")
+    with open(local_csv.BUFFER_JOURNAL_FILE, "a", encoding="utf-8") as f:
+        f.write('{"op": "add", "chat": "1", "tt')  # падіння посеред запису
+    assert read_buffer_journal() == [{"TTN": "A", "Username": "u", "Chat": "1"}]
+    assert [e["TTN"] for e in _restart().take_buffer("1")] == ["A"]
+
+
+def test_journal_is_compacted(store, monkeypatch):
+    store.add_ttns_to_buffer(["A"], "u", "1")
+    store.add_ttns_to_buffer(["B"], "u", "2")
+    store.take_buffer("1")
+    assert [r["op"] for r in _journal()] == ["add", "add", "take"]
+
+    # старт переписує журнал знімком
+    store = _restart()
+    assert _journal() == [{"op": "add", "chat": "2", "ttn": "B", "user": "u"}]
+
+    # і порожній буфер — порожній журнал
+    store.take_buffer("2")
+    assert _journal() == []
+
+    monkeypatch.setattr(local_csv, "_JOURNAL_COMPACT_RECORDS", 3)
+    store.add_ttns_to_buffer(["A", "B"], "u", "1")
+    store.add_ttns_to_buffer(["C"], "u", "2")
+    store.take_buffer("2")  # розрісся журнал -> знімок замість запису take
+    assert _journal() == [
+        {"op": "add", "chat": "1", "ttn": "A", "user": "u"},
+        {"op": "add", "chat": "1", "ttn": "B", "user": "u"},
+    ]
+
+
+def test_legacy_csv_buffer_moves_into_journal(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_csv_file(local_csv.LOCAL_BUFFER_FILE, ["TTN", "Username"], [{"TTN": "A", "Username": "old"}])
+    store = _restart()
+    assert not (tmp_path / local_csv.LOCAL_BUFFER_FILE).exists()
+    assert store.buffer_chats() == [""]
+    assert _restart().take_buffer("") == [{"TTN": "A", "Username": "old", "Chat": ""}]
+
+
+def test_merge_appends_new_rows_once(store):
+    store.merge_buffer_into_warehouse([{"TTN": "A"}, {"TTN": "B"}, {"TTN": "A"}])
+    store.merge_buffer_into_warehouse([{"TTN": "B"}, {"TTN": "C"}])
+    _, rows = local_csv.read_csv_file(local_csv.LOCAL_WAREHOUSE_FILE)
+    assert [(r["row"], r["TTN"]) for r in rows] == [("2", "A"), ("3", "B"), ("4", "C")]
+    # індекс після рестарту будується з файлу
+    store = _restart()
+    store.merge_buffer_into_warehouse([{"TTN": "C"}, {"TTN": "D"}])
+    assert [(r["row"], r["TTN"]) for r in store.warehouse_rows_after(1)][-1] == ("5", "D")
@@ -0,0 +1,49 @@
+import asyncio
+
+from app.storage.users import AdminNotifier, _fingerprint
+
+
+class _Outbound:
+    def __init__(self) -> None:
+        self.sent: list[tuple[str, str]] = []
+
+    async def send_message(self, chat_id, text, **kwargs) -> None:
+        self.sent.append((chat_id, text))
+
+
+class _Users:
+    def admin_ids(self) -> list[str]:
+        return ["1"]
+
+
+def test_fingerprint_normalises_numbers_lists_and_quotes():
+    assert _fingerprint("Missing TTНs: ['204', '205'] in chat 42") == _fingerprint(
+        "Missing TTНs: ['1'] in chat 7"
+    )
+    assert _fingerprint('Key "abc" failed') == _fingerprint("Key 'xyz' failed")
+
+
+def test_fingerprint_keeps_apostrophes():
+    assert _fingerprint("Can't reach Google's API") == "Can't reach Google's API"
+    assert _fingerprint("Can't reach Google's API") != _fingerprint("Can't parse Google's reply")
+
+
+def test_repeats_are_folded_into_digest():
+    outbound = _Outbound()
+    notifier = AdminNotifier(outbound, _Users())
+
+    async def scenario() -> None:
+        for chat in range(5):
+            await notifier.notify(f"Buffer processing failed for chat {chat}")
+        await notifier.notify("Sheets down")
+        await notifier.notify("Sheets down")
+        await notifier.send_digest()
+        await notifier.send_digest()  # порожній — нічого не шле
+
+    asyncio.run(scenario())
+    texts = [text for _, text in outbound.sent]
+    assert texts[:2] == ["[ALERT] Buffer processing failed for chat 0", "[ALERT] Sheets down"]
+    assert len(texts) == 3
+    digest = texts[2].splitlines()
+    assert digest[0].startswith("[DIGEST]")
+    assert digest[1:] == ["4 × Buffer processing failed for chat 1", "1 × Sheets down"]
@@ -0,0 +1,97 @@
+import asyncio
+
+import pytest
+
+from app import settings
+from app.services.outbound import PRIORITY_BULK, OutboundDispatcher, _TokenBucket
+
+
+def test_burst_up_to_capacity(clock):
+    bucket = _TokenBucket(rate=1, capacity=3)
+    assert [bucket.reserve() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket.reserve() == pytest.approx(1.0)
+
+
+def test_waits_accumulate_in_order(clock):
+    bucket = _TokenBucket(rate=2, capacity=1)
+    assert bucket.reserve() == 0.0
+    assert bucket.reserve() == pytest.approx(0.5)
+    assert bucket.reserve() == pytest.approx(1.0)
+
+
+def test_refills_over_time_up_to_capacity(clock):
+    bucket = _TokenBucket(rate=1, capacity=2)
+    bucket.reserve()
+    bucket.reserve()
+    clock[0] += 100  # простій не накопичує більше capacity
+    assert [bucket.reserve() for _ in range(2)] == [0.0, 0.0]
+    assert bucket.reserve() == pytest.approx(1.0)
+
+
+def test_wait_does_not_take_a_token(clock):
+    bucket = _TokenBucket(rate=2, capacity=1)
+    assert bucket.wait() == 0.0
+    bucket.reserve()
+    assert bucket.wait() == pytest.approx(0.5)
+    assert bucket.wait() == pytest.approx(0.5)
+    clock[0] += 0.5
+    assert bucket.wait() == 0.0
+
+
+class _Bot:
+    def __init__(self) -> None:
+        self.sent: list[tuple[object, str, float]] = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent.append((chat_id, text, asyncio.get_running_loop().time()))
+        return text
+
+
+def _run(scenario, workers: int = 8):
+    async def main():
+        bot = _Bot()
+        dispatcher = OutboundDispatcher(bot, workers=workers)
+        dispatcher.start()
+        try:
+            await scenario(dispatcher)
+        finally:
+            await dispatcher.close(timeout=0)
+        return bot.sent
+
+    return asyncio.run(main())
+
+
+def test_burst_to_one_chat_does_not_stall_others():
+    async def scenario(dispatcher):
+        for i in range(20):
+            await dispatcher.send_message(100, f"scan {i}", wait=False)
+        started = asyncio.get_running_loop().time()
+        await asyncio.wait_for(dispatcher.send_message(200, "other"), 0.5)
+        assert asyncio.get_running_loop().time() - started < 0.2
+        assert dispatcher.stats()["queue_depth"] > 0  # сплеск у чат 100 ще чекає на ліміті
+
+    sent = _run(scenario)
+    assert [text for chat, text, _ in sent if chat == 100] == ["scan 0", "scan 1", "scan 2"]
+
+
+def test_keeps_order_within_chat(monkeypatch):
+    monkeypatch.setattr(settings, "OUTBOUND_CHAT_RATE", 1000.0)
+
+    async def scenario(dispatcher):
+        await asyncio.gather(*(dispatcher.send_message(1, str(i)) for i in range(30)))
+
+    assert [text for _, text, _ in _run(scenario)] == [str(i) for i in range(30)]
+
+
+def test_interactive_goes_before_bulk():
+    async def main():
+        bot = _Bot()
+        dispatcher = OutboundDispatcher(bot, workers=1)
+        for chat in range(1, 6):  # воркер ще не запущений — усе чекає в черзі
+            await dispatcher.send_message(chat, "report", priority=PRIORITY_BULK, wait=False)
+        await dispatcher.send_message(99, "reply", wait=False)
+        dispatcher.start()
+        await dispatcher.close(timeout=1)
+        return [text for _, text, _ in bot.sent]
+
+    assert asyncio.run(main()) == ["reply"] + ["report"] * 5
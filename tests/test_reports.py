@@ -0,0 +1,42 @@
+import asyncio
+
+from apscheduler.schedulers.background import BackgroundScheduler
+
+from app.services.reports import ReportService
+from app.storage.users import UserRepository
+
+
+class _Sheets:
+    def __init__(self, rows) -> None:
+        self.rows = [["tg_id", "role", "username", "time", "last_sent", "admin"], *rows]
+
+    async def get_users_values(self):
+        return self.rows
+
+
+def _jobs(scheduler) -> list[str]:
+    return sorted(job.id for job in scheduler.get_jobs())
+
+
+def test_one_job_per_subscription_time(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # журнал users
+    users = UserRepository(_Sheets([
+        ["1", "Офіс", "ann", "22:00", "", ""],
+        ["2", "Склад", "bob", "22:00", "", ""],
+        ["3", "Офіс", "eve", "25:99", "", ""],  # биті дані з таблиці ігноруються
+    ]))
+    scheduler = BackgroundScheduler()  # не запущений: задачі лише реєструються
+    scheduler.add_job(print, "interval", minutes=5, id="refresh")
+    service = ReportService(None, None, users, None)
+    service.schedule_subscriptions(scheduler)
+
+    async def run():
+        await users.load()
+        assert _jobs(scheduler) == ["refresh", "subs:22:00"]
+        await users.update("1", "Офіс", "ann", "09:00")
+        assert _jobs(scheduler) == ["refresh", "subs:09:00", "subs:22:00"]
+        await users.update("2", "Склад", "bob", "")
+        assert _jobs(scheduler) == ["refresh", "subs:09:00"]
+
+    asyncio.run(run())
+    assert scheduler.get_job("subs:09:00").args == ("09:00",)
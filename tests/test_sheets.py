@@ -0,0 +1,124 @@
+import asyncio
+
+import pytest
+
+from app.storage.sheets import CircuitBreaker, Sheets, SheetsUnavailable
+
+
+@pytest.fixture
+def breaker(clock):
+    breaker = CircuitBreaker(threshold=3, cooldown=30)
+    breaker.events = []
+    breaker.on_state(breaker.events.append)
+    return breaker
+
+
+def test_opens_after_threshold_consecutive_failures(breaker):
+    for _ in range(2):
+        breaker.failure(TimeoutError())
+    breaker.success()  # успіх скидає лічильник
+    for _ in range(2):
+        breaker.failure(TimeoutError())
+    breaker.allow()
+    breaker.failure(TimeoutError("boom"))
+    assert breaker.state == "open"
+    assert breaker.events == ["open"]
+    with pytest.raises(SheetsUnavailable, match="boom"):
+        breaker.allow()
+
+
+def test_half_open_lets_one_probe_through(breaker, clock):
+    for _ in range(3):
+        breaker.failure(TimeoutError())
+    clock[0] += 30
+    breaker.allow()  # пробна операція
+    assert breaker.state == "half_open"
+    with pytest.raises(SheetsUnavailable):
+        breaker.allow()
+    breaker.success()
+    assert breaker.state == "closed"
+    assert breaker.events == ["open", "closed"]
+    breaker.allow()
+
+
+def test_failed_probe_doubles_cooldown(breaker, clock):
+    for _ in range(3):
+        breaker.failure(TimeoutError())
+    clock[0] += 30
+    breaker.allow()
+    breaker.failure(TimeoutError())
+    assert breaker.state == "open"
+    assert breaker.cooldown == 60
+    assert breaker.events == ["open"]  # повторне відкриття — не новий перехід
+    clock[0] += 30
+    with pytest.raises(SheetsUnavailable):
+        breaker.allow()
+    clock[0] += 30
+    breaker.allow()
+    breaker.success()
+    assert breaker.cooldown == 30
+
+
+def test_listener_error_does_not_break_breaker(clock):
+    breaker = CircuitBreaker(threshold=1, cooldown=30)
+    breaker.on_state(lambda state: 1 / 0)
+    breaker.failure(TimeoutError())
+    assert breaker.state == "open"
+
+
+class _Worksheet:
+    """Таблиця ТТН для clear_ttn: заголовок, очищення, ревізія Drive."""
+
+    def __init__(self) -> None:
+        self.version = 1
+        self.gate: asyncio.Event | None = None
+
+    async def row_values(self, row):
+        if self.gate is not None:
+            await self.gate.wait()
+        return ["TTN", "Date", "Username"]
+
+    async def clear(self):
+        self.version += 1
+
+    async def append_row(self, values):
+        self.version += 1
+
+    async def revision(self):
+        return str(self.version)
+
+
+def _half_open(sheets: Sheets, clock) -> None:
+    for _ in range(sheets.breaker.threshold):
+        sheets.breaker.failure(TimeoutError())
+    clock[0] += sheets.breaker.cooldown
+
+
+def test_cancelled_probe_releases_half_open(clock):
+    sheets = Sheets()
+    sheets.ttn = _Worksheet()
+    _half_open(sheets, clock)
+
+    async def scenario() -> None:
+        sheets.ttn.gate = asyncio.Event()
+        probe = asyncio.create_task(sheets.clear_ttn())
+        await asyncio.sleep(0)
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+        sheets.ttn.gate = None
+        await sheets.clear_ttn()  # наступний виклик стає новою пробою
+
+    asyncio.run(scenario())
+    assert sheets.breaker.state == "closed"
+
+
+def test_own_write_revision_is_not_rejected_during_probe(clock):
+    sheets = Sheets()
+    sheets.ttn = _Worksheet()
+    sheets.revisions["ttn"] = "drive:1"
+    _half_open(sheets, clock)
+
+    asyncio.run(sheets.clear_ttn())
+    assert sheets.breaker.state == "closed"
+    assert sheets.revisions["ttn"] == "drive:3"
@@ -0,0 +1,136 @@
+import asyncio
+import threading
+
+import pytest
+
+from app.storage import users as users_module
+from app.storage.users import UserRepository
+
+_HEADER = ["tg_id", "role", "username", "time", "last_sent", "admin"]
+
+
+class _Sheets:
+    """Таблиця користувачів у пам'яті (лише те, що чіпає UserRepository)."""
+
+    def __init__(self, rows=()) -> None:
+        self.rows = [list(_HEADER)] + [list(r) for r in rows]
+
+    async def get_users_values(self):
+        return [list(r) for r in self.rows]
+
+    async def user_ids_at(self, rows):
+        return [self.rows[r - 1][0] for r in rows]
+
+    async def write_user_rows(self, rows):
+        for r, values in rows.items():
+            self.rows[r - 1] = list(values)
+
+    async def append_user_rows(self, values):
+        first = len(self.rows) + 1
+        self.rows += [list(v) for v in values]
+        return first
+
+
+@pytest.fixture(autouse=True)
+def _workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # журнал і знімок пишуться відносно робочого каталогу
+
+
+def _journal() -> list[str]:
+    with open(users_module.USERS_JOURNAL_FILE, encoding="utf-8") as f:
+        return f.read().splitlines()
+
+
+def test_update_is_journaled_and_replayed_after_restart():
+    async def first_run():
+        repo = UserRepository(_Sheets())
+        await repo.load()
+        await repo.update("1", "Склад", "ann", "22:00")
+        await repo.update("1", "Офіс", "ann", "22:00")  # коалесценція за tg_id
+
+    async def second_run():
+        repo = UserRepository(_Sheets())
+        await repo.load()
+        return repo
+
+    asyncio.run(first_run())
+    assert len(_journal()) == 2
+    repo = asyncio.run(second_run())
+    assert repo.pending_count == 1
+    assert repo.get("1").role == "Офіс"
+    assert repo.subscribers_at("22:00") == ["1"]
+
+
+def test_flush_writes_rows_and_compacts_journal():
+    sheets = _Sheets([["1", "Офіс", "ann", "", "", "admin"]])
+
+    async def scenario():
+        repo = UserRepository(sheets)
+        await repo.load()
+        await repo.update("1", "Склад", "ann", "")
+        await repo.update("2", "Офіс", "bob", "09:00")
+        assert await repo.flush()
+        return repo
+
+    repo = asyncio.run(scenario())
+    assert sheets.rows[1] == ["1", "Склад", "ann", "", "", "admin"]  # колонку F не затерто
+    assert sheets.rows[2] == ["2", "Офіс", "bob", "09:00", "", ""]
+    assert repo.pending_count == 0
+    assert _journal() == []
+
+
+def test_reload_keeps_updates_not_yet_written(monkeypatch):
+    sheets = _Sheets([["1", "Офіс", "ann", "", "", ""]])
+    disk = threading.Event()
+    real_write = users_module._journal_write
+    monkeypatch.setattr(users_module, "_journal_write", lambda lines: disk.wait(5) and real_write(lines))
+
+    async def scenario():
+        repo = UserRepository(sheets)
+        await repo.load()
+        update = asyncio.create_task(repo.update("1", "Склад", "ann", "10:00"))
+        await asyncio.sleep(0.05)  # update чекає на диск, рядок іще не в журналі
+        await repo.load()
+        disk.set()
+        await update
+        return repo
+
+    repo = asyncio.run(scenario())
+    assert repo.get("1").role == "Склад"
+    assert repo.subscribers_at("10:00") == ["1"]
+
+
+def test_journal_is_read_only_once(monkeypatch):
+    calls = []
+    real = users_module._read_journal
+    monkeypatch.setattr(users_module, "_read_journal", lambda: calls.append(1) or real())
+
+    async def scenario():
+        repo = UserRepository(_Sheets())
+        await repo.load_snapshot()
+        await repo.load()
+        await repo.load()
+
+    asyncio.run(scenario())
+    assert calls == [1]
+
+
+def test_subscription_index_follows_updates():
+    async def run():
+        repo = UserRepository(_Sheets([["1", "Офіс", "ann", "22:00", "", ""], ["2", "Склад", "bob", "", "", ""]]))
+        calls = []
+        repo.on_subscriptions_changed(lambda: calls.append(repo.subscription_times()))
+        await repo.load()
+        assert repo.subscribers_at("22:00") == ["1"]
+
+        await repo.update("2", "Склад", "bob", "22:00")  # той самий час — розклад не змінюється
+        assert sorted(repo.subscribers_at("22:00")) == ["1", "2"]
+        await repo.update("1", "Офіс", "ann", "09:00")
+        await repo.update("2", "Склад", "bob", "")
+        assert repo.subscribers_at("22:00") == []
+        return repo, calls
+
+    repo, calls = asyncio.run(run())
+    assert repo.subscription_times() == ["09:00"]
+    assert repo.subscribers_at("09:00") == ["1"]
+    assert calls == [["22:00"], ["09:00", "22:00"], ["09:00"]]
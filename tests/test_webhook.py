@@ -0,0 +1,43 @@
+import asyncio
+
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+from app.webhook import SECRET_HEADER, WebhookHandler
+
+
+class _Dispatcher:
+    def __init__(self) -> None:
+        self.updates: list[dict] = []
+
+    async def feed_raw_update(self, bot, update) -> None:
+        self.updates.append(update)
+
+
+def _post_all(requests: list[dict]) -> tuple[list[int], list[dict]]:
+    async def main():
+        dp = _Dispatcher()
+        handler = WebhookHandler(dp, bot=None, secret="s3cret", max_updates=4)
+        app = web.Application()
+        handler.register(app, "/webhook")
+        statuses = []
+        async with TestClient(TestServer(app)) as client:
+            for headers in requests:
+                resp = await client.post("/webhook", json={"update_id": 1}, headers=headers)
+                statuses.append(resp.status)
+            await handler.close()
+        return statuses, dp.updates
+
+    return asyncio.run(main())
+
+
+def test_secret_header_is_checked():
+    statuses, updates = _post_all([{SECRET_HEADER: "s3cret"}, {SECRET_HEADER: "wrong"}, {}])
+    assert statuses == [200, 401, 401]
+    assert len(updates) == 1
+
+
+def test_non_ascii_secret_is_rejected_not_500():
+    statuses, updates = _post_all([{SECRET_HEADER: "сікрет".encode().decode("latin-1")}])
+    assert statuses == [401]
+    assert updates == []